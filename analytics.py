@@ -0,0 +1,152 @@
+#Отчеты о прогрессе за произвольный период (/progress_graph 30, /progress_graph 365).
+#Логи пользователя за весь период читаются одним обращением к БД и раскладываются в плотные массивы
+#NumPy по дням (дни без записей - нули), дальше скользящие средние, серии и баланс считаются векторно.
+#numpy импортируется внутри функций, чтобы не замедлять старт бота (см. benchmarks/bench_startup.py)
+import calendar
+import datetime
+from typing import Optional
+
+DEFAULT_DAYS = 7
+MAX_DAYS = 366
+ROLLING_WINDOW = 7
+
+def parse_days(args: Optional[str]):
+    #"/progress_graph 30" -> 30; без аргумента - неделя. None, если аргумент некорректный
+    if not args or not args.strip():
+        return DEFAULT_DAYS
+    try:
+        days = int(args.strip())
+    except ValueError:
+        return None
+    return days if 2 <= days <= MAX_DAYS else None
+
+def grouping_for(days: int):
+    #Точек на графике должно быть немного: до месяца - по дням, до полугода - по неделям, дальше по месяцам
+    if days <= 31:
+        return 'day'
+    if days <= 183:
+        return 'week'
+    return 'month'
+
+def dense_logs(start: datetime.date, days: int, daily, monthly):
+    #(массив 3 x days (вода, калории, сожжено) с нулями в днях без записей, доля дня с записями по дням,
+    #маска дней, восстановленных из сжатых месяцев).
+    #Сжатые месяцы (logs_monthly) распределяются поровну по своим дням до первого сохранившегося дня: итог месяца
+    #делится на число этих дней, а не на длину месяца. Так же распределяется число дней с записями (logs_monthly.days),
+    #поэтому суммы и число дней с записями по месяцам остаются точными, а по дням - приблизительными
+    import numpy as np
+
+    values = np.zeros((3, days))
+    weights = np.zeros(days)
+    compacted = np.zeros(days, dtype=bool)
+    start64 = np.datetime64(start, 'D')
+    if daily:
+        index = (np.array([row[0] for row in daily], dtype='datetime64[D]') - start64).astype(np.int64)
+        values[:, index] = np.array([row[1:] for row in daily], dtype=float).T
+        weights[index] = (values[:, index] != 0).any(axis=0)
+
+    first_daily = datetime.date.fromisoformat(daily[0][0]) if daily else None
+    for month, logged_days, water, calories, burned in monthly:
+        year, month_number = map(int, month.split('-'))
+        month_start = datetime.date(year, month_number, 1)
+        #Сжатая часть месяца: с первого числа до первого сохранившегося дня (граничный месяц сжат не целиком)
+        span = calendar.monthrange(year, month_number)[1]
+        if first_daily is not None and month_start < first_daily:
+            span = min(span, (first_daily - month_start).days)
+        offset = (month_start - start).days
+        lo = max(offset, 0)
+        hi = min(offset + span, days)
+        if hi > lo:
+            values[:, lo:hi] += np.array([[water], [calories], [burned]]) / span
+            weights[lo:hi] += logged_days / span
+            compacted[lo:hi] = True
+    return values, weights, compacted
+
+def rolling_mean(values, window: int = ROLLING_WINDOW):
+    #Среднее за последние window дней через накопленные суммы; в начале периода - по имеющимся дням
+    import numpy as np
+
+    sums = np.concatenate(([0.0], np.cumsum(values)))
+    end = np.arange(1, len(values) + 1)
+    begin = np.maximum(end - window, 0)
+    return (sums[end] - sums[begin]) / (end - begin)
+
+def streaks(hit):
+    #(текущая, лучшая) серия дней подряд с достигнутой целью. Сегодняшний день еще не закончился,
+    #поэтому текущая серия не обрывается, если цель на сегодня пока не достигнута
+    import numpy as np
+
+    edges = np.diff(np.concatenate(([0], hit.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if not len(starts):
+        return 0, 0
+    lengths = ends - starts
+    current = int(lengths[-1]) if ends[-1] >= len(hit) - 1 else 0
+    return current, int(lengths.max())
+
+def aggregate(values, dates, grouping: str):
+    #Среднее за день по неделям (с понедельника) или месяцам. Возвращает (подписи, значения 3 x групп)
+    import numpy as np
+
+    if grouping == 'day':
+        return dates, values
+    if grouping == 'week':
+        keys = (dates.astype(np.int64) + 3) // 7 #1970-01-01 - четверг
+    else:
+        keys = dates.astype('datetime64[M]').astype(np.int64)
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    counts = np.diff(np.append(starts, len(keys)))
+    return dates[starts], np.add.reduceat(values, starts, axis=1) / counts
+
+def build_report(daily, monthly, start: datetime.date, days: int, water_goal: float, calorie_goal: float):
+    #Все, что нужно для графика и подписи к нему. Ряды - списки, чтобы отчет можно было передать
+    #в процесс построения графиков и использовать в ключе ChartCache
+    import numpy as np
+
+    values, weights, compacted = dense_logs(start, days, daily, monthly)
+    water, calories, burned = values
+    balance = calories - burned
+    dates = np.arange(np.datetime64(start, 'D'), np.datetime64(start, 'D') + days)
+
+    #Дни с записями: для сжатых месяцев - число из logs_monthly.days, а не все дни, по которым распределен итог.
+    #Средние - по дням с записями; серии - только по подробным дням (по сжатым не известно, выполнена ли цель)
+    days_logged = float(weights.sum())
+    exact = ~compacted
+    water_streak, water_best = streaks(exact & (water >= water_goal))
+    #Цель по калориям - не превысить норму в дни, когда еда записана
+    calorie_streak, calorie_best = streaks(exact & (calories > 0) & (balance <= calorie_goal))
+
+    grouping = grouping_for(days)
+    labels, grouped = aggregate(np.vstack((water, calories, burned, balance)), dates, grouping)
+    report = {
+        'grouping': grouping,
+        'dates': [str(label) for label in labels],
+        'water': np.round(grouped[0], 1).tolist(),
+        'calories': np.round(grouped[1], 1).tolist(),
+        'burned': np.round(grouped[2], 1).tolist(),
+        'balance': np.round(grouped[3], 1).tolist(),
+        'water_avg': None,
+        'balance_avg': None,
+        'days_logged': round(days_logged),
+        'water_mean': round(float(water.sum()) / days_logged, 1) if days_logged else 0.0,
+        'balance_mean': round(float(balance.sum()) / days_logged, 1) if days_logged else 0.0,
+        #Сумма отклонений от нормы калорий за дни с записями: > 0 - профицит, < 0 - дефицит
+        'balance_total': round(float(balance.sum()) - calorie_goal * days_logged, 1),
+        'water_streak': water_streak,
+        'water_best_streak': water_best,
+        'calorie_streak': calorie_streak,
+        'calorie_best_streak': calorie_best,
+    }
+    if grouping == 'day':
+        report['water_avg'] = np.round(rolling_mean(water), 1).tolist()
+        report['balance_avg'] = np.round(rolling_mean(balance), 1).tolist()
+    return report
+
+async def progress_report(db, user_id: int, days: int, water_goal: float, calorie_goal: float,
+                          today: Optional[datetime.date] = None):
+    #Отчет за последние days дней, включая сегодняшний (по UTC, как даты в logs)
+    today = today or datetime.datetime.now(datetime.timezone.utc).date()
+    start = today - datetime.timedelta(days=days - 1)
+    daily, monthly = await db.get_logs_range(user_id, start.isoformat(), today.isoformat())
+    return build_report(daily, monthly, start, days, water_goal, calorie_goal)
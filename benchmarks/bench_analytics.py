@@ -0,0 +1,66 @@
+#Время построения отчета /progress_graph 365 (без отрисовки графика): чтение логов за год одним запросом
+#и расчеты analytics на NumPy. История как в bench_logs: по умолчанию 3000 пользователей x 365 дней,
+#дни старше срока хранения сжаты в logs_monthly. Завершается с ошибкой, если p99 превышает бюджет.
+#Запуск из корня репозитория: python -m benchmarks.bench_analytics [--budget-ms 20] [--reports 500]
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+import analytics
+from benchmarks.bench_logs import fill_new
+from database import Database
+
+BUDGET_MS = 20
+
+async def measure(db: Database, users: int, days: int, reports: int):
+    rnd = random.Random(3)
+    for user_id in range(1, min(users, 50) + 1): #прогрев страничного кэша и импорт numpy
+        await analytics.progress_report(db, user_id, days, 2000, 2200)
+    timings = []
+    for _ in range(reports):
+        user_id = rnd.randint(1, users)
+        start = time.perf_counter()
+        await analytics.progress_report(db, user_id, days, 2000, 2200)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], timings[int(len(timings) * 0.99) - 1]
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=3000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--reports", type=int, default=500)
+    parser.add_argument("--retention-days", type=int, default=90)
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "analytics.db")
+        start = time.perf_counter()
+        await fill_new(path, args.users, args.days)
+        db = Database(path)
+        await db.compact_logs(args.retention_days)
+        await db.close()
+        print(f"Подготовка данных: {time.perf_counter() - start:.1f} с")
+
+        db = Database(path, readers=1)
+        await db.connect()
+        failed = False
+        for days in (7, 30, args.days):
+            p50, p99 = await measure(db, args.users, days, args.reports)
+            budget = f" (бюджет {args.budget_ms:.0f} мс)" if days == args.days else ""
+            print(f"Отчет за {days:3} дн.: p50 {p50:6.2f} мс  p99 {p99:6.2f} мс{budget}")
+            if days == args.days and p99 > args.budget_ms:
+                failed = True
+        await db.close()
+
+    if failed:
+        print("ОШИБКА: отчет за год не укладывается в бюджет")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+#Таблицы соревнований на 10 тыс. участников под непрерывным потоком /log_water: чтение /challenge <id>
+#из таблицы, обновляемой приращениями, против полного пересчета суммы по logs всех участников на каждый запрос.
+#Запуск из корня репозитория: python -m benchmarks.bench_challenges [--members 10000] [--challenges 3] [--reads 300]
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from challenges import ChallengeService
+from database import Database, _today
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return timings[len(timings) // 2], timings[int(len(timings) * 0.99) - 1]
+
+async def fill(path: str, members: int, challenges: int, days: int):
+    db = Database(path)
+    await db.create_tables()
+    await db.close()
+    rnd = random.Random(5)
+    today = datetime.date.fromisoformat(_today())
+    start = (today - datetime.timedelta(days=days - 1)).isoformat()
+    end = (today + datetime.timedelta(days=7)).isoformat()
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO logs (user_id, date, logged_water, logged_calories, burned_calories) VALUES (?, ?, ?, ?, ?)",
+        (
+            (user_id, (today - datetime.timedelta(days=day)).isoformat(), rnd.randrange(0, 3000, 250), 0, rnd.uniform(0, 800))
+            for user_id in range(1, members + 1) for day in range(days)
+        )
+    )
+    for challenge_id in range(1, challenges + 1):
+        conn.execute(
+            "INSERT INTO challenges (id, name, metric, owner_id, start_date, end_date, created_at) VALUES (?, ?, ?, 1, ?, ?, 0)",
+            (challenge_id, f"Команда {challenge_id}", 'water' if challenge_id % 2 else 'burned', start, end)
+        )
+        conn.executemany(
+            "INSERT INTO challenge_members (challenge_id, user_id, name, joined_at) VALUES (?, ?, ?, 0)",
+            ((challenge_id, user_id, f"Участник {user_id}") for user_id in range(1, members + 1))
+        )
+    conn.commit()
+    conn.close()
+    return start, end
+
+async def log_traffic(db: Database, service: ChallengeService, members: int, stop: asyncio.Event, record_timings):
+    #Поток записей воды и тренировок, как от обработчиков /log_water и /log_workout
+    rnd = random.Random(6)
+    count = 0
+    while not stop.is_set():
+        user_id = rnd.randint(1, members)
+        if rnd.random() < 0.7:
+            amount = rnd.randrange(100, 600, 50)
+            await db.log_water(user_id, amount)
+            field = 'logged_water'
+        else:
+            amount = rnd.uniform(50, 400)
+            await db.log_workout(user_id, 'бег', 30, amount)
+            field = 'burned_calories'
+        start = time.perf_counter()
+        service.record(user_id, field, amount)
+        record_timings.append((time.perf_counter() - start) * 1e6)
+        count += 1
+    return count
+
+async def run(db: Database, service: ChallengeService, read, members: int, challenges: int, reads: int):
+    stop = asyncio.Event()
+    record_timings = []
+    traffic = asyncio.create_task(log_traffic(db, service, members, stop, record_timings))
+    rnd = random.Random(7)
+    timings = []
+    started = time.perf_counter()
+    for _ in range(reads):
+        challenge_id = rnd.randint(1, challenges)
+        start = time.perf_counter()
+        await read(challenge_id, rnd.randint(1, members))
+        timings.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.001)
+    stop.set()
+    logs = await traffic
+    return percentiles(timings), logs / (time.perf_counter() - started), record_timings
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, default=10000)
+    parser.add_argument("--challenges", type=int, default=3)
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--reads", type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "challenges.db")
+        start_date, end_date = await fill(path, args.members, args.challenges, args.days)
+        db = Database(path)
+        await db.connect()
+
+        service = ChallengeService(db)
+        start = time.perf_counter()
+        await service.load()
+        print(f"Построение {args.challenges} таблиц по {args.members} участников из logs за {args.days} дн.: "
+              f"{(time.perf_counter() - start) * 1000:.0f} мс")
+
+        async def incremental(challenge_id, user_id):
+            await service.standings(challenge_id, user_id)
+
+        async def full_scan(challenge_id, user_id):
+            challenge = await service.get(challenge_id)
+            field = 'logged_water' if challenge['metric'] == 'water' else 'burned_calories'
+            rows = await db.get_challenge_scores(challenge_id, field, start_date, end_date)
+            ranked = sorted(rows, key=lambda row: (-row[2], row[0]))
+            top = ranked[:10]
+            place = next(place for place, row in enumerate(ranked, 1) if row[0] == user_id)
+            return top, place
+
+        for title, read in (("приращения", incremental), ("пересчет по logs", full_scan)):
+            (p50, p99), rate, record_timings = await run(db, service, read, args.members, args.challenges, args.reads)
+            print(f"{title:17} таблица: p50 {p50:7.3f} мс  p99 {p99:7.3f} мс   поток записей {rate:6.0f}/с")
+        record_p50, record_p99 = percentiles(record_timings)
+        print(f"Обновление таблиц на запись (record): p50 {record_p50:.1f} мкс  p99 {record_p99:.1f} мкс")
+        await db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
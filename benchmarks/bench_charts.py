@@ -0,0 +1,65 @@
+#p99 задержки "легких" обработчиков (как /log_water), пока параллельно строятся графики /progress_graph:
+#построение прямо в цикле событий против пула процессов ChartRenderer.
+#Запуск из корня репозитория: python -m benchmarks.bench_charts [--charts 40] [--workers 2]
+import argparse
+import asyncio
+import statistics
+import time
+
+from charts import ChartRenderer, render_weekly_chart
+
+DATES = [f"2024-01-{day:02d}" for day in range(1, 9)]
+CHART_ARGS = (DATES, [1500, 2000, 1800, 2500, 2100, 900, 2600, 2300], 2500,
+              [2100, 2400, 1900, 2800, 2200, 2000, 2500, 2300], [300, 0, 450, 200, 0, 600, 100, 250], 2300)
+
+async def light_traffic(stop: asyncio.Event, interval: float):
+    #Сообщение приходит каждые interval секунд; задержка - от прихода до завершения обработки
+    latencies = []
+    loop = asyncio.get_running_loop()
+    next_at = loop.time()
+    while not stop.is_set():
+        next_at += interval
+        await asyncio.sleep(max(0, next_at - loop.time()))
+        await asyncio.sleep(0) #сам обработчик почти ничего не делает
+        latencies.append((loop.time() - next_at) * 1000)
+    return latencies
+
+async def run(render, charts: int, concurrency: int, interval: float):
+    stop = asyncio.Event()
+    traffic = asyncio.create_task(light_traffic(stop, interval))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_chart():
+        async with semaphore:
+            await render()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_chart() for _ in range(charts)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    latencies = sorted(await traffic)
+    return elapsed, statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--charts", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--interval-ms", type=float, default=5)
+    args = parser.parse_args()
+    interval = args.interval_ms / 1000
+
+    async def inline():
+        render_weekly_chart(*CHART_ARGS)
+        await asyncio.sleep(0)
+
+    renderer = ChartRenderer(workers=args.workers, max_queue=args.charts)
+    await renderer.start()
+
+    for title, render in (("в цикле событий", inline), ("пул процессов", lambda: renderer.render_weekly_chart(*CHART_ARGS))):
+        elapsed, median, p99 = await run(render, args.charts, args.workers, interval)
+        print(f"{title:16} графиков: {args.charts / elapsed:5.1f}/с, задержка остальных сообщений: "
+              f"медиана {median:7.1f} мс, p99 {p99:7.1f} мс")
+    await renderer.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
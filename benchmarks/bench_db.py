@@ -0,0 +1,86 @@
+#Сравнение пропускной способности: соединение на каждый вызов против пула соединений.
+#Одно "сообщение" = то, что делает /log_water: get_user + increment_water.
+#Запуск из корня репозитория: python -m benchmarks.bench_db [--messages 2000] [--concurrency 20]
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import aiosqlite
+
+from database import Database
+
+class PerCallDatabase(Database):
+    #Старое поведение: новый aiosqlite.connect() на каждый вызов
+    async def get_user(self, user_id: int):
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)) as cursor:
+                user = await cursor.fetchone()
+                if user is not None:
+                    columns = [column[0] for column in cursor.description]
+                    return dict(zip(columns, user))
+        return None
+
+    async def increment_water(self, user_id: int, delta: int, date=None):
+        async with aiosqlite.connect(self.db_path) as db:
+            async with db.execute(
+                """
+                INSERT INTO logs (user_id, date, logged_water) VALUES (?, COALESCE(?, date('now')), ?)
+                ON CONFLICT(user_id, date) DO UPDATE SET logged_water = logged_water + excluded.logged_water
+                RETURNING logged_water, logged_calories, burned_calories
+                """,
+                (user_id, date, delta)
+            ) as cursor:
+                result = await cursor.fetchone()
+            await db.commit()
+            return result
+
+async def prepare(path: str, users: int):
+    db = Database(path)
+    await db.create_tables()
+    for user_id in range(users):
+        await db.save_user(user_id, {'weight': 70, 'height': 175, 'age': 30, 'gender': 'М',
+                                     'activity': 30, 'city': 'Москва', 'water_goal': 2600, 'calorie_goal': 2400})
+    await db.close()
+
+async def run(db: Database, messages: int, concurrency: int, users: int):
+    queue = asyncio.Queue()
+    for i in range(messages):
+        queue.put_nowait(i % users)
+
+    async def worker():
+        while not queue.empty():
+            user_id = queue.get_nowait()
+            await db.get_user(user_id)
+            await db.increment_water(user_id, 250)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return messages / (time.perf_counter() - start)
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        await prepare(path, args.users)
+
+        legacy = PerCallDatabase(path)
+        legacy_rate = await run(legacy, args.messages, args.concurrency, args.users)
+
+        pooled = Database(path)
+        await pooled.connect()
+        pooled_rate = await run(pooled, args.messages, args.concurrency, args.users)
+        await pooled.close()
+
+    print(f"Соединение на вызов: {legacy_rate:8.1f} сообщений/с")
+    print(f"Пул соединений:      {pooled_rate:8.1f} сообщений/с")
+    print(f"Ускорение:           {pooled_rate / legacy_rate:8.2f}x")
+
+if __name__ == "__main__":
+    asyncio.run(main())
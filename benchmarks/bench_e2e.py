@@ -0,0 +1,272 @@
+#Сквозной нагрузочный тест: настоящий Dispatcher из bot.py (create_bot, handlers.router, все middleware)
+#в режиме опроса против заглушки Bot API (fake_telegram) и заглушек погоды и Open Food Facts (fake_upstreams)
+#с задаваемой задержкой. Виртуальные пользователи проходят анкету /set_profile (Form), затем выполняют смешанный
+#поток команд: /log_water, /log_food в один и в два шага, /log_workout, /check_progress, /progress_graph.
+#Задержка шага - от отправки обновления до последнего ответа бота в чат.
+#Отчет: обновлений в секунду, p50/p95/p99 по шагам, обращения к SQLite и внешним API; сохраняется в JSON,
+#--compare печатает изменения относительно прошлого запуска.
+#Запуск из корня репозитория: python -m benchmarks.bench_e2e [--users 200] [--actions 20] [--api-latency-ms 50]
+#    [--output e2e.json] [--compare e2e_прошлый.json]
+#Без --output результат пишется в benchmarks/results/bench_e2e_<время>.json (каталог в .gitignore)
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from benchmarks.fake_telegram import FakeTelegram, callback_update, message_update
+from benchmarks.fake_upstreams import FakeUpstreams
+
+CITIES = ('Москва', 'Санкт-Петербург', 'Казань', 'Сочи', 'Новосибирск', 'Екатеринбург', 'Калининград', 'Владивосток')
+PRODUCTS = ('банан', 'яблоко', 'гречка', 'курица', 'творог', 'овсянка', 'рис', 'хлеб', 'сыр', 'йогурт',
+            'огурец', 'помидор', 'картофель', 'макароны', 'говядина', 'лосось', 'яйцо', 'молоко', 'кефир', 'орехи')
+WORKOUTS = ('бег', 'ходьба', 'велосипед', 'плавание', 'йога', 'силовая', 'бег быстро', 'скандинавская ходьба')
+#Доля действий после анкеты
+ACTIONS = {
+    'log_water': 0.40,
+    'log_food': 0.15, #два шага: поиск продукта и ввод граммовки
+    'log_food_meal': 0.10, #несколько продуктов с граммовкой одной командой
+    'log_workout': 0.10,
+    'check_progress': 0.15,
+    'progress_graph': 0.10,
+}
+PERCENTILES = (50, 95, 99)
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+def percentile(values, p: int):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class VirtualUser:
+    #Один пользователь: шаги по очереди, следующий - после всех ответов бота на предыдущий
+    def __init__(self, user_id: int, fake: FakeTelegram, rnd: random.Random, timings, errors,
+                 think: float = 0.0, timeout: float = 60):
+        self.user_id = user_id
+        self.fake = fake
+        self.rnd = rnd
+        self.timings = timings
+        self.errors = errors
+        self.think = think
+        self.timeout = timeout
+        self.expected = 0
+        self.updates = 0
+
+    async def step(self, name: str, update: dict, replies: int = 1):
+        self.expected += replies
+        self.updates += 1
+        start = time.perf_counter()
+        self.fake.updates.put_nowait(update)
+        try:
+            await self.fake.wait_chat(self.user_id, self.expected, timeout=self.timeout)
+        except TimeoutError:
+            #Ожидаемое число ответов не сбрасываем: опоздавший ответ дождется следующий шаг, а не засчитается ему раньше срока
+            self.errors[name] += 1
+            return
+        self.timings.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+        if self.think:
+            await asyncio.sleep(self.rnd.expovariate(1 / self.think))
+
+    async def say(self, name: str, text: str, replies: int = 1):
+        await self.step(name, message_update(self.user_id, text), replies)
+
+    async def onboarding(self):
+        await self.say('set_profile', '/set_profile')
+        await self.say('form_weight', str(self.rnd.randint(50, 110)))
+        await self.say('form_height', str(self.rnd.randint(150, 200)))
+        await self.say('form_age', str(self.rnd.randint(18, 70)))
+        await self.step('form_gender', callback_update(self.user_id, self.rnd.choice('МЖ')))
+        await self.say('form_activity', str(self.rnd.randrange(15, 150, 15)))
+        await self.say('form_city', self.rnd.choice(CITIES))
+        await self.say('form_calories', 'нет')
+
+    async def action(self, name: str):
+        rnd = self.rnd
+        if name == 'log_water':
+            await self.say(name, f"/log_water {rnd.randrange(100, 600, 50)}")
+        elif name == 'log_food':
+            #"Получаю данные о продукте..." и вопрос о граммовке, затем запись
+            await self.say(name, f"/log_food {rnd.choice(PRODUCTS)}", replies=2)
+            await self.say('log_food_grams', str(rnd.randrange(50, 400, 10)))
+        elif name == 'log_food_meal':
+            items = rnd.sample(PRODUCTS, rnd.randint(2, 4))
+            await self.say(name, "/log_food " + ", ".join(f"{item} {rnd.randrange(50, 300, 10)}" for item in items), replies=2)
+        elif name == 'log_workout':
+            await self.say(name, f"/log_workout {rnd.choice(WORKOUTS)} {rnd.randrange(15, 90, 5)}")
+        elif name == 'check_progress':
+            await self.say(name, '/check_progress')
+        elif name == 'progress_graph':
+            await self.say(name, rnd.choice(('/progress_graph', '/progress_graph 30')))
+
+    async def run(self, actions: int):
+        await self.onboarding()
+        names, weights = zip(*ACTIONS.items())
+        for name in self.rnd.choices(names, weights, k=actions):
+            await self.action(name)
+
+async def traffic(fake: FakeTelegram, first_id: int, users: int, actions: int, seed: int, think: float, timeout: float):
+    timings = {}
+    errors = Counter()
+    rnd = random.Random(seed)
+    virtual_users = [
+        VirtualUser(user_id, fake, random.Random(rnd.random()), timings, errors, think, timeout)
+        for user_id in range(first_id, first_id + users)
+    ]
+    start = time.perf_counter()
+    await asyncio.gather(*(user.run(actions) for user in virtual_users))
+    elapsed = time.perf_counter() - start
+    return timings, errors, sum(user.updates for user in virtual_users), elapsed
+
+def dependency_counts(summary):
+    #Число обращений к БД (транзакций и чтений из пула) и к внешним API по гистограммам metrics.track
+    counts = {}
+    for name, histogram in summary['histograms'].items():
+        if name.startswith('bot_dependency_seconds{'):
+            counts[name[len('bot_dependency_seconds'):]] = histogram['count']
+    return counts
+
+def build_report(args, timings, errors, updates, elapsed, summary, fake, upstreams, commits_before: int = 0):
+    dependencies = dependency_counts(summary)
+    db_calls = dependencies.get('{kind="db"}', 0)
+    return {
+        'started_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'args': vars(args),
+        'updates': updates,
+        'seconds': round(elapsed, 3),
+        'updates_per_second': round(updates / elapsed, 1),
+        'errors': dict(errors),
+        'steps': {
+            name: {
+                'count': len(values),
+                'mean_ms': round(sum(values) / len(values), 2),
+                **{f"p{p}_ms": round(percentile(values, p), 2) for p in PERCENTILES},
+            }
+            for name, values in sorted(timings.items())
+        },
+        'sqlite': {
+            'calls': db_calls,
+            'calls_per_update': round(db_calls / updates, 2) if updates else 0,
+            'commits': summary['gauges'].get('bot_db_commits', 0) - commits_before, #счетчик Database.commits не сбрасывается после прогрева
+        },
+        'http': {
+            'upstream_requests': dict(upstreams.calls),
+            'dependencies': {name: count for name, count in dependencies.items() if 'kind="http"' in name},
+        },
+        'telegram_calls': dict(fake.calls),
+        'caches': {name: value for name, value in summary['gauges'].items() if 'hit' in name or 'miss' in name},
+    }
+
+def print_report(report, previous=None):
+    print(f"Обновлений: {report['updates']} за {report['seconds']:.1f} с - {report['updates_per_second']:.1f} обновлений/с"
+          + (f"   (было {previous['updates_per_second']:.1f})" if previous else ""))
+    print(f"{'шаг':16} {'n':>6} " + " ".join(f"{f'p{p} мс':>9}" for p in PERCENTILES)
+          + ("   изменение p50/p99" if previous else ""))
+    for name, step in report['steps'].items():
+        line = f"{name:16} {step['count']:6} " + " ".join(f"{step[f'p{p}_ms']:9.1f}" for p in PERCENTILES)
+        before = previous['steps'].get(name) if previous else None
+        if before:
+            line += "   " + " ".join(f"{(step[key] - before[key]) / before[key] * 100 if before[key] else 0:+6.0f}%"
+                                     for key in ('p50_ms', 'p99_ms'))
+        print(line)
+    sqlite = report['sqlite']
+    print(f"SQLite: {sqlite['calls']} обращений ({sqlite['calls_per_update']} на обновление), коммитов {sqlite['commits']}")
+    print(f"Внешние API: {report['http']['upstream_requests']}")
+    print(f"Bot API: {report['telegram_calls']}")
+    if report['errors']:
+        print(f"Без ответа (таймаут): {report['errors']}")
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200, help="одновременных виртуальных пользователей")
+    parser.add_argument("--actions", type=int, default=20, help="действий каждого пользователя после анкеты")
+    parser.add_argument("--warmup-users", type=int, default=5)
+    parser.add_argument("--think-ms", type=float, default=0, help="средняя пауза пользователя между шагами")
+    parser.add_argument("--api-latency-ms", type=float, default=50, help="задержка заглушек погоды и продуктов")
+    parser.add_argument("--telegram-latency-ms", type=float, default=0, help="задержка заглушки Bot API")
+    parser.add_argument("--timeout", type=float, default=60, help="сек ожидания ответа на шаг")
+    parser.add_argument("--write-behind", action="store_true", help="групповая запись логов (WRITE_BEHIND=1)")
+    parser.add_argument("--telegram-limits", action="store_true", help="оставить лимиты отправки Telegram (SEND_*)")
+    parser.add_argument("--chart-workers", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="файл JSON с результатами (по умолчанию benchmarks/results/bench_e2e_<время>.json)")
+    parser.add_argument("--compare", help="JSON прошлого запуска для сравнения")
+    args = parser.parse_args()
+
+    fake = FakeTelegram(latency=args.telegram_latency_ms / 1000)
+    upstreams = FakeUpstreams(latency=args.api_latency_ms / 1000)
+    api_url = await fake.start()
+    await upstreams.start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        #Настройки читаются config.py при импорте бота, поэтому окружение задается до импорта
+        os.environ.update(
+            BOT_TOKEN="123456:benchmark",
+            WEATHER_API_KEY="benchmark",
+            TELEGRAM_API_URL=api_url,
+            WEATHER_API_URL=upstreams.weather_url,
+            WEATHER_FORECAST_URL=upstreams.forecast_url,
+            FOOD_API_URL=upstreams.food_url,
+            DB_PATH=os.path.join(tmp, "users.db"),
+            FOOD_INDEX_PATH=os.path.join(tmp, "foods.db"), #локальной базы продуктов нет - поиск через API
+            FSM_STORAGE="sqlite",
+            CHART_WORKERS=str(args.chart_workers),
+            CHART_QUEUE_LIMIT=str(max(8, args.users)),
+            WRITE_BEHIND="1" if args.write_behind else "0",
+            RATE_LIMIT="0", #виртуальные пользователи шлют команды быстрее живых
+            REMINDERS="0",
+            METRICS_PORT="0",
+        )
+        if not args.telegram_limits:
+            os.environ.update(SEND_GLOBAL_RATE="1000000", SEND_CHAT_RATE="1000000", SEND_CHAT_BURST="1000000")
+        from bot import create_bot
+        from metrics import metrics
+
+        bot, dp = await create_bot(jobs=False)
+        polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False))
+        try:
+            #Прогрев: процессы графиков, соединения к заглушкам, кэши погоды
+            await traffic(fake, 1_000_000, args.warmup_users, len(ACTIONS), args.seed + 1, 0, args.timeout)
+            metrics.clear()
+            upstreams.calls.clear()
+            fake.calls.clear()
+            commits_before = metrics.summary()['gauges'].get('bot_db_commits', 0)
+
+            timings, errors, updates, elapsed = await traffic(fake, 1, args.users, args.actions, args.seed,
+                                                              args.think_ms / 1000, args.timeout)
+            report = build_report(args, timings, errors, updates, elapsed, metrics.summary(), fake, upstreams,
+                                  commits_before)
+        finally:
+            await dp.stop_polling()
+            await polling
+
+    await fake.close()
+    await upstreams.close()
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            previous = json.load(file)
+    print_report(report, previous)
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"bench_e2e_{datetime.datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {output}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+#Справочник MET и пересчет целей (energy_model.py): время загрузки справочника, поиск тренировки
+#(точное название, с интенсивностью, с опечаткой; без кэша и с кэшем) и пересчет целей для 100 тыс. профилей
+#одним проходом - в памяти и вместе с чтением и записью users.
+#Запуск из корня репозитория: python -m benchmarks.bench_energy [--users 100000] [--formula mifflin]
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from database import Database
+from energy_model import BMR_FORMULAS, Compendium, EnergyModel, recompute_all
+
+QUERIES = {
+    'точное': ('бег', 'йога', 'плавание', 'скандинавская ходьба', 'running', 'гантели'),
+    'с интенсивностью': ('бег быстро', 'легкая йога', 'велосипед интенсивно', 'медленная ходьба'),
+    'с опечаткой': ('басктбол', 'плаванье брассом', 'скондинавская ходьба', 'велосепед'),
+}
+
+def per_call_us(func, args, repeat: int):
+    start = time.perf_counter()
+    for i in range(repeat):
+        func(args[i % len(args)])
+    return (time.perf_counter() - start) / repeat * 1e6
+
+def profiles(users: int):
+    rnd = random.Random(8)
+    for user_id in range(1, users + 1):
+        yield {
+            'user_id': user_id,
+            'weight': rnd.randint(45, 120),
+            'height': rnd.randint(150, 200),
+            'age': rnd.randint(16, 80),
+            'gender': rnd.choice('МЖ'),
+            'activity': rnd.randrange(0, 180, 15),
+            'city': f"Город {rnd.randint(1, 2000)}",
+            'water_goal': 2500,
+            'calorie_goal': 2200.0,
+            'calorie_goal_custom': int(rnd.random() < 0.1),
+        }
+
+async def fill(path: str, users: int):
+    db = Database(path)
+    await db.create_tables()
+    await db.close()
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO users (user_id, weight, height, age, gender, activity, city, water_goal, calorie_goal, calorie_goal_custom) "
+        "VALUES (:user_id, :weight, :height, :age, :gender, :activity, :city, :water_goal, :calorie_goal, :calorie_goal_custom)",
+        profiles(users)
+    )
+    conn.commit()
+    conn.close()
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--formula", choices=sorted(BMR_FORMULAS), default='mifflin')
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    compendium = Compendium()
+    print(f"Загрузка справочника: {len(compendium)} видов, {len(compendium.aliases)} названий, "
+          f"{(time.perf_counter() - start) * 1000:.1f} мс")
+    for title, queries in QUERIES.items():
+        cold = per_call_us(compendium._match, queries, max(1, args.repeat // 10))
+        cached = per_call_us(compendium.match, queries, args.repeat)
+        print(f"Поиск {title:17} без кэша {cold:7.1f} мкс   с кэшем {cached:5.2f} мкс")
+
+    model = EnergyModel(args.formula)
+    users = list(profiles(args.users))
+    temperatures = {f"Город {i}": random.Random(i).uniform(-20, 35) for i in range(1, 2001)}
+    start = time.perf_counter()
+    changed = sum(1 for _ in model.recompute_goals(users, temperatures))
+    print(f"Пересчет {args.users} профилей в памяти: {(time.perf_counter() - start) * 1000:.0f} мс, изменилось {changed}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "energy.db")
+        await fill(path, args.users)
+        db = Database(path, readers=1)
+        await db.connect()
+        start = time.perf_counter()
+        total, changed = await recompute_all(db, model, temperatures)
+        print(f"Пересчет {total} профилей с чтением и записью users: {time.perf_counter() - start:.2f} с, "
+              f"записано {changed} (одна транзакция, коммитов: {db.commits})")
+        await db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+#Скорость выгрузки и загрузки истории (export.py) на большой таблице logs (по умолчанию 10 млн строк):
+#строк в секунду, размер файла и память процесса для каждого формата.
+#Запуск из корня репозитория: python -m benchmarks.bench_export [--rows 10000000] [--formats csv jsonl columnar]
+import argparse
+import asyncio
+import os
+import resource
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.bench_logs import rows as log_rows
+from database import Database
+from export import EXTENSIONS, FORMATS, export_history, import_history
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+async def fill(path: str, users: int, days: int):
+    db = Database(path)
+    await db.create_tables()
+    await db.close()
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO users (user_id, weight, height, age, gender, activity, city, water_goal, calorie_goal) "
+        "VALUES (?, 70, 175, 30, 'М', 30, 'Moscow', 2500, 2300)",
+        ((user_id,) for user_id in range(1, users + 1))
+    )
+    conn.executemany(
+        "INSERT INTO logs (user_id, date, logged_water, logged_calories, burned_calories) VALUES (?, ?, ?, ?, ?)",
+        log_rows(users, days)
+    )
+    conn.commit()
+    conn.close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--formats", nargs='+', choices=FORMATS, default=list(FORMATS))
+    args = parser.parse_args()
+    users = max(1, args.rows // args.days)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source.db")
+        start = time.perf_counter()
+        asyncio.run(fill(source, users, args.days))
+        total = users * args.days
+        print(f"Подготовка: {total} строк logs ({users} пользователей), {os.path.getsize(source) / 2**20:.0f} МБ, "
+              f"{time.perf_counter() - start:.0f} с; RSS {rss_mb():.0f} МБ")
+
+        for fmt in args.formats:
+            path = os.path.join(tmp, f"export{EXTENSIONS[fmt]}")
+            start = time.perf_counter()
+            exported = export_history(source, path, fmt)
+            export_elapsed = time.perf_counter() - start
+
+            target = os.path.join(tmp, f"target_{fmt}.db")
+            start = time.perf_counter()
+            imported = sum(import_history(target, path).values())
+            import_elapsed = time.perf_counter() - start
+
+            print(f"{fmt:9} выгрузка {exported / export_elapsed:9.0f} строк/с, файл {os.path.getsize(path) / 2**20:5.0f} МБ; "
+                  f"загрузка {imported / import_elapsed:9.0f} строк/с; пик RSS {rss_mb():.0f} МБ")
+            os.remove(path)
+            os.remove(target)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#Скорость импорта выгрузки и задержка поиска в локальной базе продуктов.
+#Генерирует синтетическую выгрузку в формате Open Food Facts CSV (табуляция) на --rows строк.
+#Запуск из корня репозитория: python -m benchmarks.bench_food_index [--rows 2000000] [--queries 2000]
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from food_index import FoodIndex, import_dump
+
+BASES = ['молоко', 'кефир', 'йогурт', 'сыр', 'творог', 'хлеб', 'банан', 'яблоко', 'гречка', 'рис',
+         'курица', 'говядина', 'овсянка', 'печенье', 'шоколад', 'сок', 'чай', 'кофе', 'milk', 'yogurt',
+         'cheese', 'bread', 'apple', 'banana', 'chicken', 'rice', 'pasta', 'cookies', 'juice', 'chocolate']
+TRAITS = ['классический', 'деревенский', 'органический', 'легкий', 'домашний', 'light', 'classic',
+          'organic', 'premium', 'original', 'bio', 'fit', 'extra', 'mini', 'family']
+
+def product_name(i: int):
+    rnd = random.Random(i)
+    return f"{rnd.choice(BASES)} {rnd.choice(TRAITS)} {rnd.choice(TRAITS)} {i}"
+
+def write_dump(path: str, rows: int):
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write("code\tproduct_name\tenergy-kcal_100g\tenergy_100g\n")
+        for i in range(rows):
+            file.write(f"{i}\t{product_name(i)}\t{random.uniform(20, 600):.1f}\t\n")
+
+async def measure(index: FoodIndex, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        await index.search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dump_path = os.path.join(tmp, "products.csv")
+        db_path = os.path.join(tmp, "foods.db")
+        write_dump(dump_path, args.rows)
+
+        read, imported, elapsed = import_dump(dump_path, db_path)
+        print(f"Импорт: {read} строк за {elapsed:.1f} с ({read / elapsed:.0f} строк/с), "
+              f"размер базы {os.path.getsize(db_path) / 2**20:.0f} МБ")
+
+        index = FoodIndex(db_path)
+        await index.connect()
+        rnd = random.Random(0)
+        exact = [product_name(rnd.randrange(args.rows)) for _ in range(args.queries)]
+        fuzzy = [f"{rnd.choice(BASES)} {rnd.choice(TRAITS)}" for _ in range(args.queries)]
+        for title, queries in (("точное совпадение", exact), ("триграммный поиск", fuzzy)):
+            median, p99 = await measure(index, queries)
+            print(f"{title:18} медиана {median:7.3f} мс, p99 {p99:7.3f} мс")
+        await index.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
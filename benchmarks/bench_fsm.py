@@ -0,0 +1,87 @@
+#Накладные расходы хранилища FSM на один шаг анкеты профиля: MemoryStorage против SQLiteStorage
+#со сквозной записью и с отложенной (write-back). Шаг повторяет то, что делают aiogram и handlers.py:
+#get_state в промежуточном слое, update_data с ответом пользователя и set_state следующего вопроса.
+#Запуск из корня репозитория: python -m benchmarks.bench_fsm [--users 1000] [--concurrency 50]
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from database import Database
+from storage import SQLiteStorage
+
+STEPS = (
+    ('Form:height', 'weight', 70),
+    ('Form:age', 'height', 175),
+    ('Form:gender', 'age', 30),
+    ('Form:activity', 'gender', 'М'),
+    ('Form:city', 'activity', 30),
+    ('Form:calories', 'city', 'Москва'),
+    (None, 'calorie_goal', 2400),
+)
+
+async def wizard(storage, user_id: int, timings: list):
+    key = StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+    await storage.set_state(key, 'Form:weight')
+    for next_state, field, value in STEPS:
+        start = time.perf_counter()
+        await storage.get_state(key)
+        await storage.update_data(key, {field: value})
+        if next_state is None:
+            await storage.get_data(key)
+            await storage.set_state(key, None)
+            await storage.set_data(key, {})
+        else:
+            await storage.set_state(key, next_state)
+        timings.append(time.perf_counter() - start)
+
+async def run(storage, users: int, concurrency: int):
+    queue = asyncio.Queue()
+    for user_id in range(1, users + 1):
+        queue.put_nowait(user_id)
+    timings = []
+
+    async def worker():
+        while not queue.empty():
+            await wizard(storage, queue.get_nowait(), timings)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    timings.sort()
+    return (
+        len(timings) / elapsed,
+        statistics.mean(timings) * 1e6,
+        timings[int(len(timings) * 0.99)] * 1e6,
+    )
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        modes = [("MemoryStorage", None, None)]
+        for name, write_back in (("SQLite, сквозная", False), ("SQLite, write-back", True)):
+            db = Database(os.path.join(tmp, f"{write_back}.db"))
+            await db.connect()
+            modes.append((name, db, write_back))
+
+        for name, db, write_back in modes:
+            storage = MemoryStorage() if db is None else SQLiteStorage(db, write_back=write_back)
+            commits_before = db.commits if db is not None else 0
+            steps_rate, mean_us, p99_us = await run(storage, args.users, args.concurrency)
+            await storage.close()
+            commits = db.commits - commits_before if db is not None else 0
+            print(f"{name:20} {steps_rate:9.1f} шагов/с  среднее {mean_us:8.1f} мкс  p99 {p99_us:8.1f} мкс  коммитов: {commits}")
+            if db is not None:
+                await db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
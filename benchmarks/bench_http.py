@@ -0,0 +1,70 @@
+#Задержка последовательных запросов /log_food к локальной заглушке Open Food Facts:
+#новая ClientSession на каждый вызов (как было раньше) против общей сессии из http_client.
+#Запуск из корня репозитория: python -m benchmarks.bench_http [--requests 300] [--latency-ms 0]
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import aiohttp
+from aiohttp import web
+
+PRODUCT = {'products': [{'product_name': 'Банан', 'nutriments': {'energy-kcal_100g': 89}}]}
+
+async def start_stub(latency: float):
+    async def search(request):
+        if latency:
+            await asyncio.sleep(latency)
+        return web.json_response(PRODUCT)
+
+    app = web.Application()
+    app.router.add_get('/cgi/search.pl', search)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/cgi/search.pl"
+
+async def per_call_lookup(url: str, product_name: str):
+    params = {'action': 'process', 'search_terms': product_name, 'json': 'true'}
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url, params=params) as response:
+            return await response.json()
+
+async def measure(lookup, requests: int):
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        await lookup('банан')
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return statistics.mean(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    runner, url = await start_stub(args.latency_ms / 1000)
+    os.environ["FOOD_API_URL"] = url
+    os.environ.setdefault("BOT_TOKEN", "benchmark")
+    os.environ.setdefault("WEATHER_API_KEY", "benchmark")
+    import utils
+    import http_client
+
+    try:
+        per_call = await measure(lambda name: per_call_lookup(url, name), args.requests)
+        await http_client.start_session()
+        shared = await measure(utils.get_food_info, args.requests)
+        await http_client.close_session()
+    finally:
+        await runner.cleanup()
+
+    print(f"Сессия на вызов: среднее {per_call[0]:6.2f} мс, p99 {per_call[1]:6.2f} мс")
+    print(f"Общая сессия:    среднее {shared[0]:6.2f} мс, p99 {shared[1]:6.2f} мс")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+#Задержка get_today_logs/get_weekly_logs на большой истории логов (по умолчанию 3000 пользователей x 365 дней,
+#около 1.1 млн строк): прежняя схема (rowid-таблица + уникальный индекс), новая (WITHOUT ROWID по (user_id, date))
+#и новая после сжатия старых дней в logs_monthly.
+#Запуск из корня репозитория: python -m benchmarks.bench_logs [--users 3000] [--days 365] [--queries 3000]
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from database import Database, _today
+
+OLD_SCHEMA = """
+CREATE TABLE users (user_id INTEGER PRIMARY KEY, weight INTEGER, height INTEGER, age INTEGER, gender TEXT,
+                    activity INTEGER, city TEXT, water_goal INTEGER, calorie_goal REAL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE logs (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, logged_water INTEGER DEFAULT 0,
+                   logged_calories REAL DEFAULT 0, burned_calories REAL DEFAULT 0, date DATE DEFAULT CURRENT_DATE,
+                   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+CREATE UNIQUE INDEX idx_logs_user_date ON logs (user_id, date);
+"""
+
+def rows(users: int, days: int):
+    today = datetime.date.fromisoformat(_today())
+    rnd = random.Random(1)
+    #По дням, а внутри дня по пользователям - как строки появляются в жизни
+    for day in range(days - 1, -1, -1):
+        date = (today - datetime.timedelta(days=day)).isoformat()
+        for user_id in range(1, users + 1):
+            yield user_id, date, rnd.randrange(0, 3000, 250), rnd.uniform(0, 3000), rnd.uniform(0, 800)
+
+def fill_old(path: str, users: int, days: int):
+    conn = sqlite3.connect(path)
+    conn.executescript(OLD_SCHEMA)
+    conn.executemany(
+        "INSERT INTO logs (user_id, date, logged_water, logged_calories, burned_calories) VALUES (?, ?, ?, ?, ?)",
+        rows(users, days)
+    )
+    conn.commit()
+    conn.close()
+
+async def fill_new(path: str, users: int, days: int):
+    db = Database(path)
+    await db.create_tables()
+    await db.close()
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO logs (user_id, date, logged_water, logged_calories, burned_calories) VALUES (?, ?, ?, ?, ?)",
+        rows(users, days)
+    )
+    conn.commit()
+    conn.close()
+
+async def measure(db: Database, method, users: int, queries: int):
+    rnd = random.Random(2)
+    for user_id in range(1, min(users, 200) + 1): #прогрев страничного кэша
+        await method(user_id)
+    timings = []
+    for _ in range(queries):
+        user_id = rnd.randint(1, users)
+        start = time.perf_counter()
+        await method(user_id)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1e6, timings[int(len(timings) * 0.99)] * 1e6
+
+def size_mb(path: str):
+    return sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix)) / 2**20
+
+async def report(name: str, path: str, args):
+    db = Database(path, readers=1)
+    await db.connect()
+    async with db._read() as conn:
+        async with conn.execute("SELECT COUNT(*) FROM logs") as cursor:
+            count = (await cursor.fetchone())[0]
+    print(f"{name}: строк в logs {count}, файл {size_mb(path):.0f} МБ")
+    for label, method in (("get_today_logs", db.get_today_logs), ("get_weekly_logs", db.get_weekly_logs)):
+        p50, p99 = await measure(db, method, args.users, args.queries)
+        print(f"  {label:16} p50 {p50:7.1f} мкс  p99 {p99:7.1f} мкс")
+    await db.close()
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=3000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--queries", type=int, default=3000)
+    parser.add_argument("--retention-days", type=int, default=90)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        old_path = os.path.join(tmp, "old.db")
+        new_path = os.path.join(tmp, "new.db")
+
+        start = time.perf_counter()
+        fill_old(old_path, args.users, args.days)
+        await fill_new(new_path, args.users, args.days)
+        print(f"Подготовка данных: {time.perf_counter() - start:.1f} с")
+
+        #Прежняя схема: методы Database выполняют те же запросы, create_tables не вызываем, чтобы не перенести таблицу
+        await report("Прежняя схема", old_path, args)
+        await report("WITHOUT ROWID", new_path, args)
+
+        db = Database(new_path)
+        start = time.perf_counter()
+        compacted = await db.compact_logs(args.retention_days)
+        await db.close()
+        print(f"Сжатие дней старше {args.retention_days}: {compacted} строк за {time.perf_counter() - start:.1f} с")
+        await report("После сжатия", new_path, args)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+#Тики напоминаний на 100 тыс. пользователей с напоминаниями, разбросанными по суткам:
+#время тика (запрос наступивших минут вместе с итогами дня + постановка в очередь) на каждой из 1440 минут
+#и память процесса. Для сравнения - память наивного варианта, задачи asyncio.sleep на каждое напоминание.
+#Запуск из корня репозитория: python -m benchmarks.bench_reminders [--users 100000]
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import resource
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+from database import Database
+from reminders import ReminderService
+
+class FakeBot:
+    async def send_message(self, chat_id: int, text: str):
+        pass
+
+async def fill(path: str, users: int):
+    db = Database(path)
+    await db.create_tables()
+    await db.close()
+    rnd = random.Random(4)
+    today = datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+    reminders = []
+    for user_id in range(1, users + 1):
+        #1-3 напоминания о воде днем и у половины - итоги дня вечером
+        for minute in rnd.sample(range(8 * 60, 20 * 60), rnd.randint(1, 3)):
+            reminders.append((user_id, 'water', minute))
+        if rnd.random() < 0.5:
+            reminders.append((user_id, 'summary', rnd.randrange(20 * 60, 23 * 60)))
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO users (user_id, weight, height, age, gender, activity, city, water_goal, calorie_goal) "
+        "VALUES (?, 70, 175, 30, 'М', 30, 'Moscow', 2500, 2300)",
+        ((user_id,) for user_id in range(1, users + 1))
+    )
+    conn.executemany(
+        "INSERT INTO logs (user_id, date, logged_water, logged_calories, burned_calories) VALUES (?, ?, ?, ?, ?)",
+        ((user_id, today, rnd.randrange(0, 3000, 250), rnd.uniform(0, 3000), rnd.uniform(0, 800)) for user_id in range(1, users + 1))
+    )
+    conn.executemany("INSERT INTO reminders (user_id, kind, at_minute) VALUES (?, ?, ?)", reminders)
+    conn.commit()
+    conn.close()
+    return len(reminders)
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+async def naive_memory(count: int):
+    #Задача на каждое напоминание, спящая до его времени
+    tracemalloc.start()
+    tasks = [asyncio.create_task(asyncio.sleep(3600)) for _ in range(count)]
+    await asyncio.sleep(0)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return current / 2**20
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "reminders.db")
+        start = time.perf_counter()
+        count = await fill(path, args.users)
+        print(f"Подготовка: {args.users} пользователей, {count} напоминаний за {time.perf_counter() - start:.1f} с")
+
+        db = Database(path)
+        await db.connect()
+        service = ReminderService(db, FakeBot(), send_rate=1e9)
+        service.start()
+        midnight = datetime.datetime.combine(datetime.datetime.now(datetime.timezone.utc).date(), datetime.time(), tzinfo=datetime.timezone.utc)
+
+        rss_before = rss_mb()
+        tracemalloc.start()
+        timings = []
+        busiest = 0
+        for minute in range(24 * 60):
+            tick_start = time.perf_counter()
+            due = await service.tick(midnight + datetime.timedelta(minutes=minute))
+            timings.append((time.perf_counter() - tick_start) * 1000)
+            busiest = max(busiest, due)
+            await service._queue.join() #отправка в тик не входит
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        await service.close()
+        await db.close()
+
+        timings.sort()
+        print(f"Тиков: {len(timings)}, напоминаний: {service.due} (отправлено {service.sent}, норма выполнена {service.skipped}), "
+              f"до {busiest} за минуту")
+        print(f"Тик: p50 {timings[len(timings) // 2]:.2f} мс, p99 {timings[int(len(timings) * 0.99) - 1]:.2f} мс, "
+              f"максимум {timings[-1]:.2f} мс (при тике раз в 60 с)")
+        print(f"Память: пик Python-объектов за сутки {peak / 2**20:.1f} МБ, RSS процесса {rss_before:.0f} -> {rss_mb():.0f} МБ")
+        print(f"Наивный вариант: {count} задач asyncio.sleep занимают {await naive_memory(count):.1f} МБ постоянно")
+
+if __name__ == "__main__":
+    asyncio.run(main())
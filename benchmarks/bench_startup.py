@@ -0,0 +1,65 @@
+#Время импорта модулей бота до начала dp.start_polling, по данным python -X importtime.
+#Сам aiogram (вместе с pydantic) от нас не зависит, поэтому бюджет считается для всего остального.
+#Завершается с ошибкой, если бюджет превышен или при старте загружаются библиотеки для графиков.
+#Запуск из корня репозитория: python -m benchmarks.bench_startup [--budget-ms 800] [--runs 5]
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import Counter
+
+BUDGET_MS = 800
+FRAMEWORK = ('aiogram', 'pydantic', 'pydantic_core', 'annotated_types', 'magic_filter', 'aiofiles')
+#Эти пакеты должны грузиться только в процессах построения графиков
+FORBIDDEN = ('matplotlib', 'pandas', 'numpy')
+
+def import_profile():
+    #Собственное время импорта каждого модуля, сгруппированное по пакету верхнего уровня
+    env = dict(os.environ, BOT_TOKEN=os.environ.get("BOT_TOKEN", "benchmark"),
+               WEATHER_API_KEY=os.environ.get("WEATHER_API_KEY", "benchmark"))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import bot"],
+        capture_output=True, text=True, env=env, check=True
+    )
+    packages = Counter()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us)
+    return packages
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    import_profile() #первый запуск компилирует .pyc, его не учитываем
+    totals, own = [], []
+    for _ in range(args.runs):
+        packages = import_profile()
+        totals.append(sum(packages.values()) / 1000)
+        own.append(sum(us for package, us in packages.items() if package not in FRAMEWORK) / 1000)
+    own_ms = statistics.median(own)
+
+    print(f"Импорт bot: всего {statistics.median(totals):.0f} мс, "
+          f"без aiogram/pydantic {own_ms:.0f} мс (бюджет {args.budget_ms:.0f} мс), медиана {args.runs} запусков")
+    print("Самые тяжелые пакеты:")
+    for package, us in packages.most_common(args.top):
+        print(f"  {us / 1000:7.1f} мс  {package}")
+
+    failed = False
+    forbidden = sorted(set(packages).intersection(FORBIDDEN))
+    if forbidden:
+        print(f"ОШИБКА: при старте загружаются {', '.join(forbidden)}")
+        failed = True
+    if own_ms > args.budget_ms:
+        print("ОШИБКА: превышен бюджет времени импорта")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#Ночной пересчет норм воды (water_goals.py) на 100 тыс. пользователей против локальной заглушки прогноза погоды
+#с задержкой: число запросов к API (города против пользователей), время запросов и пересчета с записью.
+#Города в профилях записаны по-разному ("Москва", "москва ", "МОСКВА") - запросов все равно по одному на город.
+#Запуск из корня репозитория: python -m benchmarks.bench_water_goals [--users 100000] [--cities 3000] [--latency-ms 100]
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+
+from aiohttp import web
+
+async def start_stub(latency: float, calls):
+    async def forecast(request):
+        calls.append(request.query['q'])
+        if latency:
+            await asyncio.sleep(latency)
+        rnd = random.Random(request.query['q'].lower().strip())
+        base = rnd.uniform(-15, 35)
+        steps = int(request.query.get('cnt', 8))
+        return web.json_response({'list': [{'main': {'temp_max': base + rnd.uniform(-4, 4)}} for _ in range(steps)]})
+
+    app = web.Application()
+    app.router.add_get('/data/2.5/forecast', forecast)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/data/2.5/forecast"
+
+def spelling(city: str, rnd: random.Random):
+    return rnd.choice((city, city.lower(), city.upper(), f" {city} "))
+
+async def fill(path: str, users: int, cities: int):
+    from database import Database
+    db = Database(path)
+    await db.create_tables()
+    await db.close()
+    rnd = random.Random(9)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO users (user_id, weight, height, age, gender, activity, city, water_goal, calorie_goal) "
+        "VALUES (?, ?, 175, 30, 'М', ?, ?, 2500, 2300)",
+        (
+            (user_id, rnd.randint(45, 120), rnd.randrange(0, 180, 15), spelling(f"Город {rnd.randint(1, cities)}", rnd))
+            for user_id in range(1, users + 1)
+        )
+    )
+    conn.commit()
+    conn.close()
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--cities", type=int, default=3000)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    calls = []
+    runner, url = await start_stub(args.latency_ms / 1000, calls)
+    os.environ["WEATHER_FORECAST_URL"] = url
+    os.environ.setdefault("BOT_TOKEN", "benchmark")
+    os.environ.setdefault("WEATHER_API_KEY", "benchmark")
+    import http_client
+    from database import Database
+    from energy_model import EnergyModel
+    from water_goals import WaterGoalsJob
+    from weather import WeatherService
+
+    await http_client.start_session()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "water_goals.db")
+            await fill(path, args.users, args.cities)
+            db = Database(path)
+            await db.connect()
+            job = WaterGoalsJob(db, WeatherService(), EnergyModel(), concurrency=args.concurrency)
+            spellings = len(await db.get_user_cities())
+
+            commits = db.commits
+            report = await job.run()
+            print(f"Пользователей {report['users']}, написаний города {spellings}, запросов прогноза {len(calls)} "
+                  f"(по одному на пользователя было бы {report['users']})")
+            print(f"Запросы ({args.concurrency} одновременно, задержка {args.latency_ms:.0f} мс): {report['fetch_seconds']:.2f} с; "
+                  f"пересчет и запись: {report['seconds'] - report['fetch_seconds']:.2f} с; всего {report['seconds']:.2f} с")
+            print(f"Изменено норм: {report['changed']}, транзакций записи: {db.commits - commits}")
+            print(f"Без группировки по городам: {report['users']} запросов, не меньше "
+                  f"{report['users'] * args.latency_ms / 1000 / args.concurrency:.0f} с только на ожидание API")
+
+            calls.clear()
+            report = await job.run()
+            print(f"Повторный запуск: изменено {report['changed']}, {report['seconds']:.2f} с")
+            await db.close()
+    finally:
+        await http_client.close_session()
+        await runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+#Генератор нагрузки для режима вебхука: синтетические обновления /log_water на локальный webhook.py
+#с разным числом воркеров. Ответы бота уходят в заглушку Bot API, по ним и считается пропускная способность.
+#Запуск из корня репозитория: python -m benchmarks.bench_webhook [--workers 1 2 4] [--updates 3000]
+import argparse
+import asyncio
+import os
+import random
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from benchmarks.fake_telegram import FakeTelegram, message_update
+from database import Database
+
+PROFILE = {'weight': 70, 'height': 175, 'age': 30, 'gender': 'М', 'activity': 30,
+           'city': 'Москва', 'water_goal': 2600, 'calorie_goal': 2400}
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+async def prepare_users(db_path: str, users: int):
+    db = Database(db_path)
+    await db.create_tables()
+    for user_id in range(1, users + 1):
+        await db.save_user(user_id, PROFILE)
+    await db.close()
+
+async def start_bot(workers: int, port: int, env: dict):
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "webhook.py", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port),
+        env=env, stderr=asyncio.subprocess.PIPE
+    )
+    ready_line = "Все воркеры запущены" if workers > 1 else "принимает обновления"
+    while True:
+        line = await asyncio.wait_for(process.stderr.readline(), timeout=120)
+        if not line:
+            raise RuntimeError("webhook.py завершился при запуске")
+        if ready_line in line.decode():
+            break
+    #Дальше вывод бота не нужен, но канал надо вычитывать, чтобы он не заполнился
+    asyncio.create_task(process.stderr.read())
+    return process
+
+async def drive(url: str, fake: FakeTelegram, updates: int, concurrency: int, users: int):
+    queue = asyncio.Queue()
+    for _ in range(updates):
+        queue.put_nowait(message_update(random.randint(1, users), "/log_water 250"))
+    expected = len(fake.replies) + updates
+
+    async def sender(session):
+        while not queue.empty():
+            update = queue.get_nowait()
+            async with session.post(url, json=update) as response:
+                await response.read()
+
+    start = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(sender(session) for _ in range(concurrency)))
+    await fake.wait_replies(expected, timeout=300)
+    return updates / (time.perf_counter() - start)
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument("--updates", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--write-behind", action="store_true", help="групповая запись логов (WRITE_BEHIND=1, действует только при 1 воркере)")
+    args = parser.parse_args()
+
+    fake = FakeTelegram()
+    api_url = await fake.start()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "users.db")
+        await prepare_users(db_path, args.users)
+        env = dict(
+            os.environ,
+            PYTHONUNBUFFERED="1",
+            BOT_TOKEN="123456:benchmark",
+            WEATHER_API_KEY="benchmark",
+            TELEGRAM_API_URL=api_url,
+            DB_PATH=db_path,
+            FSM_STORAGE="sqlite",
+            FOOD_INDEX_PATH=os.path.join(tmp, "foods.db"),
+            CHART_WORKERS="1",
+            SEND_GLOBAL_RATE="1000000", #заглушка API не ограничивает отправку
+            WRITE_BEHIND="1" if args.write_behind else "0",
+        )
+        env.pop("WEBHOOK_URL", None)
+        env.pop("WEBHOOK_SECRET", None)
+
+        for workers in args.workers:
+            port = free_port()
+            process = await start_bot(workers, port, env)
+            try:
+                url = f"http://127.0.0.1:{port}/webhook"
+                await drive(url, fake, min(200, args.updates), args.concurrency, args.users) #прогрев
+                results[workers] = await drive(url, fake, args.updates, args.concurrency, args.users)
+            finally:
+                process.send_signal(signal.SIGTERM)
+                await process.wait()
+            print(f"Воркеров: {workers}: {results[workers]:8.1f} обновлений/с")
+    await fake.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,59 @@
+#Нагрузочный тест отложенной записи: утренний поток /log_water от множества пользователей.
+#Сравнивает операции/с и коммиты/с с включенным и выключенным режимом write-behind.
+#Запуск из корня репозитория: python -m benchmarks.bench_write_behind [--ops 5000] [--concurrency 50]
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from database import Database
+
+async def run(path: str, ops: int, concurrency: int, users: int, **options):
+    db = Database(path, **options)
+    await db.connect()
+    await db.create_tables()
+    commits_before = db.commits
+
+    queue = asyncio.Queue()
+    for i in range(ops):
+        queue.put_nowait(i % users)
+
+    async def worker():
+        while not queue.empty():
+            user_id = queue.get_nowait()
+            logs = await db.log_water(user_id, 250)
+            assert logs['logged_water'] > 0 #читатель сразу видит свою запись
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    await db.flush()
+    elapsed = time.perf_counter() - start
+    commits = db.commits - commits_before
+    await db.close()
+    return ops / elapsed, commits / elapsed, commits
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ops", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--interval-ms", type=int, default=200)
+    parser.add_argument("--max-ops", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        modes = (
+            ("обычная запись", os.path.join(tmp, "sync.db"), {}),
+            ("write-behind", os.path.join(tmp, "wb.db"), {
+                'write_behind': True,
+                'flush_interval_ms': args.interval_ms,
+                'flush_max_ops': args.max_ops,
+            }),
+        )
+        for name, path, options in modes:
+            ops_rate, commit_rate, commits = await run(path, args.ops, args.concurrency, args.users, **options)
+            print(f"{name:15} {ops_rate:9.1f} операций/с  {commit_rate:8.1f} коммитов/с  (всего коммитов: {commits})")
+
+if __name__ == "__main__":
+    asyncio.run(main())
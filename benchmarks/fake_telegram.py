@@ -0,0 +1,160 @@
+#Локальная заглушка Telegram Bot API для бенчмарков: отвечает на методы бота и считает вызовы.
+#Боту адрес передается через TELEGRAM_API_URL.
+import asyncio
+import itertools
+import time
+from collections import Counter
+
+from aiohttp import web
+
+class FakeTelegram:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.replies = [] #(chat_id, метод, время ответа) для каждого отправленного сообщения
+        self.updates = asyncio.Queue() #обновления для getUpdates (режим опроса)
+        self.reply_event = asyncio.Event()
+        self.chat_replies = Counter() #chat_id -> сколько сообщений бот отправил в этот чат
+        self._chat_events = {}
+        self._ids = itertools.count(1)
+        self._runner = None
+        self.url = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        app = web.Application(client_max_size=64 * 2**20)
+        app.router.add_route('*', '/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _params(self, request):
+        if request.content_type.startswith('multipart/'):
+            params = {}
+            async for part in await request.multipart():
+                if part.filename is None:
+                    params[part.name] = await part.text()
+                else:
+                    await part.read() #загрузку файла просто вычитываем
+            return params
+        if request.can_read_body:
+            data = await request.post()
+            return dict(data)
+        return dict(request.query)
+
+    async def _handle(self, request):
+        method = request.match_info['method']
+        params = await self._params(request)
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'}
+        elif method == 'getUpdates':
+            result = await self._get_updates(float(params.get('timeout', 0) or 0))
+        elif method in ('sendMessage', 'sendPhoto', 'sendDocument', 'editMessageText'):
+            chat_id = int(params.get('chat_id', 0))
+            result = self._message(chat_id, method, params)
+            self.replies.append((chat_id, method, time.perf_counter()))
+            self.reply_event.set()
+            self.chat_replies[chat_id] += 1
+            event = self._chat_events.get(chat_id)
+            if event is not None:
+                event.set()
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    async def _get_updates(self, timeout: float):
+        updates = []
+        try:
+            updates.append(await asyncio.wait_for(self.updates.get(), timeout=max(timeout, 0.1)))
+        except asyncio.TimeoutError:
+            return []
+        while not self.updates.empty() and len(updates) < 100:
+            updates.append(self.updates.get_nowait())
+        return updates
+
+    def _message(self, chat_id: int, method: str, params):
+        message = {
+            'message_id': next(self._ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': 1, 'is_bot': True, 'first_name': 'bench'},
+        }
+        if method == 'sendPhoto':
+            file_id = f"photo-{message['message_id']}"
+            message['photo'] = [{'file_id': file_id, 'file_unique_id': file_id, 'width': 1000, 'height': 800}]
+        elif method == 'sendDocument':
+            file_id = f"doc-{message['message_id']}"
+            message['document'] = {'file_id': file_id, 'file_unique_id': file_id}
+        else:
+            message['text'] = params.get('text', '')
+        return message
+
+    async def wait_replies(self, count: int, timeout: float = 60):
+        deadline = time.perf_counter() + timeout
+        while len(self.replies) < count:
+            self.reply_event.clear()
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError(f"получено {len(self.replies)} ответов из {count}")
+            try:
+                await asyncio.wait_for(self.reply_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def wait_chat(self, chat_id: int, count: int, timeout: float = 60):
+        #Ждет, пока в чат chat_id придет count сообщений от бота (всего с начала работы)
+        event = self._chat_events.setdefault(chat_id, asyncio.Event())
+        deadline = time.perf_counter() + timeout
+        while self.chat_replies[chat_id] < count:
+            event.clear()
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError(f"в чат {chat_id} получено {self.chat_replies[chat_id]} ответов из {count}")
+            try:
+                await asyncio.wait_for(event.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+_update_ids = itertools.count(1)
+
+def message_update(user_id: int, text: str):
+    update_id = next(_update_ids)
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+def callback_update(user_id: int, data: str):
+    update_id = next(_update_ids)
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'},
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': update_id,
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'text': 'Введите Ваш пол',
+            },
+        },
+    }
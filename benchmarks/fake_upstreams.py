@@ -0,0 +1,62 @@
+#Локальные заглушки внешних API для бенчмарков: OpenWeatherMap (текущая погода и прогноз) и поиск
+#Open Food Facts. Отвечают с заданной задержкой и считают запросы. Адреса передаются боту через
+#WEATHER_API_URL, WEATHER_FORECAST_URL и FOOD_API_URL.
+import asyncio
+import random
+from collections import Counter
+
+from aiohttp import web
+
+class FakeUpstreams:
+    def __init__(self, latency: float = 0.0, food_latency: float = None):
+        self.latency = latency
+        self.food_latency = latency if food_latency is None else food_latency
+        self.calls = Counter() #weather/forecast/food -> число запросов
+        self._runner = None
+        self.weather_url = self.forecast_url = self.food_url = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        app = web.Application()
+        app.router.add_get('/data/2.5/weather', self._weather)
+        app.router.add_get('/data/2.5/forecast', self._forecast)
+        app.router.add_get('/cgi/search.pl', self._food)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        base = f"http://{host}:{site._server.sockets[0].getsockname()[1]}"
+        self.weather_url = f"{base}/data/2.5/weather"
+        self.forecast_url = f"{base}/data/2.5/forecast"
+        self.food_url = f"{base}/cgi/search.pl"
+        return base
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    @staticmethod
+    def _temperature(city: str):
+        #Одна и та же температура для города в пределах запуска
+        return random.Random(city.lower().strip()).uniform(-15, 35)
+
+    async def _weather(self, request):
+        self.calls['weather'] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({'main': {'temp': self._temperature(request.query.get('q', ''))}})
+
+    async def _forecast(self, request):
+        self.calls['forecast'] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        base = self._temperature(request.query.get('q', ''))
+        steps = int(request.query.get('cnt', 8))
+        return web.json_response({'list': [{'main': {'temp_max': base + step % 4}} for step in range(steps)]})
+
+    async def _food(self, request):
+        self.calls['food'] += 1
+        if self.food_latency:
+            await asyncio.sleep(self.food_latency)
+        name = request.query.get('search_terms', '')
+        calories = random.Random(name).randint(20, 600)
+        return web.json_response({'products': [{'product_name': name, 'nutriments': {'energy-kcal_100g': calories}}]})
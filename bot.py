@@ -1,22 +1,198 @@
 import asyncio
+import logging
 from aiogram import Bot, Dispatcher
-from config import BOT_TOKEN
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from config import (
+    BOT_TOKEN, DB_PATH, DB_READERS, WRITE_BEHIND, WRITE_BEHIND_INTERVAL_MS, WRITE_BEHIND_MAX_OPS,
+    USER_CACHE_SIZE, USER_CACHE_TTL, USER_NEGATIVE_TTL,
+    BMR_FORMULA, MET_COMPENDIUM_PATH,
+    FOOD_CACHE_SIZE, FOOD_CACHE_TTL, FOOD_NEGATIVE_TTL, FOOD_CACHE_WARM, FOOD_INDEX_PATH, FOOD_LOOKUP_CONCURRENCY,
+    WEATHER_CACHE_TTL, WEATHER_STALE_TTL, WEATHER_STALE_WHILE_REVALIDATE, WATER_GOALS_RECOMPUTE_AT, WATER_GOALS_CONCURRENCY,
+    CHART_WORKERS, CHART_QUEUE_LIMIT, CHART_CACHE_BYTES, CHART_CACHE_DIR, CHART_CACHE_DISK_FILES,
+    FSM_STORAGE, FSM_STATE_TTL, FSM_WRITE_BACK, FSM_FLUSH_INTERVAL_MS, TELEGRAM_API_URL, WEBHOOK_USER_CACHE_TTL,
+    RATE_LIMIT, RATE_LIMIT_CHEAP, RATE_LIMIT_DEFAULT, RATE_LIMIT_EXPENSIVE,
+    SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_MAX_RETRIES,
+    LOG_LEVEL, LOG_FILE, METRICS_HOST, METRICS_PORT, METRICS_DUMP_PATH,
+    LOGS_ROLLOVER_AT, LOGS_ACTIVE_DAYS, LOGS_COMPACT_AT, LOGS_RETENTION_DAYS,
+    REMINDERS, REMINDER_TICK_SECONDS, REMINDER_CATCH_UP_MINUTES, REMINDER_SEND_RATE, REMINDER_SENDERS
+)
 from handlers import setup_handlers
 from database import Database
-from middlewares import LoggingMiddleware, DatabaseMiddleware
+from food_cache import FoodCache
+from food_index import FoodIndex
+from http_client import start_session, close_session
+from weather import WeatherService
+from energy_model import EnergyModel
+from charts import ChartRenderer
+from chart_cache import ChartCache
+from storage import create_storage
+from scheduler import Scheduler, parse_time
+from reminders import ReminderService
+from water_goals import WaterGoalsJob
+from challenges import ChallengeService
+from rate_limit import SendThrottle, parse_limit
+from metrics import metrics, setup_logging, stop_logging, dump_on_signal, start_metrics_server
+from middlewares import InstrumentationMiddleware, RateLimitMiddleware, DatabaseMiddleware, ServicesMiddleware
 
-async def main():
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher()
-    db = Database()
+logger = logging.getLogger(__name__)
+
+def create_bot_instance():
+    if TELEGRAM_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
+        return Bot(token=BOT_TOKEN, session=session)
+    return Bot(token=BOT_TOKEN)
+
+async def create_bot(workers: int = 1, jobs: bool = True):
+    #Общая сборка бота для режима опроса (main) и для вебхуков (webhook.py).
+    #workers > 1 - несколько процессов обслуживают одного бота, состояние между ними только через SQLite.
+    #jobs - запускать ли задачи по расписанию (при нескольких воркерах - только в одном из них)
+    bot = create_bot_instance()
+    throttle = SendThrottle(
+        global_rate=SEND_GLOBAL_RATE / workers, #общий лимит бота делим между процессами
+        chat_rate=SEND_CHAT_RATE,
+        chat_burst=SEND_CHAT_BURST,
+        max_retries=SEND_MAX_RETRIES
+    )
+    bot.session.middleware(throttle)
+    db = Database(
+        DB_PATH,
+        readers=DB_READERS,
+        #Отложенные приращения видны только своему процессу: при нескольких воркерах /check_progress в другом
+        #процессе не увидел бы только что записанное, поэтому отложенная запись, как и write-back FSM, выключается
+        write_behind=WRITE_BEHIND and workers == 1,
+        flush_interval_ms=WRITE_BEHIND_INTERVAL_MS,
+        flush_max_ops=WRITE_BEHIND_MAX_OPS,
+        user_cache_size=USER_CACHE_SIZE,
+        user_cache_ttl=USER_CACHE_TTL if workers == 1 else min(USER_CACHE_TTL, WEBHOOK_USER_CACHE_TTL),
+        user_negative_ttl=USER_NEGATIVE_TTL if workers == 1 else 0
+    )
+    await db.connect()
     await db.create_tables()
+    storage = create_storage(
+        FSM_STORAGE,
+        db,
+        ttl=FSM_STATE_TTL,
+        write_back=FSM_WRITE_BACK and workers == 1,
+        flush_interval_ms=FSM_FLUSH_INTERVAL_MS
+    )
+    dp = Dispatcher(storage=storage) #хранилище закрывается (и сбрасывает изменения) в dp.shutdown раньше on_shutdown
+    await start_session()
 
-    dp.message.middleware(LoggingMiddleware())
+    food_index = FoodIndex(FOOD_INDEX_PATH)
+    await food_index.connect()
+    food_cache = FoodCache(
+        db,
+        maxsize=FOOD_CACHE_SIZE,
+        ttl=FOOD_CACHE_TTL,
+        negative_ttl=FOOD_NEGATIVE_TTL,
+        index=food_index,
+        lookup_concurrency=FOOD_LOOKUP_CONCURRENCY
+    )
+    await food_cache.warm_up(FOOD_CACHE_WARM)
+    weather = WeatherService(
+        ttl=WEATHER_CACHE_TTL,
+        stale_ttl=WEATHER_STALE_TTL,
+        stale_while_revalidate=WEATHER_STALE_WHILE_REVALIDATE
+    )
+    energy = EnergyModel(BMR_FORMULA, MET_COMPENDIUM_PATH)
+    renderer = ChartRenderer(workers=CHART_WORKERS, max_queue=CHART_QUEUE_LIMIT)
+    chart_cache = ChartCache(max_bytes=CHART_CACHE_BYTES, spill_dir=CHART_CACHE_DIR, spill_max_files=CHART_CACHE_DISK_FILES)
+    #Таблицы соревнований в памяти; при нескольких воркерах перечитываются из БД, как и кэш профилей
+    challenges = ChallengeService(db, refresh_interval=0 if workers == 1 else WEBHOOK_USER_CACHE_TTL)
+    await challenges.load()
+
+    instrumentation = InstrumentationMiddleware()
+    dp.message.middleware(instrumentation)
+    dp.callback_query.middleware(instrumentation)
+    if RATE_LIMIT:
+        dp.message.middleware(RateLimitMiddleware({
+            'cheap': parse_limit(RATE_LIMIT_CHEAP),
+            'default': parse_limit(RATE_LIMIT_DEFAULT),
+            'expensive': parse_limit(RATE_LIMIT_EXPENSIVE),
+        }))
     dp.message.middleware(DatabaseMiddleware(db))
+    dp.message.middleware(ServicesMiddleware(
+        food_cache=food_cache,
+        weather=weather,
+        renderer=renderer,
+        chart_cache=chart_cache,
+        challenges=challenges,
+        energy=energy
+    ))
     setup_handlers(dp)
 
-    print("Бот запущен!")
-    await dp.start_polling(bot)
+    #Текущее состояние кэшей и очередей отдается вместе с гистограммами на /metrics
+    metrics.register_stats('bot_db', db.stats)
+    metrics.register_stats('bot_food_cache', food_cache.stats)
+    metrics.register_stats('bot_weather', weather.stats)
+    metrics.register_stats('bot_chart_cache', chart_cache.stats)
+    metrics.register_stats('bot_challenges', challenges.stats)
+    metrics.register_stats('bot_renderer', lambda: {'queue_depth': renderer.queue_depth, 'rendered': renderer.rendered, 'rejected': renderer.rejected})
+    metrics.register_stats('bot_send', lambda: {'throttled': throttle.throttled, 'retries': throttle.retries})
+    if hasattr(storage, 'stats'):
+        metrics.register_stats('bot_fsm', storage.stats)
+
+    scheduler = Scheduler()
+    scheduler.daily('logs_rollover', parse_time(LOGS_ROLLOVER_AT), lambda: db.rollover(active_days=LOGS_ACTIVE_DAYS))
+    scheduler.daily('logs_compact', parse_time(LOGS_COMPACT_AT), lambda: db.compact_logs(LOGS_RETENTION_DAYS))
+    if WATER_GOALS_RECOMPUTE_AT:
+        water_goals = WaterGoalsJob(db, weather, energy, concurrency=WATER_GOALS_CONCURRENCY)
+        scheduler.daily('water_goals', parse_time(WATER_GOALS_RECOMPUTE_AT), water_goals.run)
+        metrics.register_stats('bot_water_goals', water_goals.stats)
+    metrics.register_stats('bot_scheduler', scheduler.stats)
+
+    reminders = None
+    if REMINDERS and jobs:
+        reminders = ReminderService(
+            db,
+            bot,
+            send_rate=min(REMINDER_SEND_RATE, SEND_GLOBAL_RATE / workers),
+            senders=REMINDER_SENDERS,
+            catch_up_minutes=REMINDER_CATCH_UP_MINUTES
+        )
+        scheduler.every('reminders', REMINDER_TICK_SECONDS, reminders.tick)
+        metrics.register_stats('bot_reminders', reminders.stats)
+
+    background = []
+
+    async def on_startup():
+        #Процессы для графиков (и matplotlib в них) поднимаются в фоне, пока бот уже принимает сообщения
+        background.append(asyncio.create_task(renderer.start()))
+        if jobs:
+            scheduler.start()
+        if reminders is not None:
+            reminders.start()
+
+    async def on_shutdown():
+        for task in background:
+            task.cancel()
+        await scheduler.close()
+        if reminders is not None:
+            await reminders.close()
+        await food_cache.flush_hits()
+        await db.flush() #сбрасываем отложенные записи до остановки
+        await db.close()
+        await food_index.close()
+        await close_session()
+        await renderer.close()
+        await chart_cache.close()
+
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    return bot, dp
+
+async def main():
+    setup_logging(LOG_LEVEL, LOG_FILE)
+    try:
+        bot, dp = await create_bot()
+        dump_on_signal(METRICS_DUMP_PATH)
+        if METRICS_PORT:
+            await start_metrics_server(METRICS_HOST, METRICS_PORT)
+        logger.info("Бот запущен!")
+        await dp.start_polling(bot)
+    finally:
+        stop_logging()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,207 @@
+import bisect
+import datetime
+import logging
+import time
+from typing import Dict, Optional, Set
+from database import Database, _today
+
+logger = logging.getLogger(__name__)
+
+#Вид соревнования -> поле logs, которое суммируется
+METRICS = {'water': 'logged_water', 'burned': 'burned_calories'}
+MAX_DAYS = 90
+#Сколько дней после окончания таблица соревнования остается в памяти (итоговые места)
+KEEP_FINISHED_DAYS = 7
+EVICT_INTERVAL = 3600 #как часто (сек) проверять, не пора ли выгрузить закончившиеся соревнования
+
+class Ranking:
+    #Таблица одного соревнования: список ключей (-очки, user_id), отсортированный по месту.
+    #Место участника - двоичный поиск, первые k - срез; изменение очков - удаление и вставка ключа
+    #(сдвиг памяти для 10 тыс. участников занимает микросекунды)
+    def __init__(self):
+        self._keys = []
+        self._scores = {} #user_id -> очки
+
+    def set(self, user_id: int, score: float):
+        old = self._scores.get(user_id)
+        if old is not None:
+            del self._keys[bisect.bisect_left(self._keys, (-old, user_id))]
+        self._scores[user_id] = score
+        bisect.insort(self._keys, (-score, user_id))
+
+    def add(self, user_id: int, delta: float):
+        self.set(user_id, self._scores.get(user_id, 0) + delta)
+
+    def remove(self, user_id: int):
+        score = self._scores.pop(user_id, None)
+        if score is not None:
+            del self._keys[bisect.bisect_left(self._keys, (-score, user_id))]
+
+    def rank(self, user_id: int):
+        #(место с 1, очки) или None
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+        return bisect.bisect_left(self._keys, (-score, user_id)) + 1, score
+
+    def top(self, k: int):
+        return [(user_id, -score) for score, user_id in self._keys[:k]]
+
+    def __len__(self):
+        return len(self._keys)
+
+class ChallengeService:
+    #Соревнования по воде и сожженным калориям. Таблицы всех идущих соревнований строятся из logs
+    #при старте, а дальше обновляются приращениями из обработчиков (record), поэтому /challenge <id>
+    #не пересчитывает логи всех участников.
+    #С несколькими воркерами записи приходят и в соседние процессы, поэтому там таблица
+    #пересчитывается из БД, если она старше refresh_interval секунд (0 - только приращения).
+    #Соревнования, закончившиеся больше KEEP_FINISHED_DAYS дней назад, выгружаются из памяти (как и при старте
+    #они не загружаются) - проверка не чаще раза в EVICT_INTERVAL, в каждом процессе отдельно
+    def __init__(self, db: Database, refresh_interval: float = 0):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self._challenges = {} #id -> строка challenges
+        self._rankings: Dict[int, Ranking] = {}
+        self._names = {} #(id, user_id) -> имя участника
+        self._by_user: Dict[int, Set[int]] = {} #user_id -> id соревнований
+        self._loaded_at = {} #id -> время последнего пересчета из БД
+        self._evicted_at = time.monotonic()
+        self.updates = 0
+        self.rebuilds = 0
+        self.evicted = 0
+
+    def _keep_after(self):
+        #Соревнования, закончившиеся раньше этой даты, в памяти не держим
+        return (datetime.date.fromisoformat(_today()) - datetime.timedelta(days=KEEP_FINISHED_DAYS)).isoformat()
+
+    async def load(self):
+        start = time.perf_counter()
+        for challenge in await self.db.get_challenges(self._keep_after()):
+            self._challenges[challenge['id']] = challenge
+            await self._rebuild(challenge['id'])
+        logger.info("Загружено соревнований: %s", len(self._challenges),
+                    extra={'duration_ms': round((time.perf_counter() - start) * 1000, 1)})
+
+    async def _rebuild(self, challenge_id: int):
+        challenge = self._challenges[challenge_id]
+        rows = await self.db.get_challenge_scores(
+            challenge_id, METRICS[challenge['metric']], challenge['start_date'], challenge['end_date']
+        )
+        old = self._rankings.get(challenge_id)
+        if old is not None:
+            for user_id, _ in old.top(len(old)):
+                self._by_user.get(user_id, set()).discard(challenge_id)
+        ranking = Ranking()
+        for user_id, name, score in rows:
+            ranking.set(user_id, score)
+            self._names[challenge_id, user_id] = name
+            self._by_user.setdefault(user_id, set()).add(challenge_id)
+        self._rankings[challenge_id] = ranking
+        self._loaded_at[challenge_id] = time.monotonic()
+        self.rebuilds += 1
+
+    async def create(self, owner_id: int, owner_name: str, metric: str, days: int, name: str):
+        start_date = _today()
+        end_date = (datetime.date.fromisoformat(start_date) + datetime.timedelta(days=days - 1)).isoformat()
+        challenge_id = await self.db.create_challenge(name, metric, owner_id, start_date, end_date)
+        self._challenges[challenge_id] = {
+            'id': challenge_id, 'name': name, 'metric': metric, 'owner_id': owner_id,
+            'start_date': start_date, 'end_date': end_date,
+        }
+        self._rankings[challenge_id] = Ranking()
+        self._loaded_at[challenge_id] = time.monotonic()
+        await self.join(challenge_id, owner_id, owner_name)
+        return self._challenges[challenge_id]
+
+    def evict_finished(self):
+        #Выгружает таблицы, имена участников и индекс по пользователям давно закончившихся соревнований
+        self._evicted_at = time.monotonic()
+        keep_after = self._keep_after()
+        finished = [challenge_id for challenge_id, challenge in self._challenges.items() if challenge['end_date'] < keep_after]
+        for challenge_id in finished:
+            del self._challenges[challenge_id]
+            ranking = self._rankings.pop(challenge_id, None)
+            self._loaded_at.pop(challenge_id, None)
+            for user_id, _ in ranking.top(len(ranking)) if ranking is not None else ():
+                self._names.pop((challenge_id, user_id), None)
+                challenge_ids = self._by_user.get(user_id)
+                if challenge_ids is not None:
+                    challenge_ids.discard(challenge_id)
+                    if not challenge_ids:
+                        del self._by_user[user_id]
+        self.evicted += len(finished)
+        return len(finished)
+
+    def _maybe_evict(self):
+        if time.monotonic() - self._evicted_at > EVICT_INTERVAL:
+            self.evict_finished()
+
+    async def get(self, challenge_id: int):
+        self._maybe_evict()
+        challenge = self._challenges.get(challenge_id)
+        if challenge is None and self.refresh_interval:
+            #Соревнование могли создать в другом процессе
+            for row in await self.db.get_challenges(_today()):
+                if row['id'] == challenge_id:
+                    self._challenges[challenge_id] = challenge = row
+                    await self._rebuild(challenge_id)
+        return challenge
+
+    async def join(self, challenge_id: int, user_id: int, name: str):
+        #Очки за уже прошедшие дни соревнования - один запрос по логам нового участника
+        challenge = self._challenges[challenge_id]
+        if not await self.db.add_challenge_member(challenge_id, user_id, name):
+            return False
+        rows = await self.db.get_challenge_scores(
+            challenge_id, METRICS[challenge['metric']], challenge['start_date'], challenge['end_date'], user_id=user_id
+        )
+        self._rankings[challenge_id].set(user_id, rows[0][2] if rows else 0)
+        self._names[challenge_id, user_id] = name
+        self._by_user.setdefault(user_id, set()).add(challenge_id)
+        return True
+
+    async def leave(self, challenge_id: int, user_id: int):
+        if not await self.db.remove_challenge_member(challenge_id, user_id):
+            return False
+        self._rankings[challenge_id].remove(user_id)
+        self._names.pop((challenge_id, user_id), None)
+        self._by_user.get(user_id, set()).discard(challenge_id)
+        return True
+
+    def record(self, user_id: int, field: str, delta: float, date: Optional[str] = None):
+        #Вызывается после каждой записи в logs (и отмены записи - с отрицательным delta)
+        self._maybe_evict()
+        challenge_ids = self._by_user.get(user_id)
+        if not challenge_ids:
+            return
+        date = date or _today()
+        for challenge_id in challenge_ids:
+            challenge = self._challenges[challenge_id]
+            if METRICS[challenge['metric']] == field and challenge['start_date'] <= date <= challenge['end_date']:
+                self._rankings[challenge_id].add(user_id, delta)
+                self.updates += 1
+
+    def user_challenges(self, user_id: int):
+        self._maybe_evict()
+        return [self._challenges[challenge_id] for challenge_id in sorted(self._by_user.get(user_id, ()))]
+
+    async def standings(self, challenge_id: int, user_id: int, k: int = 10):
+        #(первые k мест [(место, имя, очки)], (место, очки) пользователя или None, число участников)
+        if self.refresh_interval and time.monotonic() - self._loaded_at.get(challenge_id, 0) > self.refresh_interval:
+            await self._rebuild(challenge_id)
+        ranking = self._rankings[challenge_id]
+        top = [
+            (place, self._names.get((challenge_id, member_id)) or str(member_id), score)
+            for place, (member_id, score) in enumerate(ranking.top(k), start=1)
+        ]
+        return top, ranking.rank(user_id), len(ranking)
+
+    def stats(self):
+        return {
+            'challenges': len(self._rankings),
+            'members': sum(len(ranking) for ranking in self._rankings.values()),
+            'updates': self.updates,
+            'rebuilds': self.rebuilds,
+            'evicted': self.evicted,
+        }
@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+SPILL_PRUNE_EVERY = 100 #после скольких вытесненных на диск графиков проверять их число
+
+class ChartCache:
+    #Готовые графики прогресса. Ключ - отпечаток всех данных графика, поэтому при неизменных данных
+    #повторный /progress_graph отдает те же байты или даже file_id уже загруженной в Telegram картинки.
+    #Вся работа с каталогом spill_dir (запись, чтение, удаление, очистка) идет в отдельном потоке, чтобы не
+    #останавливать обработку обновлений. Поток один: операции с одним файлом выполняются в порядке вызова
+    def __init__(self, max_bytes: int = 64 * 2**20, spill_dir: Optional[str] = None, spill_max_files: int = 10000):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.spill_max_files = spill_max_files
+        self._png = OrderedDict() #key -> байты PNG, от давно использованных к недавним
+        self._bytes = 0
+        self._file_ids = {} #key -> file_id фото, уже отправленного в Telegram
+        self._user_keys = {} #user_id -> ключ последнего графика пользователя
+        self._spilled = 0
+        self.hits = 0
+        self.file_id_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._disk = None
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            self._disk = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chart-cache')
+
+    @staticmethod
+    def make_key(user_id: int, dates, water_goal, calorie_goal, *series):
+        fingerprint = hashlib.blake2b(repr((dates, water_goal, calorie_goal, series)).encode(), digest_size=16)
+        return f"{user_id}-{dates[0]}-{dates[-1]}-{fingerprint.hexdigest()}"
+
+    def get_file_id(self, key: str):
+        file_id = self._file_ids.get(key)
+        if file_id is not None:
+            self.file_id_hits += 1
+        return file_id
+
+    async def get_png(self, key: str):
+        png = self._png.get(key)
+        if png is not None:
+            self._png.move_to_end(key)
+            self.hits += 1
+            return png
+
+        path = self._spill_path(key)
+        if path is not None:
+            png = await asyncio.wrap_future(self._disk.submit(_read_file, path))
+            if png is not None:
+                self.disk_hits += 1
+                self._store(key, png)
+                return png
+
+        self.misses += 1
+        return None
+
+    def put(self, user_id: int, key: str, png: bytes, file_id: Optional[str] = None):
+        previous = self._user_keys.get(user_id)
+        if previous is not None and previous != key:
+            self._drop(previous) #старый график пользователя больше никогда не понадобится
+        self._user_keys[user_id] = key
+        self._store(key, png)
+        if file_id is not None:
+            self._file_ids[key] = file_id
+
+    def invalidate(self, user_id: int):
+        #Вызывается при записи новых логов пользователя
+        key = self._user_keys.pop(user_id, None)
+        if key is not None:
+            self._drop(key)
+
+    def _store(self, key: str, png: bytes):
+        if key in self._png:
+            self._bytes -= len(self._png.pop(key))
+        self._png[key] = png
+        self._bytes += len(png)
+        while self._bytes > self.max_bytes and len(self._png) > 1:
+            evicted_key, evicted = self._png.popitem(last=False)
+            self._bytes -= len(evicted)
+            self._spill(evicted_key, evicted)
+
+    def _drop(self, key: str):
+        png = self._png.pop(key, None)
+        if png is not None:
+            self._bytes -= len(png)
+        self._file_ids.pop(key, None)
+        path = self._spill_path(key)
+        if path is not None:
+            self._submit(_remove_file, path)
+
+    def _spill_path(self, key: str):
+        if not self.spill_dir:
+            return None
+        return os.path.join(self.spill_dir, f"{key}.png")
+
+    def _spill(self, key: str, png: bytes):
+        path = self._spill_path(key)
+        if path is None:
+            return
+        self._submit(_write_file, path, png)
+        self._spilled += 1
+        if self._spilled % SPILL_PRUNE_EVERY == 0:
+            self._submit(_prune_dir, self.spill_dir, self.spill_max_files)
+
+    def _submit(self, func, *args):
+        #Операция с диском в фоне: ее результат не нужен, ошибки только пишем в журнал
+        self._disk.submit(func, *args).add_done_callback(_log_disk_error)
+
+    async def close(self):
+        #Дожидаемся записи уже вытесненных графиков
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.shutdown)
+
+    def stats(self):
+        return {
+            'entries': len(self._png),
+            'bytes': self._bytes,
+            'file_ids': len(self._file_ids),
+            'hits': self.hits,
+            'file_id_hits': self.file_id_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+        }
+
+def _read_file(path: str):
+    try:
+        with open(path, 'rb') as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
+
+def _write_file(path: str, data: bytes):
+    with open(path, 'wb') as file:
+        file.write(data)
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _prune_dir(path: str, max_files: int):
+    #Оставляем на диске не больше max_files самых свежих графиков
+    entries = sorted(os.scandir(path), key=lambda entry: entry.stat().st_mtime)
+    for entry in entries[:max(0, len(entries) - max_files)]:
+        _remove_file(entry.path)
+
+def _log_disk_error(future):
+    error = future.exception()
+    if error is not None:
+        logger.error("Ошибка записи графика на диск: %s", error)
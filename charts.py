@@ -0,0 +1,109 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from io import BytesIO
+from typing import List, Optional
+from metrics import track
+
+class RendererBusy(Exception):
+    #Очередь на построение графиков заполнена
+    pass
+
+def render_weekly_chart(dates: List[str], water_values: List[float], water_goal: float,
+                        calories_values: List[float], burned_values: List[float], calorie_goal: float,
+                        period: str = 'за неделю', water_avg: Optional[List[float]] = None,
+                        balance_avg: Optional[List[float]] = None):
+    #Выполняется в процессе-воркере. Используем Figure напрямую, без глобального состояния pyplot.
+    #matplotlib импортируется здесь, чтобы основной процесс бота его не загружал.
+    #Для длинных периодов точки - средние за день по неделям или месяцам (см. analytics.py)
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 8))
+    ax1, ax2 = fig.subplots(2, 1)
+
+    # График воды
+    ax1.plot(dates, water_values, color='lightblue', label='Выпито')
+    if water_avg is not None:
+        ax1.plot(dates, water_avg, color='steelblue', label='Среднее за 7 дней')
+    ax1.axhline(y=water_goal, color='blue', linestyle='--', label=f'Цель: {water_goal:.0f} мл')
+    ax1.set_title(f'Потребление воды {period}, мл')
+    ax1.legend()
+    ax1.tick_params(axis='x', rotation=45)
+
+    # График калорий
+    balance = [a - b for a, b in zip(calories_values, burned_values)]
+
+    ax2.plot(dates, calories_values, color='lightcoral', label='Потреблено', alpha=0.5)
+    ax2.plot(dates, burned_values, color='green', label='Сожжено', alpha=0.5)
+    ax2.plot(dates, balance, color='orange', label='Баланс')
+    if balance_avg is not None:
+        ax2.plot(dates, balance_avg, color='darkorange', linestyle=':', label='Баланс, среднее за 7 дней')
+    ax2.axhline(y=calorie_goal, color='red', linestyle='--', label=f'Цель: {calorie_goal:.0f} ккал')
+    ax2.set_title(f'Потребление калорий {period}')
+    ax2.legend()
+    ax2.tick_params(axis='x', rotation=45)
+
+    fig.tight_layout()
+
+    buf = BytesIO()
+    fig.savefig(buf, format='png', dpi=100)
+    return buf.getvalue()
+
+def _warm_up_worker():
+    #Первый рендер в процессе грузит шрифты и кэши matplotlib - делаем его заранее
+    render_weekly_chart(['2024-01-01', '2024-01-02'], [0, 1], 1, [0, 1], [0, 1], 1)
+
+def _ping():
+    return True
+
+class ChartRenderer:
+    #Построение графиков в отдельных процессах, чтобы не блокировать цикл событий бота
+    def __init__(self, workers: int = 2, max_queue: int = 8):
+        self.workers = workers
+        self.max_queue = max_queue #сколько графиков может строиться и ждать одновременно
+        self._executor = None
+        self._pending = 0
+        self.rendered = 0
+        self.rejected = 0
+
+    async def start(self):
+        #Можно запускать фоном после старта бота: пул создается сразу, а процессы прогреваются параллельно
+        if self._executor is not None:
+            return
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'), #fork небезопасен при работающих потоках aiosqlite
+            initializer=_warm_up_worker
+        )
+        #Запускаем все процессы сразу, а не при первом запросе пользователя
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _ping) for _ in range(self.workers)))
+
+    async def close(self):
+        if self._executor is not None:
+            #Дожидаемся процессов в отдельном потоке: запущенные при старте могут еще не успеть подняться
+            executor, self._executor = self._executor, None
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, partial(executor.shutdown, wait=True, cancel_futures=True))
+
+    @property
+    def queue_depth(self):
+        return self._pending
+
+    async def render_weekly_chart(self, *args, **kwargs):
+        if self._executor is None:
+            await self.start()
+        if self._pending >= self.max_queue:
+            self.rejected += 1
+            raise RendererBusy()
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            async with track('render'):
+                png = await loop.run_in_executor(self._executor, partial(render_weekly_chart, *args, **kwargs))
+        finally:
+            self._pending -= 1
+        self.rendered += 1
+        return png
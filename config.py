@@ -6,6 +6,105 @@ load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
 
+#База данных
+DB_PATH = os.getenv("DB_PATH", "users.db")
+DB_READERS = int(os.getenv("DB_READERS", "4")) #количество соединений для чтения в пуле
+#Отложенная запись логов: приращения копятся в памяти и пишутся групповыми транзакциями.
+#WRITE_BEHIND_INTERVAL_MS - окно, в течение которого записи могут потеряться при падении процесса.
+#При нескольких воркерах вебхука выключается (приращения видны только своему процессу)
+WRITE_BEHIND = os.getenv("WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_INTERVAL_MS = int(os.getenv("WRITE_BEHIND_INTERVAL_MS", "200"))
+WRITE_BEHIND_MAX_OPS = int(os.getenv("WRITE_BEHIND_MAX_OPS", "500"))
+#Ежедневное обслуживание логов (время по UTC)
+LOGS_ROLLOVER_AT = os.getenv("LOGS_ROLLOVER_AT", "00:00") #создание строк нового дня
+LOGS_ACTIVE_DAYS = int(os.getenv("LOGS_ACTIVE_DAYS", "30")) #для кого создавать: писал что-то за столько дней
+LOGS_COMPACT_AT = os.getenv("LOGS_COMPACT_AT", "03:00") #сворачивание старых дней в итоги по месяцам
+LOGS_RETENTION_DAYS = int(os.getenv("LOGS_RETENTION_DAYS", "90")) #сколько дней хранить подробно
+#Кэш профилей пользователей
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "100000"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "3600")) #сек
+USER_NEGATIVE_TTL = int(os.getenv("USER_NEGATIVE_TTL", "60")) #сек, для пользователей без профиля
+
+#HTTP-клиент для внешних API
+WEATHER_API_URL = os.getenv("WEATHER_API_URL", "http://api.openweathermap.org/data/2.5/weather")
+WEATHER_FORECAST_URL = os.getenv("WEATHER_FORECAST_URL", "http://api.openweathermap.org/data/2.5/forecast")
+FOOD_API_URL = os.getenv("FOOD_API_URL", "https://world.openfoodfacts.org/cgi/search.pl")
+HTTP_LIMIT = int(os.getenv("HTTP_LIMIT", "100")) #всего одновременных соединений
+HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", "20"))
+HTTP_KEEPALIVE = float(os.getenv("HTTP_KEEPALIVE", "60")) #сек, сколько держать простаивающее соединение
+HTTP_DNS_TTL = int(os.getenv("HTTP_DNS_TTL", "300")) #сек
+WEATHER_TIMEOUT = float(os.getenv("WEATHER_TIMEOUT", "5")) #сек, на весь запрос
+FOOD_TIMEOUT = float(os.getenv("FOOD_TIMEOUT", "10"))
+
+#Кэш поиска продуктов
+FOOD_CACHE_SIZE = int(os.getenv("FOOD_CACHE_SIZE", "5000")) #записей в памяти
+FOOD_CACHE_TTL = int(os.getenv("FOOD_CACHE_TTL", str(30 * 24 * 3600))) #сек, для найденных продуктов
+FOOD_NEGATIVE_TTL = int(os.getenv("FOOD_NEGATIVE_TTL", str(24 * 3600))) #сек, для "не найдено"
+FOOD_CACHE_WARM = int(os.getenv("FOOD_CACHE_WARM", "1000")) #сколько популярных записей загрузить при старте
+FOOD_INDEX_PATH = os.getenv("FOOD_INDEX_PATH", "foods.db") #локальная база продуктов, см. food_index.py
+FOOD_LOOKUP_CONCURRENCY = int(os.getenv("FOOD_LOOKUP_CONCURRENCY", "4")) #одновременных поисков для одного приема пищи
+
+#Расчет норм и расхода на тренировках (energy_model.py)
+BMR_FORMULA = os.getenv("BMR_FORMULA", "mifflin") #mifflin, harris_benedict или katch_mcardle
+MET_COMPENDIUM_PATH = os.getenv("MET_COMPENDIUM_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "met_compendium.csv"))
+
+#Погода
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", "1800")) #сек, сколько температура считается свежей
+WEATHER_STALE_TTL = int(os.getenv("WEATHER_STALE_TTL", str(6 * 3600))) #сек, сколько можно отдавать устаревшую
+WEATHER_STALE_WHILE_REVALIDATE = os.getenv("WEATHER_STALE_WHILE_REVALIDATE", "1") == "1"
+#Ночной пересчет норм воды по прогнозу на сутки (время по UTC); пустое значение - не пересчитывать
+WATER_GOALS_RECOMPUTE_AT = os.getenv("WATER_GOALS_RECOMPUTE_AT", "01:00")
+WATER_GOALS_CONCURRENCY = int(os.getenv("WATER_GOALS_CONCURRENCY", "10")) #одновременных запросов прогноза
+
+#Графики
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2")) #процессов для построения графиков
+CHART_QUEUE_LIMIT = int(os.getenv("CHART_QUEUE_LIMIT", "8")) #графиков в работе и в очереди, сверх - отказ
+CHART_CACHE_BYTES = int(os.getenv("CHART_CACHE_BYTES", str(64 * 2**20))) #объем готовых графиков в памяти
+CHART_CACHE_DIR = os.getenv("CHART_CACHE_DIR") #если задан (например, chart_cache), вытесненные из памяти графики сохраняются сюда
+CHART_CACHE_DISK_FILES = int(os.getenv("CHART_CACHE_DISK_FILES", "10000"))
+
+#Хранилище состояний FSM (анкета профиля, ввод еды): memory или sqlite (таблица в DB_PATH)
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite")
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", str(24 * 3600))) #сек, после этого незавершенный диалог забывается
+FSM_WRITE_BACK = os.getenv("FSM_WRITE_BACK", "1") == "1" #изменения копятся в памяти, при нескольких воркерах выключается
+FSM_FLUSH_INTERVAL_MS = int(os.getenv("FSM_FLUSH_INTERVAL_MS", "500"))
+
+#Ограничение частоты команд на пользователя: "N/сек" - не больше N команд за столько секунд
+RATE_LIMIT = os.getenv("RATE_LIMIT", "1") == "1"
+RATE_LIMIT_CHEAP = os.getenv("RATE_LIMIT_CHEAP", "60/60") #/log_water
+RATE_LIMIT_DEFAULT = os.getenv("RATE_LIMIT_DEFAULT", "30/60")
+RATE_LIMIT_EXPENSIVE = os.getenv("RATE_LIMIT_EXPENSIVE", "5/60") #/progress_graph, /log_food
+#Исходящие сообщения: Telegram допускает около 30 сообщений в секунду на бота и около одного в секунду в чат
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30")) #на всего бота, делится между воркерами
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", "3"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3")) #повторов после ответа 429
+
+#Напоминания (/remind): проверяются раз в REMINDER_TICK_SECONDS в процессе с задачами по расписанию
+REMINDERS = os.getenv("REMINDERS", "1") == "1"
+REMINDER_TICK_SECONDS = int(os.getenv("REMINDER_TICK_SECONDS", "60"))
+REMINDER_CATCH_UP_MINUTES = int(os.getenv("REMINDER_CATCH_UP_MINUTES", "15")) #после простоя досылаются только пропущенные за это время
+REMINDER_SEND_RATE = float(os.getenv("REMINDER_SEND_RATE", "20")) #сообщений в секунду, часть SEND_GLOBAL_RATE
+REMINDER_SENDERS = int(os.getenv("REMINDER_SENDERS", "8"))
+
+#Журнал и метрики
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILE = os.getenv("LOG_FILE") #если не задан, записи (JSON по строке) идут в stderr
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0")) #порт для /metrics (у воркеров вебхука - METRICS_PORT + номер), 0 - не запускать
+METRICS_DUMP_PATH = os.getenv("METRICS_DUMP_PATH", "metrics.prom") #куда сохранять метрики по сигналу SIGUSR1
+
+#Режим вебхука (python webhook.py)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL") #свой сервер Bot API, например локальный telegram-bot-api
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL") #публичный адрес, например https://bot.example.com; если задан, вебхук регистрируется при старте
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+#При нескольких воркерах профиль может измениться в соседнем процессе, поэтому кэшируем его ненадолго
+WEBHOOK_USER_CACHE_TTL = int(os.getenv("WEBHOOK_USER_CACHE_TTL", "30"))
+
 if not BOT_TOKEN:
     raise ValueError("Переменная окружения BOT_TOKEN не установлена!")
 
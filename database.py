@@ -1,12 +1,219 @@
+import asyncio
+import datetime
+import logging
+import time
 import aiosqlite
-from typing import Dict, Any
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+from cache import TTLCache, MISS
+from metrics import track
+
+logger = logging.getLogger(__name__)
+
+#Настройки, применяемые к каждому соединению пула
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL", #читатели не блокируют писателя и наоборот
+    "PRAGMA synchronous=NORMAL", #в режиме WAL безопасно и сильно дешевле FULL
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-16000", #16 МБ страничного кэша на соединение
+    "PRAGMA temp_store=MEMORY",
+)
+STATEMENT_CACHE_SIZE = 128 #кэш подготовленных выражений sqlite3 на соединение
+
+LOG_FIELDS = ('logged_water', 'logged_calories', 'burned_calories')
+
+#Журналы отдельных записей: вид -> (таблица, дневной итог в logs, колонка с величиной для итога).
+#Записи только добавляются; /undo помечает запись отмененной (undone_at) и вычитает ее из итога
+ENTRY_KINDS = {
+    'water': ('water_entries', 'logged_water', 'amount'),
+    'food': ('food_entries', 'logged_calories', 'calories'),
+    'workout': ('workout_entries', 'burned_calories', 'calories'),
+}
+
+def _today():
+    #Совпадает с date('now') в SQLite (UTC)
+    return datetime.datetime.now(datetime.timezone.utc).date().isoformat()
 
 class Database:
-    def __init__(self, db_path: str = "users.db"):
+    def __init__(self, db_path: str = "users.db", readers: int = 4, write_behind: bool = False,
+                 flush_interval_ms: int = 200, flush_max_ops: int = 500,
+                 user_cache_size: int = 100000, user_cache_ttl: float = 3600, user_negative_ttl: float = 60):
         self.db_path = db_path
+        self.readers = readers
+        self._writer = None
+        self._reader_pool = None
+        self._reader_conns = []
+        self._write_lock = asyncio.Lock()
+        self._connect_lock = asyncio.Lock()
+        self.commits = 0
+
+        #Отложенная запись: приращения копятся в памяти по (user_id, date) и сбрасываются одной транзакцией
+        #не реже раза в flush_interval_ms (окно потери данных при падении) или после flush_max_ops операций
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_max_ops = flush_max_ops
+        self._pending = {}
+        self._pending_entries = [] #(таблица, колонки, значения) записей, ожидающих сброса вместе с итогами
+        self._pending_ops = 0
+        self._flush_event = asyncio.Event()
+        self._flush_task = None
+
+        #Кэш профилей: профиль почти не меняется после сохранения, а читается в каждой команде.
+        #Отсутствие профиля тоже кэшируем (на меньший срок), чтобы незарегистрированные пользователи не ходили в БД
+        self.user_cache = TTLCache(maxsize=user_cache_size, ttl=user_cache_ttl)
+        self.user_negative_ttl = user_negative_ttl
+        self._users_version = 0
+
+    async def _open(self, read_only: bool = False):
+        conn = await aiosqlite.connect(self.db_path, cached_statements=STATEMENT_CACHE_SIZE)
+        for pragma in PRAGMAS:
+            await conn.execute(pragma)
+        if read_only:
+            await conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    async def connect(self):
+        #Открываем пул один раз: одно соединение на запись и несколько на чтение
+        async with self._connect_lock:
+            if self._writer is not None:
+                return
+            self._writer = await self._open()
+            self._reader_pool = asyncio.Queue()
+            for _ in range(self.readers):
+                conn = await self._open(read_only=True)
+                self._reader_conns.append(conn)
+                self._reader_pool.put_nowait(conn)
+            if self.write_behind:
+                self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        if self._writer is not None:
+            await self.flush() #не теряем накопленные приращения при остановке
+
+        async with self._connect_lock:
+            for conn in self._reader_conns:
+                await conn.close()
+            self._reader_conns = []
+            self._reader_pool = None
+            if self._writer is not None:
+                await self._writer.close()
+                self._writer = None
+
+    @asynccontextmanager
+    async def _write(self):
+        #Все записи идут через единственное соединение, транзакция фиксируется при выходе
+        if self._writer is None:
+            await self.connect()
+        async with track('db'), self._write_lock:
+            try:
+                yield self._writer
+                await self._writer.commit()
+                self.commits += 1
+            except BaseException:
+                await self._writer.rollback()
+                raise
+
+    @asynccontextmanager
+    async def _read(self):
+        if self._writer is None:
+            await self.connect()
+        async with track('db'):
+            conn = await self._reader_pool.get()
+            try:
+                yield conn
+            finally:
+                self._reader_pool.put_nowait(conn)
+
+    @asynccontextmanager
+    async def _read_logs(self):
+        #В режиме отложенной записи логи читаем под блокировкой писателя: так сброс буфера
+        #не может произойти между чтением из БД и добавлением еще не записанных приращений
+        if not self.write_behind:
+            async with self._read() as db:
+                yield db
+            return
+        if self._writer is None:
+            await self.connect()
+        async with track('db'), self._write_lock:
+            yield self._writer
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Ошибка записи логов в БД: %s", e)
+
+    async def flush(self):
+        #Сбрасываем все накопленные приращения одной транзакцией
+        async with self._write_lock:
+            if not self._pending and not self._pending_entries:
+                return
+            batch, self._pending = self._pending, {}
+            entries, self._pending_entries = self._pending_entries, []
+            self._pending_ops = 0
+            try:
+                #Записи и итоги попадают в БД одной транзакцией, поэтому итог всегда равен сумме записей
+                groups = {}
+                for table, columns, values in entries:
+                    groups.setdefault((table, columns), []).append(values)
+                for (table, columns), rows in groups.items():
+                    await self._writer.executemany(
+                        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows
+                    )
+                await self._writer.executemany(
+                    """
+                    INSERT INTO logs (user_id, date, logged_water, logged_calories, burned_calories)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(user_id, date) DO UPDATE SET
+                        logged_water = logged_water + excluded.logged_water,
+                        logged_calories = logged_calories + excluded.logged_calories,
+                        burned_calories = burned_calories + excluded.burned_calories
+                    """,
+                    [(user_id, date, *deltas) for (user_id, date), deltas in batch.items()]
+                )
+                await self._writer.commit()
+                self.commits += 1
+            except BaseException:
+                await self._writer.rollback()
+                #Возвращаем несохраненные приращения в буфер, чтобы повторить при следующем сбросе
+                for key, deltas in batch.items():
+                    pending = self._pending.setdefault(key, [0, 0, 0])
+                    for i, delta in enumerate(deltas):
+                        pending[i] += delta
+                self._pending_entries[:0] = entries
+                raise
+
+    def _add_pending(self, user_id: int, date: str, field: str, delta):
+        pending = self._pending.setdefault((user_id, date), [0, 0, 0])
+        pending[LOG_FIELDS.index(field)] += delta
+        self._pending_ops += 1
+        if self._pending_ops >= self.flush_max_ops:
+            self._flush_event.set()
+
+    def _apply_pending(self, user_id: int, date: str, logs: Dict[str, Any]):
+        pending = self._pending.get((user_id, date))
+        if pending is not None:
+            for field, delta in zip(LOG_FIELDS, pending):
+                logs[field] = (logs.get(field) or 0) + delta
+        return logs
 
     async def create_tables(self):
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._write() as db:
+            #Схема создается и переносится одной транзакцией: воркеры, стартующие одновременно, ждут друг друга
+            await db.execute("BEGIN IMMEDIATE")
             #Профили пользователей
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS users (
@@ -19,32 +226,174 @@ class Database:
                     city TEXT,
                     water_goal INTEGER,
                     calorie_goal REAL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    calorie_goal_custom INTEGER DEFAULT 0
                 )
             """)
+            await self._migrate_users(db)
 
-            #Логи
+            #Логи: одна строка на пользователя и день. Первичный ключ (user_id, date) в таблице без rowid
+            #хранит строки упорядоченно по пользователю и дате, так что выборка за день или неделю -
+            #один проход по соседним записям без обращения к таблице по индексу
+            await self._migrate_logs(db)
             await db.execute("""
             CREATE TABLE IF NOT EXISTS logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
+                user_id INTEGER NOT NULL,
+                date DATE NOT NULL DEFAULT CURRENT_DATE,
                 logged_water INTEGER DEFAULT 0,
                 logged_calories REAL DEFAULT 0,
                 burned_calories REAL DEFAULT 0,
-                date DATE DEFAULT CURRENT_DATE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
+                PRIMARY KEY (user_id, date)
+            ) WITHOUT ROWID
+            """)
+            #По дате: активные пользователи для ежедневного перехода и старые дни для сжатия
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_logs_date ON logs (date)")
+
+            #Отдельные записи воды, еды и тренировок; итоги за день в logs поддерживаются вместе с ними
+            await db.execute("""
+            CREATE TABLE IF NOT EXISTS water_entries (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                date DATE NOT NULL,
+                amount INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                undone_at REAL
+            )
+            """)
+            await db.execute("""
+            CREATE TABLE IF NOT EXISTS food_entries (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                date DATE NOT NULL,
+                name TEXT,
+                grams REAL,
+                calories REAL NOT NULL,
+                created_at REAL NOT NULL,
+                undone_at REAL
             )
             """)
-            await db.commit()
+            await db.execute("""
+            CREATE TABLE IF NOT EXISTS workout_entries (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                date DATE NOT NULL,
+                workout_type TEXT,
+                minutes INTEGER,
+                calories REAL NOT NULL,
+                created_at REAL NOT NULL,
+                undone_at REAL
+            )
+            """)
+            for table, _, _ in ENTRY_KINDS.values():
+                #Записи пользователя за день по времени (для /undo) и по дате (для сжатия старых дней)
+                await db.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_user_date ON {table} (user_id, date, created_at)")
+                await db.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_date ON {table} (date)")
+
+            #Итоги по месяцам для дней старше срока хранения (см. compact_logs); days - дни с записями
+            await db.execute("""
+            CREATE TABLE IF NOT EXISTS logs_monthly (
+                user_id INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                days INTEGER DEFAULT 0,
+                logged_water INTEGER DEFAULT 0,
+                logged_calories REAL DEFAULT 0,
+                burned_calories REAL DEFAULT 0,
+                PRIMARY KEY (user_id, month)
+            ) WITHOUT ROWID
+            """)
+
+            #Напоминания: kind - water/summary, at_minute - минута суток по UTC, sent_on - дата последней отправки.
+            #Индекс по at_minute - 1440 ячеек на сутки: за тик читаются только наступившие минуты
+            await db.execute("""
+            CREATE TABLE IF NOT EXISTS reminders (
+                user_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                at_minute INTEGER NOT NULL,
+                sent_on TEXT,
+                PRIMARY KEY (user_id, kind, at_minute)
+            ) WITHOUT ROWID
+            """)
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders (at_minute)")
+
+            #Соревнования: сумма logged_water или burned_calories участника за [start_date, end_date].
+            #Очки не хранятся - они считаются из logs при старте и дальше обновляются в памяти (см. challenges.py)
+            await db.execute("""
+            CREATE TABLE IF NOT EXISTS challenges (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                owner_id INTEGER NOT NULL,
+                start_date TEXT NOT NULL,
+                end_date TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """)
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_challenges_end ON challenges (end_date)")
+            await db.execute("""
+            CREATE TABLE IF NOT EXISTS challenge_members (
+                challenge_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                name TEXT,
+                joined_at REAL NOT NULL,
+                PRIMARY KEY (challenge_id, user_id)
+            ) WITHOUT ROWID
+            """)
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_challenge_members_user ON challenge_members (user_id)")
+
+            #Кэш поиска продуктов по нормализованному названию.
+            #calories = NULL - продукт не найден (отрицательный результат), source: api/user/miss
+            await db.execute("""
+            CREATE TABLE IF NOT EXISTS food_cache (
+                key TEXT PRIMARY KEY,
+                name TEXT,
+                calories REAL,
+                source TEXT NOT NULL,
+                hits INTEGER DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+            """)
+
+    async def _migrate_logs(self, db):
+        #Старая таблица логов (id AUTOINCREMENT, без уникальности по дню) переносится в новую.
+        #Дубликаты за один день, накопленные повторным сохранением профиля, сливаются по максимуму
+        async with db.execute("SELECT name FROM pragma_table_info('logs')") as cursor:
+            columns = {row[0] for row in await cursor.fetchall()}
+        if 'id' not in columns:
+            return
+        await db.execute("""
+            CREATE TABLE logs_new (
+                user_id INTEGER NOT NULL,
+                date DATE NOT NULL DEFAULT CURRENT_DATE,
+                logged_water INTEGER DEFAULT 0,
+                logged_calories REAL DEFAULT 0,
+                burned_calories REAL DEFAULT 0,
+                PRIMARY KEY (user_id, date)
+            ) WITHOUT ROWID
+        """)
+        await db.execute("""
+            INSERT INTO logs_new (user_id, date, logged_water, logged_calories, burned_calories)
+            SELECT user_id, date, MAX(logged_water), MAX(logged_calories), MAX(burned_calories)
+            FROM logs WHERE user_id IS NOT NULL AND date IS NOT NULL
+            GROUP BY user_id, date
+        """)
+        await db.execute("DROP TABLE logs")
+        await db.execute("ALTER TABLE logs_new RENAME TO logs")
+
+    async def _migrate_users(self, db):
+        #calorie_goal_custom - цель по калориям введена вручную и не пересчитывается (см. energy_model.py)
+        async with db.execute("SELECT name FROM pragma_table_info('users')") as cursor:
+            columns = {row[0] for row in await cursor.fetchall()}
+        if 'calorie_goal_custom' not in columns:
+            await db.execute("ALTER TABLE users ADD COLUMN calorie_goal_custom INTEGER DEFAULT 0")
 
     async def save_user(self, user_id: int, data: Dict[str, Any]):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
+        async with self._write() as db:
+            async with db.execute(
                 """
-                INSERT OR REPLACE INTO users 
-                (user_id, weight, height, age, gender, activity, city, water_goal, calorie_goal)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                INSERT OR REPLACE INTO users
+                (user_id, weight, height, age, gender, activity, city, water_goal, calorie_goal, calorie_goal_custom)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                RETURNING *
                 """, (
                     user_id,
                     data.get('weight'),
@@ -54,22 +403,32 @@ class Database:
                     data.get('activity'),
                     data.get('city'),
                     data.get('water_goal'),
-                    data.get('calorie_goal')
+                    data.get('calorie_goal'),
+                    int(bool(data.get('calorie_goal_custom')))
                 )
-            )
+            ) as cursor:
+                user = await cursor.fetchone()
+                columns = [column[0] for column in cursor.description]
 
             await db.execute(
                 """
-                INSERT OR REPLACE INTO logs 
+                INSERT OR IGNORE INTO logs
                 (user_id, logged_water, logged_calories, burned_calories, date)
                 VALUES (?, 0, 0, 0, date('now'))
                 """, (user_id,)
             )
 
-            await db.commit()
+        #Сквозная запись: кэш сразу получает сохраненный профиль, а чтения, начатые до записи, его не перезапишут
+        self._users_version += 1
+        self.user_cache.set(user_id, dict(zip(columns, user)))
 
     async def get_user(self, user_id: int):
-        async with aiosqlite.connect(self.db_path) as db:
+        user = self.user_cache.get(user_id)
+        if user is not MISS:
+            return user
+
+        version = self._users_version
+        async with self._read() as db:
             #Получаем данные о пользователе
             async with db.execute(
                 "SELECT * FROM users WHERE user_id = ?", (user_id,)
@@ -77,50 +436,200 @@ class Database:
                 user = await cursor.fetchone()
                 if user is not None:
                     columns = [column[0] for column in cursor.description]
-                    return dict(zip(columns, user))
-        return None
+                    user = dict(zip(columns, user))
+
+        if version == self._users_version:
+            if user is not None:
+                self.user_cache.set(user_id, user)
+            elif self.user_negative_ttl > 0:
+                self.user_cache.set(user_id, None, ttl=self.user_negative_ttl)
+        return user
+
+    async def iter_users(self, batch: int = 10000):
+        #Профили пачками по возрастанию user_id (для пересчета целей); соединение не держится между пачками
+        last_id = -2**63
+        while True:
+            async with self._read() as db:
+                async with db.execute(
+                    "SELECT * FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                    (last_id, batch)
+                ) as cursor:
+                    rows = await cursor.fetchall()
+                    columns = [column[0] for column in cursor.description]
+            if not rows:
+                return
+            yield [dict(zip(columns, row)) for row in rows]
+            last_id = rows[-1][0]
+
+    async def get_user_cities(self):
+        #{город как в профиле: число пользователей}
+        async with self._read() as db:
+            async with db.execute("SELECT city, COUNT(*) FROM users WHERE city IS NOT NULL GROUP BY city") as cursor:
+                return dict(await cursor.fetchall())
+
+    async def update_user_goals(self, goals, calories: bool = True):
+        #goals - [(user_id, water_goal, calorie_goal, прежняя water_goal, прежняя calorie_goal)]; все изменения одной транзакцией.
+        #Цели пересчитаны по снимку профиля: строка обновляется, только если цели с тех пор не менялись,
+        #иначе профиль, сохраненный во время пересчета, был бы перезаписан устаревшими значениями.
+        #Без calories пишется только water_goal. Возвращает число обновленных профилей
+        goals = list(goals)
+        if not goals:
+            return 0
+        async with self._write() as db:
+            if calories:
+                cursor = await db.executemany(
+                    """
+                    UPDATE users SET water_goal = ?, calorie_goal = ?
+                    WHERE user_id = ? AND water_goal IS ? AND calorie_goal IS ?
+                    """,
+                    [(water_goal, calorie_goal, user_id, old_water, old_calories)
+                     for user_id, water_goal, calorie_goal, old_water, old_calories in goals]
+                )
+            else:
+                cursor = await db.executemany(
+                    "UPDATE users SET water_goal = ? WHERE user_id = ? AND water_goal IS ?",
+                    [(water_goal, user_id, old_water) for user_id, water_goal, _, old_water, _ in goals]
+                )
+            updated = cursor.rowcount
+        self._users_version += 1
+        for goal in goals:
+            self.user_cache.pop(goal[0])
+        return updated
 
     async def get_today_logs(self, user_id: int):
-        async with aiosqlite.connect(self.db_path) as db:
+        date = _today()
+        async with self._read_logs() as db:
             async with db.execute(
-                "SELECT logged_water, logged_calories, burned_calories FROM logs WHERE user_id = ? AND date = date('now')",
-                (user_id,)
+                "SELECT logged_water, logged_calories, burned_calories FROM logs WHERE user_id = ? AND date = ?",
+                (user_id, date)
             ) as cursor:
                 result = await cursor.fetchone()
                 columns = [column[0] for column in cursor.description]
-                return dict(zip(columns, result))
+            #Строки за новый день может еще не быть (она создается первой записью или переходом дня)
+            logs = dict(zip(columns, result or (0, 0, 0)))
+            if not self.write_behind:
+                return logs
+            return self._apply_pending(user_id, date, logs)
 
-    async def log_water(self, logged_water: int, user_id: int):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "UPDATE logs SET logged_water = ? WHERE user_id = ? AND date = date('now')", 
-                (logged_water, user_id)
-            )
-            await db.commit()
+    async def _increment(self, field: str, user_id: int, delta, date: Optional[str] = None, entries: Optional[tuple] = None):
+        #entries - (таблица, [{колонка: значение}, ...]) записи, которые добавляются вместе с приращением итога
+        if entries is not None:
+            date = date or _today()
+            table, items = entries
+            created_at = time.time()
+            columns = ('user_id', 'date', 'created_at', *items[0])
+            entry_rows = [(user_id, date, created_at, *item.values()) for item in items]
 
-    async def log_calories(self, logged_calories: float, user_id: int):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "UPDATE logs SET logged_calories = ? WHERE user_id = ? AND date = date('now')",
-                (logged_calories, user_id)
-            )
-            await db.commit()
+        if self.write_behind:
+            date = date or _today()
+            if entries is not None:
+                self._pending_entries.extend((table, columns, row) for row in entry_rows)
+            self._add_pending(user_id, date, field, delta)
+            async with self._read_logs() as db:
+                async with db.execute(
+                    "SELECT logged_water, logged_calories, burned_calories FROM logs WHERE user_id = ? AND date = ?",
+                    (user_id, date)
+                ) as cursor:
+                    result = await cursor.fetchone()
+                logs = dict(zip(LOG_FIELDS, result or (0, 0, 0)))
+                return self._apply_pending(user_id, date, logs)
 
-    async def log_workout(self, burned_calories: float, user_id: int):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "UPDATE logs SET burned_calories = ? WHERE user_id = ? AND date = date('now')",
-                (burned_calories, user_id)
-            )
-            await db.commit()
+        #Один запрос: создаем строку дня, если ее нет, либо прибавляем к счетчику
+        async with self._write() as db:
+            if entries is not None:
+                await db.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", entry_rows
+                )
+            async with db.execute(
+                f"""
+                INSERT INTO logs (user_id, date, {field})
+                VALUES (?, COALESCE(?, date('now')), ?)
+                ON CONFLICT(user_id, date) DO UPDATE SET {field} = {field} + excluded.{field}
+                RETURNING logged_water, logged_calories, burned_calories
+                """,
+                (user_id, date, delta)
+            ) as cursor:
+                result = await cursor.fetchone()
+                columns = [column[0] for column in cursor.description]
+        return dict(zip(columns, result))
+
+    async def increment_water(self, user_id: int, delta: int, date: Optional[str] = None):
+        return await self._increment('logged_water', user_id, delta, date)
+
+    async def increment_calories(self, user_id: int, delta: float, date: Optional[str] = None):
+        return await self._increment('logged_calories', user_id, delta, date)
+
+    async def increment_burned(self, user_id: int, delta: float, date: Optional[str] = None):
+        return await self._increment('burned_calories', user_id, delta, date)
+
+    async def log_water(self, user_id: int, amount: int):
+        entries = ('water_entries', [{'amount': amount}])
+        return await self._increment('logged_water', user_id, amount, entries=entries)
+
+    async def log_food(self, user_id: int, name: str, grams: float, calories: float):
+        return await self.log_foods(user_id, [(name, grams, calories)])
+
+    async def log_foods(self, user_id: int, items):
+        #Несколько продуктов одного приема пищи: все записи и итог за день - одной транзакцией
+        entries = ('food_entries', [{'name': name, 'grams': grams, 'calories': calories} for name, grams, calories in items])
+        total = round(sum(calories for _, _, calories in items), 1)
+        return await self._increment('logged_calories', user_id, total, entries=entries)
+
+    async def log_workout(self, user_id: int, workout_type: str, minutes: int, calories: float):
+        entries = ('workout_entries', [{'workout_type': workout_type, 'minutes': minutes, 'calories': calories}])
+        return await self._increment('burned_calories', user_id, calories, entries=entries)
+
+    async def undo_last_entry(self, user_id: int):
+        #Отменяет последнюю сегодняшнюю запись пользователя: запись помечается отмененной,
+        #а из итога дня вычитается ее величина - без пересчета по всем записям.
+        #Возвращает (вид, запись, итоги за день) или None, если отменять нечего.
+        #Продукты одного приема пищи записаны с одинаковым created_at - из них отменяется добавленный последним (по id)
+        if self.write_behind:
+            await self.flush() #запись могла еще не попасть в БД
+        date = _today()
+        latest = " UNION ALL ".join(
+            f"SELECT * FROM (SELECT '{kind}', id, {value}, created_at FROM {table} "
+            f"WHERE user_id = ? AND date = ? AND undone_at IS NULL ORDER BY created_at DESC, id DESC LIMIT 1)"
+            for kind, (table, _, value) in ENTRY_KINDS.items()
+        )
+        async with self._write() as db:
+            #При нескольких воркерах ту же запись может одновременно отменять другой процесс: отменяем, только если
+            #она еще не отменена, иначе берем следующую. После неудачного UPDATE транзакция записи уже открыта,
+            #и повторный выбор видит отмену другого процесса, поэтому цикл делает не больше двух проходов
+            while True:
+                async with db.execute(f"{latest} ORDER BY 4 DESC LIMIT 1", (user_id, date) * len(ENTRY_KINDS)) as cursor:
+                    row = await cursor.fetchone()
+                if row is None:
+                    return None
+                kind, entry_id, value, _ = row
+                table, field, _ = ENTRY_KINDS[kind]
+                async with db.execute(
+                    f"UPDATE {table} SET undone_at = ? WHERE id = ? AND undone_at IS NULL RETURNING *", (time.time(), entry_id)
+                ) as cursor:
+                    entry = await cursor.fetchone()
+                    if entry is not None:
+                        entry = dict(zip([column[0] for column in cursor.description], entry))
+                        break
+            async with db.execute(
+                f"""
+                UPDATE logs SET {field} = {field} - ? WHERE user_id = ? AND date = ?
+                RETURNING logged_water, logged_calories, burned_calories
+                """,
+                (value, user_id, date)
+            ) as cursor:
+                totals = dict(zip(LOG_FIELDS, await cursor.fetchone() or (0, 0, 0)))
+            if self.write_behind:
+                #Приращения, накопленные после сброса в начале, в итогах из БД еще не учтены
+                totals = self._apply_pending(user_id, date, totals)
+        return kind, entry, totals
 
     async def get_weekly_logs(self, user_id: int):
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._read_logs() as db:
             async with db.execute(
                 """
-                SELECT date, logged_water, logged_calories, burned_calories 
-                FROM logs 
-                WHERE user_id = ? AND date >= date('now', '-6 days') 
+                SELECT date, logged_water, logged_calories, burned_calories
+                FROM logs
+                WHERE user_id = ? AND date >= date('now', '-6 days')
                 ORDER BY date
                 """,
                 (user_id,)
@@ -131,4 +640,310 @@ class Database:
             calorie_logs = {row[0]: row[2] for row in weekly_logs}
             burned_logs = {row[0]: row[3] for row in weekly_logs}
 
-            return water_logs, calorie_logs, burned_logs
+            if self.write_behind:
+                week_ago = (datetime.date.fromisoformat(_today()) - datetime.timedelta(days=6)).isoformat()
+                for (pending_user, date), (water, calories, burned) in self._pending.items():
+                    if pending_user == user_id and date >= week_ago:
+                        water_logs[date] = water_logs.get(date, 0) + water
+                        calorie_logs[date] = calorie_logs.get(date, 0) + calories
+                        burned_logs[date] = burned_logs.get(date, 0) + burned
+
+        return water_logs, calorie_logs, burned_logs
+
+    async def get_logs_range(self, user_id: int, start: str, end: str):
+        #Дневные логи пользователя за [start, end] и итоги сжатых месяцев этого периода (см. compact_logs).
+        #Возвращает (строки (date, вода, калории, сожжено) по возрастанию даты, строки (month, days, вода, калории, сожжено))
+        async with self._read_logs() as db:
+            async with db.execute(
+                """
+                SELECT date, logged_water, logged_calories, burned_calories
+                FROM logs
+                WHERE user_id = ? AND date BETWEEN ? AND ?
+                ORDER BY date
+                """,
+                (user_id, start, end)
+            ) as cursor:
+                daily = await cursor.fetchall()
+            async with db.execute(
+                """
+                SELECT month, days, logged_water, logged_calories, burned_calories
+                FROM logs_monthly
+                WHERE user_id = ? AND month BETWEEN ? AND ?
+                ORDER BY month
+                """,
+                (user_id, start[:7], end[:7])
+            ) as cursor:
+                monthly = await cursor.fetchall()
+
+            if self.write_behind:
+                pending = {
+                    date: delta for (pending_user, date), delta in self._pending.items()
+                    if pending_user == user_id and start <= date <= end
+                }
+                if pending:
+                    merged = {row[0]: list(row[1:]) for row in daily}
+                    for date, delta in pending.items():
+                        merged[date] = [a + b for a, b in zip(merged.get(date, (0, 0, 0)), delta)]
+                    daily = [(date, *values) for date, values in sorted(merged.items())]
+
+        return daily, monthly
+
+    async def rollover(self, date: Optional[str] = None, active_days: int = 30):
+        #Переход на новый день: заранее создаем пустые строки дня для пользователей, писавших что-то
+        #за последние active_days дней. Без этого строка появляется при первой записи за день
+        date = date or _today()
+        since = (datetime.date.fromisoformat(date) - datetime.timedelta(days=active_days)).isoformat()
+        async with self._write() as db:
+            cursor = await db.execute(
+                """
+                INSERT OR IGNORE INTO logs (user_id, date)
+                SELECT DISTINCT user_id, ? FROM logs WHERE date >= ? AND date < ?
+                """,
+                (date, since, date)
+            )
+            return cursor.rowcount
+
+    async def compact_logs(self, retention_days: int = 90):
+        #Дни старше retention_days сворачиваются в итоги по месяцам, отдельные записи за эти дни удаляются. Каждый день - отдельная транзакция,
+        #чтобы не держать блокировку записи надолго. Неделя для графика прогресса всегда остается подробной
+        if self.write_behind:
+            await self.flush()
+        cutoff = (datetime.date.fromisoformat(_today()) - datetime.timedelta(days=max(retention_days, 7))).isoformat()
+        async with self._read() as db:
+            async with db.execute("SELECT DISTINCT date FROM logs WHERE date < ? ORDER BY date", (cutoff,)) as cursor:
+                dates = [row[0] for row in await cursor.fetchall()]
+
+        compacted = 0
+        for date in dates:
+            async with self._write() as db:
+                await db.execute(
+                    """
+                    INSERT INTO logs_monthly (user_id, month, days, logged_water, logged_calories, burned_calories)
+                    SELECT user_id, substr(date, 1, 7), 1, logged_water, logged_calories, burned_calories
+                    FROM logs
+                    WHERE date = ? AND (logged_water != 0 OR logged_calories != 0 OR burned_calories != 0)
+                    ON CONFLICT(user_id, month) DO UPDATE SET
+                        days = days + excluded.days,
+                        logged_water = logged_water + excluded.logged_water,
+                        logged_calories = logged_calories + excluded.logged_calories,
+                        burned_calories = burned_calories + excluded.burned_calories
+                    """,
+                    (date,)
+                )
+                cursor = await db.execute("DELETE FROM logs WHERE date = ?", (date,))
+                compacted += cursor.rowcount
+                for table, _, _ in ENTRY_KINDS.values():
+                    await db.execute(f"DELETE FROM {table} WHERE date = ?", (date,))
+        return compacted
+
+    async def set_reminders(self, user_id: int, kind: str, minutes):
+        #Заменяет все напоминания пользователя этого вида; пустой список - выключить
+        async with self._write() as db:
+            await db.execute("DELETE FROM reminders WHERE user_id = ? AND kind = ?", (user_id, kind))
+            await db.executemany(
+                "INSERT INTO reminders (user_id, kind, at_minute) VALUES (?, ?, ?)",
+                [(user_id, kind, minute) for minute in sorted(set(minutes))]
+            )
+
+    async def delete_reminders(self, user_id: int):
+        async with self._write() as db:
+            await db.execute("DELETE FROM reminders WHERE user_id = ?", (user_id,))
+
+    async def get_reminders(self, user_id: int):
+        #{вид: [минуты суток]}
+        async with self._read() as db:
+            async with db.execute(
+                "SELECT kind, at_minute FROM reminders WHERE user_id = ? ORDER BY kind, at_minute", (user_id,)
+            ) as cursor:
+                rows = await cursor.fetchall()
+        reminders = {}
+        for kind, minute in rows:
+            reminders.setdefault(kind, []).append(minute)
+        return reminders
+
+    async def get_due_reminders(self, date: str, from_minute: int, to_minute: int):
+        #Напоминания с минутой в [from_minute, to_minute], еще не отправленные за date, вместе с целями
+        #и итогами дня пользователя - одним запросом на тик вместо get_user/get_today_logs на каждого
+        async with self._read_logs() as db:
+            async with db.execute(
+                """
+                SELECT r.user_id, r.kind, r.at_minute, u.water_goal, u.calorie_goal,
+                       COALESCE(l.logged_water, 0), COALESCE(l.logged_calories, 0), COALESCE(l.burned_calories, 0)
+                FROM reminders r
+                JOIN users u ON u.user_id = r.user_id
+                LEFT JOIN logs l ON l.user_id = r.user_id AND l.date = ?
+                WHERE r.at_minute BETWEEN ? AND ? AND (r.sent_on IS NULL OR r.sent_on < ?)
+                """,
+                (date, from_minute, to_minute, date)
+            ) as cursor:
+                rows = await cursor.fetchall()
+
+            due = []
+            for user_id, kind, minute, water_goal, calorie_goal, *logs in rows:
+                logs = dict(zip(LOG_FIELDS, logs))
+                if self.write_behind:
+                    self._apply_pending(user_id, date, logs)
+                due.append({
+                    'user_id': user_id, 'kind': kind, 'at_minute': minute,
+                    'water_goal': water_goal, 'calorie_goal': calorie_goal, **logs
+                })
+        return due
+
+    async def mark_reminders_sent(self, keys, date: str):
+        #keys - [(user_id, kind, at_minute), ...]
+        async with self._write() as db:
+            await db.executemany(
+                "UPDATE reminders SET sent_on = ? WHERE user_id = ? AND kind = ? AND at_minute = ?",
+                [(date, *key) for key in keys]
+            )
+
+    async def create_challenge(self, name: str, metric: str, owner_id: int, start_date: str, end_date: str):
+        async with self._write() as db:
+            cursor = await db.execute(
+                "INSERT INTO challenges (name, metric, owner_id, start_date, end_date, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (name, metric, owner_id, start_date, end_date, time.time())
+            )
+            return cursor.lastrowid
+
+    async def get_challenges(self, ends_after: str):
+        #Соревнования, закончившиеся не раньше ends_after, - их таблицы держим в памяти
+        async with self._read() as db:
+            async with db.execute(
+                "SELECT id, name, metric, owner_id, start_date, end_date FROM challenges WHERE end_date >= ?", (ends_after,)
+            ) as cursor:
+                rows = await cursor.fetchall()
+                columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in rows]
+
+    async def add_challenge_member(self, challenge_id: int, user_id: int, name: str):
+        #False, если пользователь уже участвует
+        async with self._write() as db:
+            cursor = await db.execute(
+                "INSERT OR IGNORE INTO challenge_members (challenge_id, user_id, name, joined_at) VALUES (?, ?, ?, ?)",
+                (challenge_id, user_id, name, time.time())
+            )
+            return cursor.rowcount > 0
+
+    async def remove_challenge_member(self, challenge_id: int, user_id: int):
+        async with self._write() as db:
+            cursor = await db.execute(
+                "DELETE FROM challenge_members WHERE challenge_id = ? AND user_id = ?", (challenge_id, user_id)
+            )
+            return cursor.rowcount > 0
+
+    async def get_challenge_scores(self, challenge_id: int, field: str, start: str, end: str, user_id: Optional[int] = None):
+        #[(user_id, имя, сумма field за [start, end])] участников (или одного участника) - полный пересчет по logs
+        member_filter = "AND m.user_id = ?" if user_id is not None else ""
+        async with self._read_logs() as db:
+            async with db.execute(
+                f"""
+                SELECT m.user_id, m.name, COALESCE(SUM(l.{field}), 0)
+                FROM challenge_members m
+                LEFT JOIN logs l ON l.user_id = m.user_id AND l.date BETWEEN ? AND ?
+                WHERE m.challenge_id = ? {member_filter}
+                GROUP BY m.user_id
+                """,
+                (start, end, challenge_id) + ((user_id,) if user_id is not None else ())
+            ) as cursor:
+                rows = await cursor.fetchall()
+
+            if self.write_behind and self._pending:
+                index = LOG_FIELDS.index(field)
+                scores = {row[0]: list(row) for row in rows}
+                for (pending_user, date), pending in self._pending.items():
+                    if pending_user in scores and start <= date <= end:
+                        scores[pending_user][2] += pending[index]
+                rows = [tuple(row) for row in scores.values()]
+        return rows
+
+    async def get_cached_food(self, key: str):
+        async with self._read() as db:
+            async with db.execute(
+                "SELECT key, name, calories, source, hits, updated_at FROM food_cache WHERE key = ?", (key,)
+            ) as cursor:
+                row = await cursor.fetchone()
+                if row is None:
+                    return None
+                columns = [column[0] for column in cursor.description]
+                return dict(zip(columns, row))
+
+    async def get_hot_foods(self, limit: int):
+        #Самые востребованные записи кэша - для прогрева при старте
+        async with self._read() as db:
+            async with db.execute(
+                "SELECT key, name, calories, source, hits, updated_at FROM food_cache ORDER BY hits DESC LIMIT ?",
+                (limit,)
+            ) as cursor:
+                rows = await cursor.fetchall()
+                columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in rows]
+
+    async def save_cached_food(self, key: str, name: Optional[str], calories: Optional[float], source: str, updated_at: float):
+        async with self._write() as db:
+            await db.execute(
+                """
+                INSERT INTO food_cache (key, name, calories, source, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    name = excluded.name,
+                    calories = excluded.calories,
+                    source = excluded.source,
+                    updated_at = excluded.updated_at
+                """,
+                (key, name, calories, source, updated_at)
+            )
+
+    async def add_food_hits(self, hits: Dict[str, int]):
+        if not hits:
+            return
+        async with self._write() as db:
+            await db.executemany(
+                "UPDATE food_cache SET hits = hits + ? WHERE key = ?",
+                [(count, key) for key, count in hits.items()]
+            )
+
+    async def create_fsm_table(self):
+        #Состояния FSM (storage.SQLiteStorage): таблица создается, только если хранилище состояний - SQLite
+        async with self._write() as db:
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS fsm_states (
+                    key TEXT PRIMARY KEY,
+                    state TEXT,
+                    data TEXT NOT NULL DEFAULT '{}',
+                    updated_at REAL NOT NULL
+                )
+            """)
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_fsm_states_updated ON fsm_states (updated_at)")
+
+    async def get_fsm_state(self, key: str, updated_after: float):
+        #(state, data в JSON, updated_at) или None, если записи нет или она старше updated_after
+        async with self._read() as db:
+            async with db.execute(
+                "SELECT state, data, updated_at FROM fsm_states WHERE key = ? AND updated_at >= ?",
+                (key, updated_after)
+            ) as cursor:
+                return await cursor.fetchone()
+
+    async def save_fsm_states(self, upserts, deletes):
+        #upserts - [(key, state, data в JSON, updated_at)], deletes - [key]; одной транзакцией
+        async with self._write() as db:
+            if upserts:
+                await db.executemany(
+                    """
+                    INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                        state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+                    """,
+                    upserts
+                )
+            if deletes:
+                await db.executemany("DELETE FROM fsm_states WHERE key = ?", [(key,) for key in deletes])
+
+    async def purge_fsm_states(self, updated_before: float):
+        async with self._write() as db:
+            cursor = await db.execute("DELETE FROM fsm_states WHERE updated_at < ?", (updated_before,))
+            return cursor.rowcount
+
+    def stats(self):
+        #Для /metrics: коммиты, приращения логов, ожидающие отложенной записи, и кэш профилей
+        return {'commits': self.commits, 'pending_logs': len(self._pending), 'user_cache': self.user_cache.stats()}
@@ -0,0 +1,253 @@
+import argparse
+import asyncio
+import bisect
+import csv
+import difflib
+import functools
+import logging
+import os
+import time
+from types import MappingProxyType
+from typing import Mapping, Optional
+from food_index import normalize_food_name
+
+logger = logging.getLogger(__name__)
+
+#Расчет норм калорий и воды и расхода энергии на тренировках.
+#MET (метаболический эквивалент) берется из справочника met_compendium.csv (по мотивам Compendium of Physical
+#Activities): вид активности, интенсивность light/moderate/vigorous, MET и синонимы через "|".
+#Справочник читается один раз в неизменяемый индекс; название тренировки ищется по синонимам, а при опечатке -
+#нечетким сравнением среди кандидатов с общими триграммами.
+#Пересчет целей всех пользователей после смены формулы: python energy_model.py recompute [--db users.db] [--formula katch_mcardle]
+#(работающий бот увидит новые цели после истечения USER_CACHE_TTL)
+
+DEFAULT_COMPENDIUM = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'met_compendium.csv')
+INTENSITIES = ('light', 'moderate', 'vigorous')
+INTENSITY_LABELS = {'light': 'низкая', 'moderate': 'умеренная', 'vigorous': 'высокая'}
+DEFAULT_MET = 5.0 #для тренировок, которых нет в справочнике
+#Слова интенсивности в названии тренировки ("бег быстро", "легкая йога"); сравниваются начала нормализованных слов
+INTENSITY_WORDS = {
+    'light': ('legk', 'medl', 'spokoy', 'nespesh', 'light', 'easy', 'slow'),
+    'moderate': ('umerenn', 'sredn', 'moderat', 'medium'),
+    'vigorous': ('bystr', 'intensivn', 'tyazhel', 'aktivn', 'vigor', 'intens', 'hard', 'fast'),
+}
+FUZZY_CUTOFF = 0.75 #минимальное сходство (difflib) для нечеткого совпадения
+FUZZY_CANDIDATES = 20 #сколько названий с наибольшим числом общих триграмм сравнивать подробно
+MATCH_CACHE_SIZE = 4096
+
+#Коэффициент активности по минутам активности в день: до 30, до 60, до 90, до 120 и больше
+ACTIVITY_THRESHOLDS = (30, 60, 90, 120)
+ACTIVITY_FACTORS = (1.2, 1.375, 1.55, 1.725, 1.9)
+
+#Формулы основного обмена (ккал/день): имя -> функция (weight, height, age, gender)
+BMR_FORMULAS = {}
+
+def bmr_formula(name: str):
+    def register(func):
+        BMR_FORMULAS[name] = func
+        return func
+    return register
+
+def _is_male(gender: str):
+    return gender == 'М'
+
+@bmr_formula('mifflin')
+def mifflin_st_jeor(weight: float, height: float, age: int, gender: str):
+    return 10 * weight + 6.25 * height - 5 * age + (5 if _is_male(gender) else -161)
+
+@bmr_formula('harris_benedict')
+def harris_benedict(weight: float, height: float, age: int, gender: str):
+    #Уточненная формула (Roza, Shizgal 1984)
+    if _is_male(gender):
+        return 88.362 + 13.397 * weight + 4.799 * height - 5.677 * age
+    return 447.593 + 9.247 * weight + 3.098 * height - 4.330 * age
+
+def body_fat_percent(weight: float, height: float, age: int, gender: str):
+    #Оценка доли жира по индексу массы тела (Deurenberg), отдельная формула для детей и подростков
+    bmi = weight / (height / 100) ** 2
+    male = _is_male(gender)
+    if age < 16:
+        percent = 1.51 * bmi - 0.70 * age - 3.6 * male + 1.4
+    else:
+        percent = 1.2 * bmi + 0.23 * age - 10.8 * male - 5.4
+    return min(max(percent, 3.0), 60.0)
+
+@bmr_formula('katch_mcardle')
+def katch_mcardle(weight: float, height: float, age: int, gender: str):
+    #По безжировой массе; процент жира в профиле не хранится, поэтому он оценивается по ИМТ
+    lean_mass = weight * (1 - body_fat_percent(weight, height, age, gender) / 100)
+    return 370 + 21.6 * lean_mass
+
+def activity_factor(activity: int):
+    return ACTIVITY_FACTORS[bisect.bisect_right(ACTIVITY_THRESHOLDS, activity)]
+
+def calculate_water_goal(weight: int, activity: int, temperature: Optional[float]):
+    hot = temperature is not None and temperature > 25 #без данных о погоде надбавку за жару не начисляем
+    water_goal = 30 * weight + 500 * (activity / 30) + 500 * hot
+    return int(water_goal)
+
+def _trigrams(text: str):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class Compendium:
+    #Неизменяемый индекс справочника MET. Строится один раз (см. load_compendium) и используется всеми запросами
+    def __init__(self, path: str = DEFAULT_COMPENDIUM):
+        activities = {} #ключ -> {интенсивность: MET}
+        names = {} #ключ -> название для ответа
+        aliases = {} #нормализованный синоним -> ключ
+        with open(path, encoding='utf-8', newline='') as file:
+            for row in csv.DictReader(file):
+                name = row['activity'].strip()
+                key = normalize_food_name(name)
+                if key not in activities:
+                    activities[key] = {}
+                    names[key] = name
+                    aliases.setdefault(key, key)
+                intensity = row['intensity'].strip() or 'moderate'
+                if intensity not in INTENSITIES:
+                    raise ValueError(f"{path}: неизвестная интенсивность '{intensity}' у '{name}'")
+                activities[key][intensity] = float(row['met'])
+                for synonym in filter(None, (row['synonyms'] or '').split('|')):
+                    aliases.setdefault(normalize_food_name(synonym), key)
+
+        self.activities = MappingProxyType({key: MappingProxyType(levels) for key, levels in activities.items()})
+        self.names = MappingProxyType(names)
+        self.aliases = MappingProxyType(aliases)
+        #Перечень видов в порядке справочника: частые тренировки идут первыми
+        self.ordered = tuple(names.values())
+        trigram_index = {}
+        for alias in aliases:
+            for trigram in _trigrams(alias):
+                trigram_index.setdefault(trigram, []).append(alias)
+        self._trigram_index = MappingProxyType({trigram: tuple(items) for trigram, items in trigram_index.items()})
+        self.match = functools.lru_cache(maxsize=MATCH_CACHE_SIZE)(self._match)
+
+    def __len__(self):
+        return len(self.activities)
+
+    def _fuzzy(self, query: str):
+        counts = {}
+        for trigram in _trigrams(query):
+            for alias in self._trigram_index.get(trigram, ()):
+                counts[alias] = counts.get(alias, 0) + 1
+        candidates = sorted(counts, key=counts.get, reverse=True)[:FUZZY_CANDIDATES]
+        matches = difflib.get_close_matches(query, candidates, n=1, cutoff=FUZZY_CUTOFF)
+        return matches[0] if matches else None
+
+    def _match(self, text: str):
+        #Тренировка по тексту пользователя: {'activity', 'intensity', 'met', 'exact', 'variable'} или None
+        normalized = normalize_food_name(text)
+        intensity = None
+        exact = True
+        key = self.aliases.get(normalized) #"тяжелая атлетика" - название, а не интенсивность
+        if key is None:
+            rest = []
+            for word in normalized.split():
+                level = next((level for level, prefixes in INTENSITY_WORDS.items() if word.startswith(prefixes)), None)
+                if level is not None and intensity is None:
+                    intensity = level
+                else:
+                    rest.append(word)
+            query = ' '.join(rest)
+            if not query:
+                return None
+            key = self.aliases.get(query)
+            if key is None:
+                alias = self._fuzzy(query)
+                if alias is None:
+                    return None
+                key = self.aliases[alias]
+                exact = False
+
+        levels = self.activities[key]
+        if intensity not in levels:
+            #Без указания (или если такого уровня нет) - умеренная, а при ее отсутствии ближайшая к ней
+            intensity = 'moderate' if 'moderate' in levels else min(levels, key=lambda level: abs(INTENSITIES.index(level) - 1))
+        return {'activity': self.names[key], 'intensity': intensity, 'met': levels[intensity], 'exact': exact,
+                'variable': len(levels) > 1}
+
+@functools.lru_cache(maxsize=None)
+def load_compendium(path: str = DEFAULT_COMPENDIUM):
+    start = time.perf_counter()
+    compendium = Compendium(path)
+    logger.info("Справочник MET: %d видов активности, %d названий, %.0f мс",
+                len(compendium), len(compendium.aliases), (time.perf_counter() - start) * 1000)
+    return compendium
+
+class EnergyModel:
+    def __init__(self, formula: str = 'mifflin', compendium_path: str = DEFAULT_COMPENDIUM):
+        if formula not in BMR_FORMULAS:
+            raise ValueError(f"Неизвестная формула основного обмена: {formula}. Доступны: {', '.join(BMR_FORMULAS)}")
+        self.formula = formula
+        self._bmr = BMR_FORMULAS[formula]
+        self.compendium = load_compendium(compendium_path)
+
+    def calorie_goal(self, weight: int, height: int, age: int, gender: str, activity: int):
+        return self._bmr(weight, height, age, gender) * activity_factor(activity)
+
+    def water_goal(self, weight: int, activity: int, temperature: Optional[float]):
+        return calculate_water_goal(weight, activity, temperature)
+
+    def match_activity(self, workout_type: str):
+        return self.compendium.match(workout_type.strip().lower())
+
+    def workout_calories(self, workout_type: str, duration: int, weight: int):
+        #Возвращает (ккал, найденная тренировка или None - тогда считается по DEFAULT_MET)
+        match = self.match_activity(workout_type)
+        met = match['met'] if match is not None else DEFAULT_MET
+        return round(met * weight * (duration / 60), 1), match
+
+    def examples(self, count: int = 10):
+        return self.compendium.ordered[:count]
+
+    def recompute_goals(self, users, temperatures: Optional[Mapping[str, Optional[float]]] = None, calories: bool = True):
+        #Пересчет целей для пачки профилей за один проход; выдает (user_id, water_goal, calorie_goal, прежняя water_goal,
+        #прежняя calorie_goal) только для изменившихся.
+        #temperatures - температура по городу профиля; без нее норма воды не пересчитывается.
+        #Цель по калориям (если calories) пересчитывается, кроме введенной пользователем вручную (calorie_goal_custom)
+        for user in users:
+            water_goal = user['water_goal']
+            if temperatures is not None and user['city'] in temperatures:
+                water_goal = self.water_goal(user['weight'], user['activity'], temperatures[user['city']])
+            calorie_goal = user['calorie_goal']
+            if calories and not user.get('calorie_goal_custom'):
+                calorie_goal = self.calorie_goal(user['weight'], user['height'], user['age'], user['gender'], user['activity'])
+            if water_goal != user['water_goal'] or calorie_goal is None or abs(calorie_goal - (user['calorie_goal'] or 0)) >= 0.5:
+                yield user['user_id'], water_goal, calorie_goal, user['water_goal'], user['calorie_goal']
+
+async def recompute_all(db, model: EnergyModel, temperatures: Optional[Mapping[str, Optional[float]]] = None,
+                        calories: bool = True):
+    #Пересчет по всем профилям пачками; изменения пишутся одной транзакцией. Профили, сохраненные за время
+    #пересчета, не перезаписываются (см. Database.update_user_goals). Возвращает (профилей, изменено)
+    users = 0
+    changed = []
+    async for batch in db.iter_users():
+        users += len(batch)
+        changed.extend(model.recompute_goals(batch, temperatures, calories))
+    return users, await db.update_user_goals(changed, calories)
+
+def main():
+    from database import Database
+    parser = argparse.ArgumentParser(description="Пересчет норм калорий по выбранной формуле для всех пользователей")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    recompute_parser = subparsers.add_parser('recompute', help="пересчитать цели по калориям")
+    recompute_parser.add_argument('--db', default='users.db')
+    recompute_parser.add_argument('--formula', choices=sorted(BMR_FORMULAS), default='mifflin')
+    recompute_parser.add_argument('--compendium', default=DEFAULT_COMPENDIUM)
+    args = parser.parse_args()
+
+    async def run():
+        db = Database(args.db, readers=1)
+        try:
+            await db.create_tables()
+            start = time.perf_counter()
+            users, changed = await recompute_all(db, EnergyModel(args.formula, args.compendium))
+            print(f"Профилей: {users}, изменено: {changed}, время: {time.perf_counter() - start:.1f} с")
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import argparse
+import asyncio
+import csv
+import gzip
+import io
+import json
+import logging
+import sqlite3
+import time
+import zipfile
+from typing import Optional
+from database import Database, ENTRY_KINDS
+
+logger = logging.getLogger(__name__)
+
+#Выгрузка и загрузка истории пользователей (users, logs, итоги сжатых месяцев и отдельные записи).
+#Строки читаются курсором пачками по BATCH (fetchmany) и сразу пишутся в файл, поэтому память
+#не зависит от размера таблицы. Форматы:
+#  csv      - zip с отдельным CSV на каждую таблицу
+#  jsonl    - строка JSON на каждую строку таблицы (поле _table), gzip
+#  columnar - по столбцам: на каждую пачку строк одна запись {"table", "columns", "data": [столбец, ...]},
+#             как группы строк в Parquet, gzip
+#Выгрузка: python export.py export backup.jsonl.gz [--db users.db] [--user 123] [--format jsonl]
+#Загрузка на другом экземпляре: python export.py import backup.jsonl.gz [--db users.db] (бот должен быть остановлен)
+
+TABLES = ('users', 'logs', 'logs_monthly') + tuple(table for table, _, _ in ENTRY_KINDS.values())
+#У записей собственный id: при загрузке в другую базу он назначается заново
+AUTO_ID_TABLES = tuple(table for table, _, _ in ENTRY_KINDS.values())
+FORMATS = ('csv', 'jsonl', 'columnar')
+EXTENSIONS = {'csv': '.zip', 'jsonl': '.jsonl.gz', 'columnar': '.columnar.jsonl.gz'}
+BATCH = 5000
+IMPORT_BATCH = 50000
+#Строк на транзакцию при загрузке: большие транзакции быстрее, но дольше держат блокировку записи
+IMPORT_TRANSACTION_ROWS = 500000
+
+def iter_table(conn: sqlite3.Connection, table: str, user_id: Optional[int] = None, batch: int = BATCH):
+    #Первым выдает список столбцов, дальше - пачки строк
+    query = f"SELECT * FROM {table}"
+    params = ()
+    if user_id is not None:
+        query += " WHERE user_id = ?"
+        params = (user_id,)
+    cursor = conn.execute(query, params)
+    yield [column[0] for column in cursor.description]
+    while True:
+        rows = cursor.fetchmany(batch)
+        if not rows:
+            break
+        yield rows
+
+def _write_csv(conn, path: str, user_id: Optional[int], batch: int):
+    rows_written = 0
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for table in TABLES:
+            with archive.open(f"{table}.csv", 'w', force_zip64=True) as member:
+                text = io.TextIOWrapper(member, encoding='utf-8', newline='')
+                writer = csv.writer(text)
+                batches = iter_table(conn, table, user_id, batch)
+                writer.writerow(next(batches))
+                for rows in batches:
+                    writer.writerows(rows)
+                    rows_written += len(rows)
+                text.flush()
+                text.detach()
+    return rows_written
+
+def _write_jsonl(conn, path: str, user_id: Optional[int], batch: int, columnar: bool):
+    rows_written = 0
+    with gzip.open(path, 'wt', encoding='utf-8', compresslevel=6) as file:
+        for table in TABLES:
+            batches = iter_table(conn, table, user_id, batch)
+            columns = next(batches)
+            for rows in batches:
+                if columnar:
+                    file.write(json.dumps({'table': table, 'columns': columns, 'data': list(map(list, zip(*rows)))}, ensure_ascii=False))
+                    file.write('\n')
+                else:
+                    file.writelines(
+                        json.dumps({'_table': table, **dict(zip(columns, row))}, ensure_ascii=False) + '\n' for row in rows
+                    )
+                rows_written += len(rows)
+    return rows_written
+
+def export_history(db_path: str, path: str, fmt: str = 'jsonl', user_id: Optional[int] = None, batch: int = BATCH):
+    #Выгрузка всех пользователей или одного user_id; возвращает число строк.
+    #Отдельное соединение только для чтения: в режиме WAL выгрузка видит согласованный снимок и не мешает боту
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        conn.execute("BEGIN") #одна транзакция чтения - один снимок для всех таблиц
+        if fmt == 'csv':
+            return _write_csv(conn, path, user_id, batch)
+        return _write_jsonl(conn, path, user_id, batch, columnar=fmt == 'columnar')
+    finally:
+        conn.close()
+
+def read_history(path: str):
+    #Пачки (таблица, столбцы, строки) из файла любого из форматов, без чтения файла целиком
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                table = name.rsplit('.', 1)[0]
+                with archive.open(name) as member:
+                    reader = csv.reader(io.TextIOWrapper(member, encoding='utf-8', newline=''))
+                    columns = next(reader)
+                    rows = []
+                    for row in reader:
+                        rows.append([value if value != '' else None for value in row])
+                        if len(rows) >= IMPORT_BATCH:
+                            yield table, columns, rows
+                            rows = []
+                    if rows:
+                        yield table, columns, rows
+        return
+
+    with gzip.open(path, 'rt', encoding='utf-8') as file:
+        table, columns, rows = None, None, []
+        for line in file:
+            record = json.loads(line)
+            if 'data' in record:
+                yield record['table'], record['columns'], list(zip(*record['data']))
+                continue
+            row_table = record.pop('_table')
+            if row_table != table or list(record) != columns or len(rows) >= IMPORT_BATCH:
+                if rows:
+                    yield table, columns, rows
+                table, columns, rows = row_table, list(record), []
+            rows.append(tuple(record.values()))
+        if rows:
+            yield table, columns, rows
+
+def import_history(db_path: str, path: str):
+    #Загрузка выгрузки: executemany большими пачками, транзакция на IMPORT_TRANSACTION_ROWS строк.
+    #Строки с тем же ключом (профиль, день, месяц) заменяются, записи добавляются с новыми id.
+    #Возвращает {таблица: строк}
+    asyncio.run(_create_schema(db_path))
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    counts = {}
+    in_transaction = 0
+    try:
+        conn.execute("BEGIN")
+        for table, columns, rows in read_history(path):
+            if table not in TABLES:
+                raise ValueError(f"Неизвестная таблица в выгрузке: {table}")
+            if table in AUTO_ID_TABLES and 'id' in columns:
+                index = columns.index('id')
+                columns = columns[:index] + columns[index + 1:]
+                rows = [row[:index] + row[index + 1:] for row in map(tuple, rows)]
+            placeholders = ', '.join('?' for _ in columns)
+            conn.executemany(f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows)
+            counts[table] = counts.get(table, 0) + len(rows)
+            in_transaction += len(rows)
+            if in_transaction >= IMPORT_TRANSACTION_ROWS:
+                conn.execute("COMMIT")
+                conn.execute("BEGIN")
+                in_transaction = 0
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return counts
+
+async def _create_schema(db_path: str):
+    db = Database(db_path, readers=1)
+    await db.create_tables()
+    await db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Выгрузка и загрузка истории пользователей")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help="выгрузить историю в файл")
+    export_parser.add_argument('path')
+    export_parser.add_argument('--db', default='users.db')
+    export_parser.add_argument('--user', type=int, help="только один пользователь")
+    export_parser.add_argument('--format', choices=FORMATS, default='jsonl')
+    import_parser = subparsers.add_parser('import', help="загрузить выгрузку в базу")
+    import_parser.add_argument('path')
+    import_parser.add_argument('--db', default='users.db')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'export':
+        rows = export_history(args.db, args.path, args.format, args.user)
+    else:
+        rows = sum(import_history(args.db, args.path).values())
+    elapsed = time.perf_counter() - start
+    print(f"Строк: {rows}, время: {elapsed:.1f} с ({rows / elapsed:.0f} строк/с)")
+
+if __name__ == "__main__":
+    main()
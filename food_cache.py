@@ -0,0 +1,149 @@
+import asyncio
+import time
+from typing import Optional
+from cache import TTLCache, MISS
+from database import Database
+from food_index import FoodIndex, normalize_food_name
+from utils import get_food_info, ExternalApiError
+
+HITS_FLUSH_SIZE = 1000 #сколько разных ключей копить в счетчике обращений до записи в БД
+MANUAL_CALORIES_MAX = 900 #ккал на 100 г: больше не бывает даже у чистого жира
+
+def _plausible(calories: Optional[float]):
+    #Ручная калорийность годится для других пользователей: не ноль и не больше MANUAL_CALORIES_MAX
+    return calories is not None and 0 < calories <= MANUAL_CALORIES_MAX
+
+class FoodCache:
+    #Двухуровневый кэш get_food_info: LRU в памяти перед таблицей food_cache в SQLite.
+    #При промахе сначала ищем в локальной базе продуктов, и только потом идем в API.
+    #Калорийность, введенная пользователем вручную (source='user'), общая для всех, поэтому она не заменяет
+    #ответ локальной базы или API, а используется, только если продукт не нашелся ни там, ни там
+    def __init__(self, db: Database, maxsize: int = 5000, ttl: float = 30 * 24 * 3600,
+                 negative_ttl: float = 24 * 3600, index: Optional[FoodIndex] = None, lookup_concurrency: int = 4):
+        self.db = db
+        self.index = index
+        self.lookup_concurrency = lookup_concurrency
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._hits = {} #накопленные обращения к ключам, сохраняются в БД пачкой
+        self.disk_hits = 0
+        self.local_hits = 0
+        self.api_hits = 0
+        self.api_misses = 0
+        self.api_errors = 0
+
+    def _expires_at(self, row):
+        ttl = self.negative_ttl if row['calories'] is None else self.ttl
+        return row['updated_at'] + ttl
+
+    def _remember(self, key: str, row):
+        if row['source'] == 'user':
+            return #ручная запись - только запасной вариант, см. get
+        remaining = self._expires_at(row) - time.time()
+        if remaining > 0:
+            value = None if row['calories'] is None else {'name': row['name'], 'calories': row['calories']}
+            self.memory.set(key, value, ttl=remaining)
+
+    async def warm_up(self, limit: int = 1000):
+        #Загружаем самые популярные продукты с диска в память
+        for row in await self.db.get_hot_foods(limit):
+            self._remember(row['key'], row)
+
+    async def get(self, product_name: str):
+        key = normalize_food_name(product_name)
+        if not key:
+            return None
+        self._hits[key] = self._hits.get(key, 0) + 1
+
+        info = self.memory.get(key)
+        if info is not MISS:
+            return info
+
+        if len(self._hits) >= HITS_FLUSH_SIZE:
+            await self.flush_hits()
+
+        row = await self.db.get_cached_food(key)
+        manual = None
+        if row is not None and row['source'] == 'user':
+            if _plausible(row['calories']): #записи, сохраненные до проверки диапазона, могут быть неправдоподобными
+                manual = {'name': row['name'], 'calories': row['calories']}
+        elif row is not None and self._expires_at(row) > time.time():
+            self.disk_hits += 1
+            self._remember(key, row)
+            return None if row['calories'] is None else {'name': row['name'], 'calories': row['calories']}
+
+        if self.index is not None:
+            info = await self.index.search(product_name)
+            if info is not None:
+                #Локальная база и так на диске, поэтому храним результат только в памяти
+                self.local_hits += 1
+                self.memory.set(key, info)
+                return info
+
+        try:
+            info = await get_food_info(product_name, raise_errors=True)
+        except ExternalApiError:
+            #Ошибку сети не кэшируем. Используем ручную запись или устаревший ответ API, если они есть
+            self.api_errors += 1
+            if manual is not None:
+                return manual
+            if row is not None and row['source'] == 'api':
+                return {'name': row['name'], 'calories': row['calories']}
+            return None
+
+        if info is not None:
+            self.api_hits += 1
+            await self._save(key, info['name'], info['calories'], 'api')
+            return info
+
+        self.api_misses += 1
+        if manual is not None:
+            #Продукта нет ни в локальной базе, ни в API - отвечаем ручной записью и не спрашиваем API до истечения negative_ttl
+            self.memory.set(key, manual, ttl=self.negative_ttl)
+            return manual
+        await self._save(key, None, None, 'miss')
+        return None
+
+    async def get_many(self, product_names):
+        #Продукты одного приема пищи ищем одновременно, но не больше lookup_concurrency запросов сразу
+        semaphore = asyncio.Semaphore(self.lookup_concurrency)
+
+        async def lookup(product_name: str):
+            async with semaphore:
+                return await self.get(product_name)
+
+        return await asyncio.gather(*(lookup(product_name) for product_name in product_names))
+
+    async def remember_manual(self, product_name: str, calories: float):
+        #Калорийность, введенная пользователем, - запасной ответ для продукта, которого нет ни в локальной базе, ни в API.
+        #Нулевые и неправдоподобные значения не сохраняются. Возвращает True, если значение запомнено
+        key = normalize_food_name(product_name)
+        if not key or not _plausible(calories):
+            return False
+        await self._save(key, product_name, calories, 'user')
+        self.memory.pop(key) #в памяти мог остаться закэшированный промах
+        return True
+
+    async def _save(self, key: str, name: Optional[str], calories: Optional[float], source: str):
+        row = {'name': name, 'calories': calories, 'source': source, 'updated_at': time.time()}
+        await self.db.save_cached_food(key, name, calories, source, row['updated_at'])
+        self._remember(key, row)
+
+    async def flush_hits(self):
+        hits, self._hits = self._hits, {}
+        await self.db.add_food_hits(hits)
+
+    def stats(self):
+        memory = self.memory.stats()
+        lookups = memory['hits'] + memory['misses']
+        cached = memory['hits'] + self.disk_hits + self.local_hits
+        return {
+            'memory': memory,
+            'disk_hits': self.disk_hits,
+            'local_hits': self.local_hits,
+            'api_hits': self.api_hits,
+            'api_misses': self.api_misses,
+            'api_errors': self.api_errors,
+            'hit_rate': cached / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,198 @@
+import argparse
+import csv
+import gzip
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import time
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+#Локальная база продуктов (выгрузка Open Food Facts) с триграммным полнотекстовым индексом по названию.
+#Импорт: python food_index.py import en.openfoodfacts.org.products.csv.gz [--db foods.db]
+
+_TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+})
+_NON_WORD = re.compile(r"[\W_]+")
+_VOWELS = 'aeiouy'
+KJ_PER_KCAL = 4.184
+IMPORT_BATCH = 10000
+
+def _stem(word: str):
+    #Грубое стемминг-правило: отрезаем множественное число и окончания на гласную,
+    #чтобы "бананы", "банан" и "bananas" давали один ключ
+    if len(word) > 3 and word.endswith('s'):
+        word = word[:-1]
+    while len(word) > 3 and word[-1] in _VOWELS:
+        word = word[:-1]
+    return word
+
+def normalize_food_name(name: str):
+    words = _NON_WORD.sub(' ', name.lower()).split()
+    return ' '.join(_stem(word.translate(_TRANSLIT)) for word in words)
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _kcal_100g(nutriments):
+    #В выгрузке калорийность бывает только в кДж
+    kcal = _to_float(nutriments.get('energy-kcal_100g'))
+    if kcal is None:
+        kj = _to_float(nutriments.get('energy_100g'))
+        if kj is not None:
+            kcal = kj / KJ_PER_KCAL
+    if kcal is None or not 0 <= kcal <= 1000:
+        return None
+    return round(kcal, 1)
+
+def _open_dump(path: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+def read_dump(path: str):
+    #Построчно читает CSV (в OFF разделитель - табуляция) или JSONL, не загружая файл целиком
+    name = path[:-3] if path.endswith('.gz') else path
+    with _open_dump(path) as file:
+        if name.endswith('.jsonl') or name.endswith('.json'):
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    product = json.loads(line)
+                except ValueError:
+                    continue
+                yield product.get('product_name'), _kcal_100g(product.get('nutriments') or {})
+        else:
+            csv.field_size_limit(sys.maxsize)
+            delimiter = ',' if name.endswith('.csv') and '\t' not in file.readline() else '\t'
+            file.seek(0)
+            for row in csv.DictReader(file, delimiter=delimiter):
+                yield row.get('product_name'), _kcal_100g(row)
+
+def create_schema(conn: sqlite3.Connection):
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS foods (
+            id INTEGER PRIMARY KEY,
+            key TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL,
+            kcal_100g REAL NOT NULL
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS foods_fts USING fts5(
+            name, content='foods', content_rowid='id', tokenize='trigram'
+        );
+    """)
+
+def import_dump(path: str, db_path: str):
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF") #при сбое импорт просто запускается заново
+    create_schema(conn)
+
+    read = imported = 0
+    batch = []
+    start = time.perf_counter()
+    for name, kcal in read_dump(path):
+        read += 1
+        if not name or kcal is None:
+            continue
+        name = name.strip()
+        key = normalize_food_name(name)
+        if not key:
+            continue
+        batch.append((key, name, kcal))
+        if len(batch) >= IMPORT_BATCH:
+            imported += _insert_batch(conn, batch)
+            batch = []
+    if batch:
+        imported += _insert_batch(conn, batch)
+
+    #Индекс строим один раз после загрузки - это быстрее, чем обновлять его на каждую вставку
+    conn.execute("INSERT INTO foods_fts(foods_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO foods_fts(foods_fts) VALUES ('optimize')")
+    conn.commit()
+    conn.close()
+    return read, imported, time.perf_counter() - start
+
+def _insert_batch(conn: sqlite3.Connection, batch):
+    #Для одинаковых названий оставляем первый продукт: база остается компактной
+    before = conn.total_changes
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO foods (key, name, kcal_100g) VALUES (?, ?, ?)", batch)
+    return conn.total_changes - before
+
+class FoodIndex:
+    def __init__(self, db_path: str = "foods.db"):
+        self.db_path = db_path
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def available(self):
+        return self._conn is not None
+
+    async def connect(self):
+        if not os.path.exists(self.db_path):
+            logger.warning("Локальная база продуктов %s не найдена, поиск только через API", self.db_path)
+            return
+        self._conn = await aiosqlite.connect(f"file:{self.db_path}?mode=ro", uri=True)
+
+    async def close(self):
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    async def search(self, product_name: str):
+        if self._conn is None:
+            return None
+
+        #Сначала точное совпадение по нормализованному названию, затем триграммный поиск
+        key = normalize_food_name(product_name)
+        async with self._conn.execute("SELECT name, kcal_100g FROM foods WHERE key = ?", (key,)) as cursor:
+            row = await cursor.fetchone()
+
+        query = product_name.strip().replace('"', '')
+        if row is None and len(query) >= 3:
+            async with self._conn.execute(
+                """
+                SELECT f.name, f.kcal_100g
+                FROM foods_fts JOIN foods f ON f.id = foods_fts.rowid
+                WHERE foods_fts MATCH ?
+                ORDER BY rank, length(f.name)
+                LIMIT 1
+                """,
+                (f'"{query}"',)
+            ) as cursor:
+                row = await cursor.fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {'name': row[0], 'calories': row[1]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальная база продуктов Open Food Facts")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import', help="загрузить выгрузку CSV/JSONL (можно .gz)")
+    import_parser.add_argument('dump')
+    import_parser.add_argument('--db', default='foods.db')
+    args = parser.parse_args()
+
+    read, imported, elapsed = import_dump(args.dump, args.db)
+    print(f"Прочитано строк: {read}, добавлено продуктов: {imported}, время: {elapsed:.1f} с ({read / elapsed:.0f} строк/с)")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,22 @@
 from aiogram import Router
-from aiogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery, BufferedInputFile
+from aiogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery, BufferedInputFile, FSInputFile
 from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from database import Database
-from utils import get_temperature, get_food_info
-import matplotlib.pyplot as plt
-from io import BytesIO
-import pandas as pd
+from food_cache import FoodCache, MANUAL_CALORIES_MAX
+from weather import WeatherService
+from energy_model import EnergyModel, INTENSITY_LABELS
+from charts import ChartRenderer, RendererBusy
+from chart_cache import ChartCache
+from challenges import ChallengeService, METRICS as CHALLENGE_METRICS, MAX_DAYS as MAX_CHALLENGE_DAYS
+from export import export_history, EXTENSIONS as EXPORT_EXTENSIONS, FORMATS as EXPORT_FORMATS
+from reminders import KINDS as REMINDER_KINDS, MAX_PER_KIND as MAX_REMINDERS, format_minute, parse_minute
+import asyncio
 import datetime
+import os
+import re
+import tempfile
 
 router = Router()
 
@@ -24,49 +32,6 @@ class Form(StatesGroup):
 class FoodState(StatesGroup):
     amount = State()
 
-def calculate_calorie_goal(weight: int, height: int, age: int, gender: str, activity: int):
-    if gender == 'М':
-        bmr = 10 * weight + 6.25 * height - 5 * age + 5
-    else:
-        bmr = 10 * weight + 6.25 * height - 5 * age - 161
-
-    if activity < 30:
-        activity_factor = 1.2
-    elif activity < 60:
-        activity_factor = 1.375
-    elif activity < 90:
-        activity_factor = 1.55
-    elif activity < 120:
-        activity_factor = 1.725
-    else:
-        activity_factor = 1.9
-    
-    calorie_goal = bmr * activity_factor
-    return calorie_goal
-
-def calculate_water_goal(weight: int, activity: int, temperature: float):
-    water_goal = 30 * weight + 500 * (activity / 30) + 500 * (temperature > 25)
-    return int(water_goal)
-
-def calculate_workout_calories(workout_type: str, duration: int, weight: int):
-    # MET (метаболический эквивалент) для разных типов тренировок
-    met_values = {
-        'бег': 8.0,
-        'ходьба': 3.5,
-        'велосипед': 6.0,
-        'плавание': 6.0,
-        'йога': 3.0,
-        'силовая': 5.0,
-        'кардио': 7.0,
-        'танцы': 5.0,
-        'футбол': 7.0,
-        'баскетбол': 6.5
-    }
-    
-    met = met_values.get(workout_type.lower(), 5.0)  # по умолчанию 5.0
-    calories = met * weight * (duration / 60)
-    return round(calories, 1)
-
 @router.message(Command('start'))
 async def cmd_start(message: Message, state: FSMContext):
     await message.reply("Добро пожаловать! Я ваш трекер питания и тренировок. \nВведите /help для получения списка доступных команд.")
@@ -83,7 +48,11 @@ async def cmd_help(message: Message):
         "/log_food <название продукта> - записать еду\n"
         "/log_workout <вид тренировки> <время в мин> - записать тренировку\n"
         "/check_progress - посмотреть прогресс за день\n"
-        "/progress_graph - посмотреть график прогресса за неделю"
+        "/progress_graph [дней] - посмотреть график прогресса (по умолчанию за неделю)\n"
+        "/undo - отменить последнюю запись за сегодня\n"
+        "/remind - напоминания о воде и итоги дня\n"
+        "/challenge - соревнования по воде и тренировкам\n"
+        "/export [csv|jsonl|columnar] - выгрузить свою историю"
     )
 
 @router.message(Command('set_profile'))
@@ -174,7 +143,7 @@ async def process_activity(message: Message, state: FSMContext):
     await state.set_state(Form.city)
 
 @router.message(Form.city)
-async def process_city(message: Message, state: FSMContext):
+async def process_city(message: Message, state: FSMContext, weather: WeatherService, energy: EnergyModel):
     await state.update_data(city=message.text)
     data = await state.get_data()
 
@@ -185,11 +154,13 @@ async def process_city(message: Message, state: FSMContext):
     activity = data.get('activity')
     city = data.get('city')
 
-    temperature = await get_temperature(city)
-    calorie_goal = calculate_calorie_goal(weight, height, age, gender, activity)
-    water_goal = calculate_water_goal(weight, activity, temperature)
+    temperature = await weather.get_temperature(city)
+    calorie_goal = energy.calorie_goal(weight, height, age, gender, activity)
+    water_goal = energy.water_goal(weight, activity, temperature)
 
-    await state.update_data(water_goal=water_goal, calorie_goal=calorie_goal)
+    await state.update_data(water_goal=water_goal, calorie_goal=calorie_goal, calorie_goal_custom=False)
+    if temperature is None:
+        await message.answer("Не удалось получить погоду для этого города, норма воды рассчитана без учета температуры")
     await message.answer(
         f"Рассчитанная норма калорий: {calorie_goal:.0f} ккал/день\n"
         f"Норма воды: {water_goal:.0f} мл/день\n\n"
@@ -202,7 +173,7 @@ async def set_custom_goal(message: Message, state: FSMContext, db: Database):
     text = message.text.lower()
     if text != 'нет':
         if text.isdigit():
-            await state.update_data(calorie_goal=int(message.text))
+            await state.update_data(calorie_goal=int(message.text), calorie_goal_custom=True)
         else:
             await message.answer("Пожалуйста, введите корректное количество ккал или 'нет'")
             return
@@ -226,21 +197,19 @@ async def set_custom_goal(message: Message, state: FSMContext, db: Database):
         "/log_food - записать еду\n"
         "/log_workout - записать тренировку\n"
         "/check_progress - посмотреть прогресс за день\n"
-        "/progress_graph - посмотреть график прогресса за неделю"
+        "/progress_graph [дней] - посмотреть график прогресса (по умолчанию за неделю)"
     )
     
     await state.clear()
 
 @router.message(Command('log_water'))
-async def cmd_log_water(message: Message, command: CommandObject, db: Database):
+async def cmd_log_water(message: Message, command: CommandObject, db: Database, chart_cache: ChartCache, challenges: ChallengeService):
     #Проверка наличия профиля
     user_data = await db.get_user(message.from_user.id)
     if not user_data:
         await message.answer("Сначала настройте профиль: /set_profile")
         return
     
-    today_logs = await db.get_today_logs(message.from_user.id)
-
     #Проверка введенного количества воды
     command_args = command.args
     try:
@@ -249,12 +218,13 @@ async def cmd_log_water(message: Message, command: CommandObject, db: Database):
         await message.answer("Пожалуйста, введите количество выпитой воды в мл в формате /log_water <количество>")
         return
 
-    logged_water = command_args + today_logs['logged_water'] #Суммируем количество всей выпитой воды
+    today_logs = await db.log_water(message.from_user.id, command_args) #Запись и итог за день сохраняются вместе
+    chart_cache.invalidate(message.from_user.id)
+    challenges.record(message.from_user.id, 'logged_water', command_args)
+    logged_water = today_logs['logged_water']
 
     remaining_water = user_data['water_goal'] - logged_water #Рассчитываем, сколько осталось выпить воды до достижения цели
 
-    await db.log_water(logged_water, message.from_user.id)
-
     if remaining_water > 0:
         msg = f"Осталось: {remaining_water} мл"
     elif remaining_water < 0:
@@ -268,8 +238,32 @@ async def cmd_log_water(message: Message, command: CommandObject, db: Database):
         msg
     )
 
+#Продукты разделяются запятой, точкой с запятой или переводом строки; запятая между цифрами - десятичная ("молоко 3,2% 200")
+_MEAL_SEPARATOR = re.compile(r'(?<!\d),|,(?!\d)|[;\n]')
+#Продукт с необязательным количеством в конце: "гречка 150", "курица 200 г", "огурец"
+_FOOD_ITEM = re.compile(r'^(?P<name>.+?)(?:\s+(?P<grams>\d+)\s*(?:г|гр|g|мл|ml)?\.?)?$', re.IGNORECASE)
+
+def parse_meal(text: str):
+    #"/log_food гречка 150, курица 200, огурец 80" -> [('гречка', 150), ('курица', 200), ('огурец', 80)]
+    items = []
+    for part in _MEAL_SEPARATOR.split(text):
+        part = part.strip()
+        if not part:
+            continue
+        match = _FOOD_ITEM.match(part)
+        grams = match.group('grams')
+        items.append((match.group('name').strip(), int(grams) if grams else None))
+    return items
+
+async def _ask_food(message: Message, item: dict):
+    #Вопрос о следующем продукте, для которого не хватает калорийности или количества
+    if item['calories_100g'] is None:
+        await message.answer(f"У меня нет данных о продукте «{item['food_type']}». Пожалуйста, введите калорийность продукта на 100 г.")
+    else:
+        await message.answer(f"Калорийность продукта «{item['food_type']}» на 100 г - {item['calories_100g']} ккал. Сколько Вы употребили в г (мл)?")
+
 @router.message(Command('log_food'))
-async def cmd_log_food(message: Message, command: CommandObject, state: FSMContext, db: Database):
+async def cmd_log_food(message: Message, command: CommandObject, state: FSMContext, db: Database, food_cache: FoodCache, chart_cache: ChartCache):
     #Проверка наличия профиля
     user_data = await db.get_user(message.from_user.id)
     if not user_data:
@@ -277,81 +271,121 @@ async def cmd_log_food(message: Message, command: CommandObject, state: FSMConte
         return
 
     #Проверка введенных аргументов
-    command_args = command.args
-    if command_args is None:
+    items = parse_meal(command.args or '')
+    if not items:
         await message.answer(
-            "Пожалуйста, введите название продукта в формате /log_food <название продукта>"
+            "Пожалуйста, введите название продукта в формате /log_food <название продукта> [количество в г]\n"
+            "Несколько продуктов - через запятую: /log_food гречка 150, курица 200, огурец 80"
         )
         return
 
-    await message.answer("Получаю данные о продукте...")
-    food_info = await get_food_info(command_args)
-    await state.update_data(food_type=command_args)
+    await message.answer("Получаю данные о продукте..." if len(items) == 1 else "Получаю данные о продуктах...")
+    #Все продукты ищем одновременно: прием пищи из пяти продуктов ждет сеть примерно как один
+    infos = await food_cache.get_many([name for name, _ in items])
 
-    if food_info is None:
-        await message.answer("У меня нет данных об этом продукте. Пожалуйста, введите калорийность продукта на 100 г.")
-        await state.update_data(calories_100g=None)
-    else:
-        await state.update_data(calories_100g=food_info['calories'])
-        await message.answer(f"Калорийность продукта на 100 г - {food_info['calories']} ккал. Сколько Вы употребили в г (мл)?")
-    await state.set_state(FoodState.amount)
+    resolved = []
+    pending = [] #продукты, по которым нужно спросить калорийность или количество - по одному
+    for (name, grams), info in zip(items, infos):
+        calories_100g = info['calories'] if info is not None else None
+        if calories_100g is not None and grams is not None:
+            resolved.append((name, grams, round(calories_100g * grams / 100, 1)))
+        else:
+            pending.append({'food_type': name, 'grams': grams, 'calories_100g': calories_100g})
+
+    if resolved:
+        today_logs = await db.log_foods(message.from_user.id, resolved) #одной транзакцией
+        chart_cache.invalidate(message.from_user.id)
+        lines = [f"- {name} {grams} г - {calories} ккал" for name, grams, calories in resolved]
+        await message.answer(
+            "Записано:\n" + "\n".join(lines) + "\n"
+            f"Всего потреблено калорий: {today_logs['logged_calories']} ккал"
+        )
+
+    if pending:
+        #Предыдущий прием пищи еще ждет ответов: новые продукты встают в конец очереди, а не заменяют ее
+        queue = ((await state.get_data()).get('food_queue') or []) if await state.get_state() == FoodState.amount else []
+        if queue:
+            await state.update_data(food_queue=queue + pending)
+            names = ", ".join(f"«{item['food_type']}»" for item in pending)
+            await message.answer(f"Добавлено в очередь: {names}. Сначала ответьте на предыдущий вопрос.")
+            await _ask_food(message, queue[0])
+            return
+        await state.set_state(FoodState.amount)
+        await state.update_data(food_queue=pending)
+        await _ask_food(message, pending[0])
 
 @router.message(FoodState.amount)
-async def log_food(message: Message, state: FSMContext, db: Database):
+async def log_food(message: Message, state: FSMContext, db: Database, food_cache: FoodCache, chart_cache: ChartCache):
     data = await state.get_data()
+    queue = data.get('food_queue') or []
+    if not queue:
+        await state.clear()
+        return
+    item = queue[0]
 
     #Ввод калорийности еды в случае отсутствия продукта в базе
-    if data['calories_100g'] is None:
+    if item['calories_100g'] is None:
         try:
-            await state.update_data(calories_100g=int(message.text))
+            calories_100g = int(message.text)
         except ValueError:
             await message.answer("Пожалуйста, введите число")
             return
-        await message.answer("Введите количество употребленного продукта в г (мл)")
-        return #Остаемся в этом состоянии, но с другим контекстом
+        if not 0 <= calories_100g <= MANUAL_CALORIES_MAX:
+            await message.answer(f"Калорийность на 100 г должна быть от 0 до {MANUAL_CALORIES_MAX} ккал. Введите еще раз")
+            return
+        item['calories_100g'] = calories_100g
+        await food_cache.remember_manual(item['food_type'], calories_100g) #Запоминаем на случай, если продукта так и не будет в API
+        if item['grams'] is None:
+            await state.update_data(food_queue=queue)
+            await message.answer("Введите количество употребленного продукта в г (мл)")
+            return #Остаемся в этом состоянии, но с другим контекстом
     else:
         try:
-            food_amount = int(message.text)
+            item['grams'] = int(message.text)
         except ValueError:
             await message.answer("Пожалуйста, введите число")
             return
 
-        consumed_calories = round((data['calories_100g'] * food_amount / 100), 1) #Расчет количества потребленных калорий
+    consumed_calories = round((item['calories_100g'] * item['grams'] / 100), 1) #Расчет количества потребленных калорий
 
-        #Логирование калорий
-        today_logs = await db.get_today_logs(message.from_user.id)
-        logged_calories = consumed_calories + today_logs['logged_calories'] #Суммируем общее количество потребленных калорий
-        await db.log_calories(logged_calories, message.from_user.id)
+    #Логирование калорий
+    today_logs = await db.log_food(message.from_user.id, item['food_type'], item['grams'], consumed_calories)
+    chart_cache.invalidate(message.from_user.id)
+    logged_calories = today_logs['logged_calories'] #Общее количество потребленных калорий
 
-        await message.answer(
-            f"Записано: {consumed_calories} ккал\n"
-            f"Всего потреблено калорий: {logged_calories} ккал\n"
-        )
+    await message.answer(
+        f"Записано: {consumed_calories} ккал\n"
+        f"Всего потреблено калорий: {logged_calories} ккал\n"
+    )
 
+    #Переходим к следующему продукту, по которому не хватает данных
+    queue = queue[1:]
+    if queue:
+        await state.update_data(food_queue=queue)
+        await _ask_food(message, queue[0])
+    else:
         await state.clear()
 
 @router.message(Command('log_workout'))
-async def cmd_log_workout(message: Message, command: CommandObject, db: Database):
+async def cmd_log_workout(message: Message, command: CommandObject, db: Database, chart_cache: ChartCache,
+                          challenges: ChallengeService, energy: EnergyModel):
     #Проверка наличия профиля
     user_data = await db.get_user(message.from_user.id)
     if not user_data:
         await message.answer("Сначала настройте профиль: /set_profile")
         return
-    
-    today_logs = await db.get_today_logs(message.from_user.id)
 
     #Проверка введенных аргументов
-    available_workout_types = ('бег', 'ходьба', 'велосипед', 'плавание', 'йога', 'силовая', 'кардио', 'танцы', 'футбол', 'баскетбол')
-    command_args: str = command.args
-    try:
-        workout_type, workout_duration = command_args.split(" ")
-    except:
+    #Тип тренировки может состоять из нескольких слов ("скандинавская ходьба", "бег быстро"), время - последнее слово
+    command_args = (command.args or '').rsplit(maxsplit=1)
+    if len(command_args) != 2:
         await message.answer(
             "Пожалуйста, введите тип и время тренировки в минутах через пробел в формате:\n"
             "/log_workout <тип тренировки> <время>\n"
-            f"Доступные типы тренировок: {', '.join(available_workout_types)}"
+            f"Например: {', '.join(energy.examples())} и другие; можно указать интенсивность: \"бег быстро\", \"легкая йога\""
         )
         return
+    workout_type, workout_duration = command_args
     
     try:
         workout_duration = int(workout_duration)
@@ -359,18 +393,209 @@ async def cmd_log_workout(message: Message, command: CommandObject, db: Database
         await message.answer("Пожалуйста, введите время тренировки в корректном формате (количество минут)")
         return
     
-    burned_calories = round(calculate_workout_calories(workout_type, workout_duration, user_data['weight']), 1)
-    burned_calories_total = burned_calories + today_logs['burned_calories'] #Суммируем общее количество сожженных калорий
+    burned_calories, activity = energy.workout_calories(workout_type, workout_duration, user_data['weight'])
+    title = workout_type
+    if activity is not None:
+        workout_type = title = activity['activity']
+        if activity['variable']:
+            title += f" ({INTENSITY_LABELS[activity['intensity']]} интенсивность)"
     
     # Рассчитываем дополнительную воду
     extra_water = int((int(workout_duration) / 30) * 200)
 
-    await db.log_workout(burned_calories_total, message.from_user.id)
+    await db.log_workout(message.from_user.id, workout_type.lower(), workout_duration, burned_calories)
+    chart_cache.invalidate(message.from_user.id)
+    challenges.record(message.from_user.id, 'burned_calories', burned_calories)
 
+    note = ""
+    if activity is None:
+        note = "\nТакой тренировки нет в справочнике, расход посчитан по среднему значению"
     await message.answer(
-        f"{workout_type.capitalize()} {workout_duration} минут - сожжено {burned_calories:.0f} ккал\n"
+        f"{title.capitalize()} {workout_duration} минут - сожжено {burned_calories:.0f} ккал\n"
         f"Дополнительно: выпейте {extra_water} мл воды\n"
+        f"{note}"
+        )
+
+@router.message(Command('undo'))
+async def cmd_undo(message: Message, db: Database, chart_cache: ChartCache, challenges: ChallengeService):
+    #Проверка наличия профиля
+    user_data = await db.get_user(message.from_user.id)
+    if not user_data:
+        await message.answer("Сначала настройте профиль: /set_profile")
+        return
+
+    undone = await db.undo_last_entry(message.from_user.id)
+    if undone is None:
+        await message.answer("Сегодня еще нет записей, которые можно отменить")
+        return
+    chart_cache.invalidate(message.from_user.id)
+
+    kind, entry, today_logs = undone
+    if kind == 'water':
+        challenges.record(message.from_user.id, 'logged_water', -entry['amount'])
+    elif kind == 'workout':
+        challenges.record(message.from_user.id, 'burned_calories', -entry['calories'])
+
+    if kind == 'water':
+        msg = f"Отменено: вода {entry['amount']} мл\nВсего выпито воды: {today_logs['logged_water']} мл"
+    elif kind == 'food':
+        msg = (
+            f"Отменено: {entry['name']} {entry['grams']:g} г - {entry['calories']} ккал\n"
+            f"Всего потреблено калорий: {today_logs['logged_calories']} ккал"
         )
+    else:
+        msg = (
+            f"Отменено: {entry['workout_type']} {entry['minutes']} минут - {entry['calories']:.0f} ккал\n"
+            f"Всего сожжено: {today_logs['burned_calories']} ккал"
+        )
+    await message.answer(msg)
+
+REMIND_USAGE = (
+    "Время указывается по UTC:\n"
+    "/remind water 10:00 14:00 18:00 - напоминать о воде, если до цели еще далеко\n"
+    "/remind summary 21:00 - итоги дня\n"
+    "/remind water off - выключить напоминания о воде\n"
+    "/remind off - выключить все напоминания"
+)
+
+@router.message(Command('remind'))
+async def cmd_remind(message: Message, command: CommandObject, db: Database):
+    #Проверка наличия профиля
+    user_data = await db.get_user(message.from_user.id)
+    if not user_data:
+        await message.answer("Сначала настройте профиль: /set_profile")
+        return
+
+    args = (command.args or '').split()
+    if not args:
+        reminders = await db.get_reminders(message.from_user.id)
+        if not reminders:
+            await message.answer("Напоминания не настроены\n\n" + REMIND_USAGE)
+            return
+        names = {'water': "Вода", 'summary': "Итоги дня"}
+        lines = [f"{names[kind]}: {', '.join(format_minute(minute) for minute in minutes)}" for kind, minutes in reminders.items()]
+        await message.answer("Ваши напоминания (UTC):\n" + "\n".join(lines) + "\n\n" + REMIND_USAGE)
+        return
+
+    if args == ['off']:
+        await db.delete_reminders(message.from_user.id)
+        await message.answer("Все напоминания выключены")
+        return
+
+    kind, times = args[0], args[1:]
+    if kind not in REMINDER_KINDS or not times:
+        await message.answer(REMIND_USAGE)
+        return
+    if times == ['off']:
+        await db.set_reminders(message.from_user.id, kind, [])
+        await message.answer("Напоминания выключены")
+        return
+
+    minutes = [parse_minute(value) for value in times]
+    if None in minutes:
+        await message.answer("Пожалуйста, укажите время в формате ЧЧ:ММ, например 14:30")
+        return
+    if len(minutes) > MAX_REMINDERS:
+        await message.answer(f"Можно указать не больше {MAX_REMINDERS} напоминаний")
+        return
+
+    await db.set_reminders(message.from_user.id, kind, minutes)
+    await message.answer("Напоминания сохранены: " + ", ".join(format_minute(minute) for minute in sorted(set(minutes))) + " (UTC)")
+
+CHALLENGE_USAGE = (
+    f"/challenge new water <дней> <название> - соревнование по выпитой воде (до {MAX_CHALLENGE_DAYS} дней)\n"
+    "/challenge new burned <дней> <название> - по сожженным на тренировках калориям\n"
+    "/challenge join <номер> - участвовать\n"
+    "/challenge leave <номер> - выйти\n"
+    "/challenge <номер> - таблица"
+)
+
+def _challenge_score(metric: str, score: float):
+    return f"{score:.0f} мл" if metric == 'water' else f"{score:.0f} ккал"
+
+@router.message(Command('challenge'))
+async def cmd_challenge(message: Message, command: CommandObject, db: Database, challenges: ChallengeService):
+    #Проверка наличия профиля
+    user_data = await db.get_user(message.from_user.id)
+    if not user_data:
+        await message.answer("Сначала настройте профиль: /set_profile")
+        return
+
+    user_id = message.from_user.id
+    args = (command.args or '').split(maxsplit=3)
+    if not args:
+        joined = challenges.user_challenges(user_id)
+        if not joined:
+            await message.answer("Вы пока не участвуете в соревнованиях\n\n" + CHALLENGE_USAGE)
+            return
+        lines = [f"#{c['id']} {c['name']} ({c['start_date']} - {c['end_date']})" for c in joined]
+        await message.answer("Ваши соревнования:\n" + "\n".join(lines) + "\n\n" + CHALLENGE_USAGE)
+        return
+
+    if args[0] == 'new':
+        if len(args) < 4 or args[1] not in CHALLENGE_METRICS or not args[2].isdigit() or not 1 <= int(args[2]) <= MAX_CHALLENGE_DAYS:
+            await message.answer(CHALLENGE_USAGE)
+            return
+        challenge = await challenges.create(user_id, message.from_user.full_name, args[1], int(args[2]), args[3][:64])
+        await message.answer(
+            f"Соревнование #{challenge['id']} «{challenge['name']}» создано: {challenge['start_date']} - {challenge['end_date']}\n"
+            f"Пригласите участников командой /challenge join {challenge['id']}"
+        )
+        return
+
+    action, number = ('show', args[0]) if len(args) == 1 else (args[0], args[1])
+    if action not in ('show', 'join', 'leave') or not number.lstrip('#').isdigit():
+        await message.answer(CHALLENGE_USAGE)
+        return
+    challenge = await challenges.get(int(number.lstrip('#')))
+    if challenge is None:
+        await message.answer("Соревнование не найдено")
+        return
+
+    if action == 'join':
+        if challenge['end_date'] < datetime.datetime.now(datetime.timezone.utc).date().isoformat():
+            await message.answer("Соревнование уже закончилось")
+            return
+        joined = await challenges.join(challenge['id'], user_id, message.from_user.full_name)
+        await message.answer("Вы участвуете!" if joined else "Вы уже участвуете в этом соревновании")
+        if not joined:
+            return
+    elif action == 'leave':
+        left = await challenges.leave(challenge['id'], user_id)
+        await message.answer("Вы вышли из соревнования" if left else "Вы не участвуете в этом соревновании")
+        return
+
+    top, own, members = await challenges.standings(challenge['id'], user_id)
+    lines = [f"{place}. {name} - {_challenge_score(challenge['metric'], score)}" for place, name, score in top]
+    text = (
+        f"🏆 #{challenge['id']} {challenge['name']} ({challenge['start_date']} - {challenge['end_date']}), участников: {members}\n"
+        + "\n".join(lines)
+    )
+    if own is not None and own[0] > len(top):
+        text += f"\n...\n{own[0]}. Вы - {_challenge_score(challenge['metric'], own[1])}"
+    await message.answer(text)
+
+@router.message(Command('export'))
+async def cmd_export(message: Message, command: CommandObject, db: Database):
+    #Проверка наличия профиля
+    user_data = await db.get_user(message.from_user.id)
+    if not user_data:
+        await message.answer("Сначала настройте профиль: /set_profile")
+        return
+
+    fmt = (command.args or 'csv').strip().lower()
+    if fmt not in EXPORT_FORMATS:
+        await message.answer("Пожалуйста, укажите формат: /export csv, /export jsonl или /export columnar")
+        return
+
+    await message.answer("Готовлю выгрузку...")
+    await db.flush() #отложенные записи тоже должны попасть в файл
+    filename = f"history_{message.from_user.id}{EXPORT_EXTENSIONS[fmt]}"
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, filename)
+        #Выгрузка пишет файл пачками строк в отдельном потоке, а Telegram получает его частями с диска
+        await asyncio.to_thread(export_history, db.db_path, path, fmt, message.from_user.id)
+        await message.answer_document(FSInputFile(path, filename=filename), caption="📦 Ваша история")
 
 @router.message(Command('check_progress'))
 async def cmd_check_progress(message: Message, db: Database):
@@ -411,58 +636,69 @@ async def cmd_check_progress(message: Message, db: Database):
         )
     
 @router.message(Command('progress_graph'))
-async def cmd_progress_graph(message: Message, db: Database):
+async def cmd_progress_graph(message: Message, command: CommandObject, db: Database, renderer: ChartRenderer, chart_cache: ChartCache):
      #Проверка наличия профиля
     user_data = await db.get_user(message.from_user.id)
     if not user_data:
         await message.answer("Сначала настройте профиль: /set_profile")
         return
-    
-    water_logs, calorie_logs, burned_logs = await db.get_weekly_logs(message.from_user.id)
+
+    #numpy загружается при первом отчете, а не при старте бота
+    import analytics
+
+    days = analytics.parse_days(command.args)
+    if days is None:
+        await message.answer(
+            f"Пожалуйста, укажите период в днях от 2 до {analytics.MAX_DAYS} в формате /progress_graph [дней], например /progress_graph 30"
+        )
+        return
+
     water_goal = user_data['water_goal']
     calorie_goal = user_data['calorie_goal']
+    report = await analytics.progress_report(db, message.from_user.id, days, water_goal, calorie_goal)
+
+    period = "за неделю" if days == 7 else f"за {days} дн."
+    if report['grouping'] == 'week':
+        period += ", в среднем за день по неделям"
+    elif report['grouping'] == 'month':
+        period += ", в среднем за день по месяцам"
+    caption = (
+        f"📈 Ваш прогресс {period}\n"
+        f"Дней с записями: {report['days_logged']} из {days}\n"
+        f"Вода: в среднем {report['water_mean']:.0f} мл, серия {report['water_streak']} (лучшая {report['water_best_streak']})\n"
+        f"Калории: баланс в среднем {report['balance_mean']:.0f} ккал, "
+        f"серия {report['calorie_streak']} (лучшая {report['calorie_best_streak']})\n"
+        f"Отклонение от нормы за период: {report['balance_total']:+.0f} ккал"
+    )
+    dates = report['dates']
+    series = (report['water'], report['calories'], report['burned'], report['water_avg'], report['balance_avg'])
+
+    #Если данные не менялись, повторно отправляем уже загруженную в Telegram картинку
+    key = chart_cache.make_key(message.from_user.id, dates, water_goal, calorie_goal, period, *series)
+    file_id = chart_cache.get_file_id(key)
+    if file_id is not None:
+        await message.answer_photo(photo=file_id, caption=caption)
+        return
 
-    # Создаем график
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 8))
-    
-    # График воды
-    today = datetime.date.today()
-    week_ago = today - datetime.timedelta(weeks=1)
-    dates = list(map(lambda x: x.strftime('%Y-%m-%d'), pd.date_range(week_ago, today)))
-    water_values = [water_logs.get(date, 0) for date in dates]
-    
-    ax1.plot(dates, water_values, color='lightblue', label='Выпито')
-    ax1.axhline(y=water_goal, color='blue', linestyle='--', label=f'Цель: {water_goal:.0f} мл')
-    ax1.set_title('Потребление воды за неделю, мл')
-    ax1.legend()
-    ax1.tick_params(axis='x', rotation=45)
-    
-    # График калорий
-    calories_values = [calorie_logs.get(date, 0) for date in dates]
-    burned_calories = [burned_logs.get(date, 0) for date in dates]
-    balance = [a - b for a, b in zip(calories_values, burned_calories)]
-
-    ax2.plot(dates, calories_values, color='lightcoral', label='Потреблено', alpha=0.5)
-    ax2.plot(dates, burned_calories, color='green', label='Сожжено', alpha=0.5)
-    ax2.plot(dates, balance, color='orange', label='Баланс')
-    ax2.axhline(y=calorie_goal, color='red', linestyle='--', label=f'Цель: {calorie_goal:.0f} ккал')
-    ax2.set_title('Потребление калорий за неделю')
-    ax2.legend()
-    ax2.tick_params(axis='x', rotation=45)
-    
-    plt.tight_layout()
-    
-    buf = BytesIO()
-    plt.savefig(buf, format='png', dpi=100)
-    buf.seek(0)
-    plt.close()
+    png = await chart_cache.get_png(key)
+    if png is None:
+        #График строится в отдельном процессе, чтобы не задерживать сообщения других пользователей
+        try:
+            png = await renderer.render_weekly_chart(
+                dates, report['water'], water_goal, report['calories'], report['burned'], calorie_goal,
+                period=period, water_avg=report['water_avg'], balance_avg=report['balance_avg']
+            )
+        except RendererBusy:
+            await message.answer("Сейчас строится много графиков, попробуйте через минуту")
+            return
     
-    photo=BufferedInputFile(buf.read(), filename='progress.png')
+    photo=BufferedInputFile(png, filename='progress.png')
 
-    await message.answer_photo(
+    sent = await message.answer_photo(
         photo=photo,
-        caption="📈 Ваш прогресс за неделю"
+        caption=caption
     )
+    chart_cache.put(message.from_user.id, key, png, file_id=sent.photo[-1].file_id)
 
 def setup_handlers(dp):
     dp.include_router(router)
@@ -0,0 +1,34 @@
+import aiohttp
+from config import HTTP_LIMIT, HTTP_LIMIT_PER_HOST, HTTP_KEEPALIVE, HTTP_DNS_TTL
+
+#Одна сессия на процесс: соединения (TCP/TLS) и DNS-ответы переиспользуются между запросами
+_session = None
+
+def _create_session():
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_LIMIT,
+        limit_per_host=HTTP_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE,
+        ttl_dns_cache=HTTP_DNS_TTL,
+    )
+    #Общий таймаут на случай, если вызывающий код не передал свой
+    return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30, connect=5))
+
+async def start_session():
+    global _session
+    if _session is None or _session.closed:
+        _session = _create_session()
+    return _session
+
+def get_session():
+    #Создаем сессию при первом обращении, если start_session() не вызывался (например, в скриптах)
+    global _session
+    if _session is None or _session.closed:
+        _session = _create_session()
+    return _session
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
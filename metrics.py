@@ -0,0 +1,228 @@
+import asyncio
+import bisect
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import signal
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+#Границы корзин гистограмм задержек, сек
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+#Стандартные поля LogRecord: все остальное пришло через extra= и попадает в запись как есть
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+class JsonFormatter(logging.Formatter):
+    #Одна запись - одна строка JSON, поля из extra= становятся ключами
+    def format(self, record: logging.LogRecord):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+_listener = None
+
+def setup_logging(level: str = "INFO", path: Optional[str] = None):
+    #Обработчики пишут в очередь, а в поток/файл записи выводит отдельный поток QueueListener:
+    #цикл событий не блокируется на stdout
+    global _listener
+    if _listener is not None:
+        return
+    target = logging.FileHandler(path, encoding='utf-8') if path else logging.StreamHandler()
+    target.setFormatter(JsonFormatter())
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(records)]
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(records, target, respect_handler_level=True)
+    _listener.start()
+
+def stop_logging():
+    #Дописывает оставшиеся в очереди записи
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) #последняя - все, что больше верхней границы
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float):
+        #Оценка по корзинам: верхняя граница корзины, в которую попадает квантиль
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float('inf')
+
+def _labels(labels: tuple):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+class Metrics:
+    #Гистограммы и счетчики процесса. При нескольких воркерах у каждого свои,
+    #сборщик (Prometheus) опрашивает их и суммирует
+    def __init__(self):
+        self.histograms = {} #(имя, метки) -> Histogram
+        self.counters = {} #(имя, метки) -> число
+        self.collectors = [] #функции, возвращающие {имя: значение} - текущие показатели кэшей и очередей
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def register_collector(self, collector: Callable[[], Dict[str, float]]):
+        self.collectors.append(collector)
+
+    def register_stats(self, prefix: str, stats: Callable[[], dict]):
+        #Числовые поля из stats() сервиса (вложенные словари разворачиваются) становятся показателями prefix_поле
+        def collect():
+            gauges = {}
+            def walk(name, value):
+                if isinstance(value, dict):
+                    for key, item in value.items():
+                        walk(f"{name}_{key}", item)
+                elif isinstance(value, (int, float)):
+                    gauges[name] = value
+            walk(prefix, stats())
+            return gauges
+        self.register_collector(collect)
+
+    def _gauges(self):
+        gauges = {}
+        for collector in self.collectors:
+            try:
+                gauges.update(collector())
+            except Exception:
+                logger.exception("Ошибка сбора показателей")
+        return gauges
+
+    def render(self):
+        #Текстовый формат Prometheus
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(self.counters.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        for name, value in sorted(self._gauges().items()):
+            lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        #Короткая сводка для файла: количество, среднее и квантили по каждой гистограмме
+        return {
+            'histograms': {
+                f"{name}{_labels(labels)}": {
+                    'count': histogram.count,
+                    'mean': histogram.sum / histogram.count if histogram.count else 0.0,
+                    'p50': histogram.quantile(0.5),
+                    'p99': histogram.quantile(0.99),
+                }
+                for (name, labels), histogram in sorted(self.histograms.items())
+            },
+            'counters': {f"{name}{_labels(labels)}": value for (name, labels), value in sorted(self.counters.items())},
+            'gauges': self._gauges(),
+        }
+
+    def dump(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            if path.endswith('.json'):
+                json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+            else:
+                f.write(self.render())
+        logger.info("Метрики сохранены в %s", path)
+
+    def clear(self):
+        self.histograms.clear()
+        self.counters.clear()
+
+metrics = Metrics()
+
+#Время, проведенное текущим обработчиком в зависимостях (db, http, render); задает InstrumentationMiddleware
+_spans = contextvars.ContextVar('spans', default=None)
+
+def start_spans():
+    spans = {}
+    _spans.set(spans)
+    return spans
+
+@asynccontextmanager
+async def track(kind: str, **labels):
+    #Замер обращения к зависимости: общая гистограмма по виду и вклад в задержку текущего обработчика
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe('bot_dependency_seconds', elapsed, kind=kind, **labels)
+        spans = _spans.get()
+        if spans is not None:
+            spans[kind] = spans.get(kind, 0.0) + elapsed
+
+def dump_on_signal(path: str):
+    #kill -USR1 <pid> сохраняет текущие метрики в файл (.json - сводка с квантилями, иначе формат Prometheus)
+    if hasattr(signal, 'SIGUSR1'):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, metrics.dump, path)
+
+async def metrics_handler(request):
+    from aiohttp import web #серверная часть aiohttp нужна только для отдачи метрик
+    return web.Response(text=metrics.render(), content_type='text/plain', charset='utf-8')
+
+async def start_metrics_server(host: str, port: int):
+    #Отдельный HTTP-сервер с /metrics (в режиме вебхука - по одному на воркер, не на публичном порту вебхука)
+    from aiohttp import web
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Метрики доступны на http://%s:%s/metrics", host, port)
+    return runner
@@ -1,11 +1,44 @@
+import logging
+import math
+import time
+from typing import Dict, Optional
 from aiogram import BaseMiddleware
 from aiogram.types import Message
+from cache import TTLCache, MISS
 from database import Database
+from metrics import metrics, start_spans
+from rate_limit import TokenBuckets
 
-class LoggingMiddleware(BaseMiddleware):
-    async def __call__(self, handler, event: Message, data: dict):
-        print(f"Получено сообщение: {event.text}")
-        return await handler(event, data)
+logger = logging.getLogger(__name__)
+
+class InstrumentationMiddleware(BaseMiddleware):
+    #Задержка каждого обработчика и сколько из нее пришлось на БД, внешние API и графики (см. metrics.track).
+    #В журнал попадает структурированная запись без текста сообщения
+    async def __call__(self, handler, event, data):
+        callback = getattr(data.get('handler'), 'callback', None)
+        name = getattr(callback, '__name__', 'unknown')
+        spans = start_spans()
+        status = 'ok'
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = 'error'
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe('bot_handler_seconds', elapsed, handler=name)
+            for kind, seconds in spans.items():
+                metrics.observe('bot_handler_dependency_seconds', seconds, handler=name, kind=kind)
+            metrics.inc('bot_updates_total', handler=name, status=status)
+            user = getattr(event, 'from_user', None)
+            logger.info("Обработано обновление", extra={
+                'handler': name,
+                'user_id': user.id if user is not None else None,
+                'status': status,
+                'duration_ms': round(elapsed * 1000, 2),
+                **{f"{kind}_ms": round(seconds * 1000, 2) for kind, seconds in spans.items()},
+            })
 
 class DatabaseMiddleware(BaseMiddleware):
     def __init__(self, database: Database):
@@ -13,4 +46,55 @@ class DatabaseMiddleware(BaseMiddleware):
 
     async def __call__(self, handler, event, data):
         data["db"] = self.database
-        return await handler(event, data)
\ No newline at end of file
+        return await handler(event, data)
+
+class ServicesMiddleware(BaseMiddleware):
+    #Передает в обработчики общие сервисы (кэши, клиенты) как именованные аргументы
+    def __init__(self, **services):
+        self.services = services
+
+    async def __call__(self, handler, event, data):
+        data.update(self.services)
+        return await handler(event, data)
+
+#Классы команд для ограничения частоты: дешевые запросы получают больший бюджет,
+#тяжелые (графики в пуле процессов, поиск еды во внешнем API) - меньший
+COMMAND_CLASSES = {
+    'log_water': 'cheap',
+    'progress_graph': 'expensive',
+    'log_food': 'expensive',
+    'export': 'expensive',
+}
+
+def command_class(text: Optional[str]):
+    if not text or not text.startswith('/'):
+        return 'default' #ответы в анкете и ввод граммовки
+    command = text.split(maxsplit=1)[0][1:].split('@', 1)[0].lower()
+    return COMMAND_CLASSES.get(command, 'default')
+
+class RateLimitMiddleware(BaseMiddleware):
+    #Корзина токенов на пару (пользователь, класс команды). Сообщения сверх лимита отбрасываются,
+    #а пользователь получает одно предупреждение за период ожидания.
+    #При нескольких воркерах корзины у каждого процесса свои, так что лимит действует приблизительно
+    def __init__(self, limits: Dict[str, tuple], maxsize: int = 100000):
+        self.buckets = {name: TokenBuckets(rate, burst, maxsize=maxsize) for name, (rate, burst) in limits.items()}
+        self._warned = TTLCache(maxsize=maxsize, ttl=60)
+        self.rejected = 0
+
+    async def __call__(self, handler, event: Message, data: dict):
+        if event.from_user is None:
+            return await handler(event, data)
+        name = command_class(event.text)
+        buckets = self.buckets.get(name)
+        if buckets is None:
+            return await handler(event, data)
+        key = event.from_user.id
+        wait = buckets.consume(key)
+        if wait == 0:
+            return await handler(event, data)
+        self.rejected += 1
+        metrics.inc('bot_rate_limited_total', command_class=name)
+        if self._warned.get((key, name)) is MISS:
+            self._warned.set((key, name), True, ttl=wait)
+            await event.answer(f"Слишком много запросов. Попробуйте снова через {math.ceil(wait)} сек.")
+        return None
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Hashable
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+logger = logging.getLogger(__name__)
+
+def parse_limit(value: str):
+    #"30/60" -> не больше 30 штук за 60 секунд: (скорость в секунду, допустимый всплеск)
+    count, period = value.split('/')
+    return int(count) / float(period), int(count)
+
+class TokenBuckets:
+    #Корзины токенов для множества ключей в виде GCRA: на ключ хранится одно число -
+    #момент, когда корзина снова станет полной. Полная корзина ничем не отличается от отсутствующей,
+    #поэтому простаивающие ключи удаляются без потери точности (старые записи лежат в начале OrderedDict)
+    def __init__(self, rate: float, burst: int, maxsize: int = 100000):
+        self.interval = 1 / rate #сколько восстанавливается один токен
+        self.tolerance = (burst - 1) * self.interval
+        self.maxsize = maxsize
+        self._tat = OrderedDict() #key -> теоретическое время прихода следующего запроса
+        self.evictions = 0
+
+    def _evict(self, now: float):
+        while self._tat:
+            key, tat = next(iter(self._tat.items()))
+            if tat > now and len(self._tat) <= self.maxsize:
+                break
+            del self._tat[key]
+            self.evictions += 1
+
+    def consume(self, key: Hashable):
+        #Без ожидания: 0 - токен взят, иначе через сколько секунд он появится
+        now = time.monotonic()
+        tat = max(self._tat.get(key, now), now)
+        wait = tat - self.tolerance - now
+        if wait > 0:
+            return wait
+        self._tat[key] = tat + self.interval
+        self._tat.move_to_end(key)
+        self._evict(now)
+        return 0.0
+
+    def reserve(self, key: Hashable):
+        #С ожиданием: токен бронируется сразу, вызывающий ждет возвращенное число секунд.
+        #Ожидающие обслуживаются строго по очереди бронирования
+        now = time.monotonic()
+        tat = max(self._tat.get(key, now), now)
+        self._tat[key] = tat + self.interval
+        self._tat.move_to_end(key)
+        self._evict(now)
+        return max(0.0, tat - self.tolerance - now)
+
+    def __len__(self):
+        return len(self._tat)
+
+class SendThrottle(BaseRequestMiddleware):
+    #Исходящие запросы к Bot API: общий лимит на бота и лимит на чат (сообщения ставятся в очередь, а не
+    #получают 429), а при ответе 429 - повтор после retry_after
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, chat_burst: int = 3, max_retries: int = 3):
+        self.global_buckets = TokenBuckets(rate=global_rate, burst=max(1, int(global_rate)))
+        self.chat_buckets = TokenBuckets(rate=chat_rate, burst=chat_burst)
+        self.max_retries = max_retries
+        self.retries = 0
+        self.throttled = 0
+
+    async def _wait(self, chat_id):
+        #Сначала очередь чата, потом общая: иначе место в общей очереди простаивало бы, пока ждет чат
+        chat_delay = self.chat_buckets.reserve(chat_id)
+        if chat_delay > 0:
+            await asyncio.sleep(chat_delay)
+        global_delay = self.global_buckets.reserve(None)
+        if global_delay > 0:
+            await asyncio.sleep(global_delay)
+        if chat_delay > 0 or global_delay > 0:
+            self.throttled += 1
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, 'chat_id', None)
+        attempt = 0
+        while True:
+            if chat_id is not None:
+                await self._wait(chat_id)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                self.retries += 1
+                logger.warning("Telegram просит подождать %s сек (%s), повтор %s", e.retry_after, type(method).__name__, attempt)
+                await asyncio.sleep(e.retry_after)
@@ -0,0 +1,131 @@
+import asyncio
+import datetime
+import logging
+import time
+from typing import Optional
+from aiogram.exceptions import TelegramForbiddenError
+from database import Database
+from rate_limit import TokenBuckets
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('water', 'summary')
+MAX_PER_KIND = 12
+
+def format_minute(minute: int):
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+def parse_minute(value: str):
+    #"14:30" -> 870; None, если время некорректное
+    try:
+        hours, minutes = value.split(':')
+        hours, minutes = int(hours), int(minutes)
+    except ValueError:
+        return None
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        return None
+    return hours * 60 + minutes
+
+def reminder_text(reminder: dict):
+    #Текст напоминания или None, если отправлять нечего (норма воды уже выполнена)
+    if reminder['kind'] == 'water':
+        behind = reminder['water_goal'] - reminder['logged_water']
+        if behind <= 0:
+            return None
+        return (
+            f"💧 До цели по воде осталось {behind} мл "
+            f"(выпито {reminder['logged_water']} из {reminder['water_goal']} мл)\n"
+            "Записать: /log_water <количество>"
+        )
+    balance = reminder['logged_calories'] - reminder['burned_calories']
+    return (
+        "📋 Итоги дня\n"
+        f"Вода: {reminder['logged_water']} из {reminder['water_goal']} мл\n"
+        f"Калории: потреблено {reminder['logged_calories']:.0f}, сожжено {reminder['burned_calories']:.0f}, "
+        f"баланс {balance:.0f} из {reminder['calorie_goal']:.0f} ккал"
+    )
+
+class ReminderService:
+    #Напоминания из таблицы reminders. Тик (раз в tick секунд из Scheduler) одним запросом читает только
+    #напоминания наступивших минут вместе с итогами дня и ставит сообщения в очередь. Отправляют их
+    #несколько задач со своим лимитом send_rate, меньшим общего лимита бота: ответы на команды
+    #не ждут за рассылкой. Очередь не переживает перезапуск: напоминание считается отправленным, как только
+    #попало в очередь, а после простоя досылаются только пропущенные за последние catch_up_minutes
+    def __init__(self, db: Database, bot, send_rate: float = 20, senders: int = 8, catch_up_minutes: int = 15):
+        self.db = db
+        self.bot = bot
+        self.catch_up_minutes = catch_up_minutes
+        self.senders = senders
+        self._bucket = TokenBuckets(rate=send_rate, burst=max(1, int(send_rate)))
+        self._queue = asyncio.Queue()
+        self._tasks = []
+        self._checked = None #(дата, минута) предыдущего тика
+        self.due = 0
+        self.sent = 0
+        self.skipped = 0
+        self.failed = 0
+        self.last_tick_ms = 0.0
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._send_loop()) for _ in range(self.senders)]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if not self._queue.empty():
+            logger.warning("Не отправлено напоминаний при остановке: %s", self._queue.qsize())
+
+    async def tick(self, now: Optional[datetime.datetime] = None):
+        start = time.perf_counter()
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        date = now.date().isoformat()
+        minute = now.hour * 60 + now.minute
+        from_minute = max(0, minute - self.catch_up_minutes)
+        if self._checked is not None and self._checked[0] == date:
+            #Минуты до предыдущего тика уже разобраны; его минуту проверяем еще раз - в нее могли добавить напоминание
+            from_minute = max(from_minute, self._checked[1])
+        self._checked = (date, minute)
+        due = await self.db.get_due_reminders(date, from_minute, minute)
+        if due:
+            await self.db.mark_reminders_sent([(r['user_id'], r['kind'], r['at_minute']) for r in due], date)
+        for reminder in due:
+            text = reminder_text(reminder)
+            if text is None:
+                self.skipped += 1
+            else:
+                self._queue.put_nowait((reminder['user_id'], text))
+        self.due += len(due)
+        self.last_tick_ms = (time.perf_counter() - start) * 1000
+        return len(due)
+
+    async def _send_loop(self):
+        while True:
+            chat_id, text = await self._queue.get()
+            try:
+                delay = self._bucket.reserve(None)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await self.bot.send_message(chat_id=chat_id, text=text)
+                self.sent += 1
+            except TelegramForbiddenError:
+                #Пользователь заблокировал бота - больше ему не пишем
+                self.failed += 1
+                await self.db.delete_reminders(chat_id)
+            except Exception as e:
+                self.failed += 1
+                logger.warning("Не удалось отправить напоминание: %s", e, extra={'user_id': chat_id})
+            finally:
+                self._queue.task_done()
+
+    def stats(self):
+        return {
+            'queue': self._queue.qsize(),
+            'due': self.due,
+            'sent': self.sent,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'last_tick_ms': self.last_tick_ms,
+        }
@@ -0,0 +1,114 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+def next_daily_run(at: datetime.time, now: datetime.datetime = None):
+    #Ближайший момент (UTC) с временем суток at, строго позже now
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    run = datetime.datetime.combine(now.date(), at, tzinfo=datetime.timezone.utc)
+    if run <= now:
+        run += datetime.timedelta(days=1)
+    return run
+
+def parse_time(value: str):
+    #"03:30" -> datetime.time(3, 30)
+    hours, minutes = value.split(':')
+    return datetime.time(int(hours), int(minutes))
+
+class Scheduler:
+    #Фоновые задачи по расписанию в одном цикле: куча (время запуска, номер, задача),
+    #ждем только ближайшую. Каждый запуск - отдельная задача asyncio, поэтому долгая задача (пересчет норм,
+    #сжатие логов) не задерживает остальные (напоминания раз в минуту). Если предыдущий запуск задачи
+    #еще не закончился, очередной пропускается. Упавшая задача не мешает остальным
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._running = {} #имя -> задача asyncio текущего запуска
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+
+    def _push(self, when: float, name: str, job, reschedule):
+        heapq.heappush(self._heap, (when, next(self._seq), name, job, reschedule))
+        self._wakeup.set()
+
+    def daily(self, name: str, at: datetime.time, job: Callable[[], Awaitable]):
+        #Каждый день в at по UTC
+        def reschedule():
+            return next_daily_run(at).timestamp()
+        self._push(reschedule(), name, job, reschedule)
+
+    def every(self, name: str, interval: float, job: Callable[[], Awaitable]):
+        def reschedule():
+            return time.time() + interval
+        self._push(reschedule(), name, job, reschedule)
+
+    def once(self, name: str, when: float, job: Callable[[], Awaitable]):
+        #Один раз в момент when (unix time)
+        self._push(when, name, job, None)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        running = list(self._running.values())
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+        self._running.clear()
+
+    async def _run(self, name: str, job):
+        start = time.perf_counter()
+        try:
+            await job()
+            self.runs += 1
+            logger.info("Задача %s выполнена", name, extra={'job': name, 'duration_ms': round((time.perf_counter() - start) * 1000, 1)})
+        except Exception:
+            self.failures += 1
+            logger.exception("Ошибка в задаче %s", name)
+        finally:
+            self._running.pop(name, None)
+
+    async def _loop(self):
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            when = self._heap[0][0]
+            delay = when - time.time()
+            if delay > 0:
+                #Новая задача может оказаться раньше текущей ближайшей - тогда просыпаемся
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            _, _, name, job, reschedule = heapq.heappop(self._heap)
+            if name in self._running:
+                self.skipped += 1
+                logger.warning("Задача %s пропущена: предыдущий запуск еще не закончился", name)
+            else:
+                self._running[name] = asyncio.create_task(self._run(name, job))
+            if reschedule is not None:
+                self._push(reschedule(), name, job, reschedule)
+
+    def stats(self):
+        return {'scheduled': len(self._heap), 'running': len(self._running), 'runs': self.runs,
+                'failures': self.failures, 'skipped': self.skipped}
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Mapping, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+from aiogram.fsm.storage.memory import MemoryStorage
+from cache import TTLCache, MISS
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+#Пустая запись: состояние сброшено и данных нет, такую строку из таблицы удаляем
+EMPTY = (None, {})
+
+def _storage_key(key: StorageKey):
+    return ':'.join(str(part) for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id or '', key.business_connection_id or '', key.destiny
+    ))
+
+def _state_name(state: StateType):
+    return state.state if isinstance(state, State) else state
+
+class SQLiteStorage(BaseStorage):
+    #Состояния FSM в таблице fsm_states основной БД (методы Database: get_fsm_state, save_fsm_states).
+    #Переживают перезапуск, а при нескольких воркерах общие для всех процессов.
+    #Незавершенные диалоги старше ttl считаются брошенными: не читаются и периодически удаляются.
+    #
+    #С write_back=True изменения сначала попадают в память и пишутся в БД пачкой раз в flush_interval_ms
+    #(анкета делает update_data на каждом шаге). При падении теряются изменения за последний интервал.
+    #Кэш годится только для одного процесса: с несколькими воркерами следующий шаг диалога
+    #может прийти в другой процесс, поэтому там write_back выключается и каждое изменение сразу пишется в БД.
+    def __init__(self, db: Database, ttl: float = 24 * 3600, write_back: bool = True,
+                 flush_interval_ms: int = 500, cache_size: int = 10000, purge_interval: float = 600):
+        self.db = db
+        self.ttl = ttl
+        self.write_back = write_back
+        self.flush_interval = flush_interval_ms / 1000
+        self.purge_interval = purge_interval
+        self._cache = TTLCache(maxsize=cache_size, ttl=ttl) #key -> (state, data)
+        self._dirty = {} #измененные, но еще не записанные записи
+        self._flushing = {} #записи, которые сейчас пишутся в БД
+        self._task = None
+        self._ready = False
+        self._connect_lock = asyncio.Lock()
+        self._last_purge = 0.0
+        self.flushes = 0
+
+    async def connect(self):
+        async with self._connect_lock:
+            if self._ready:
+                return
+            await self.db.create_fsm_table()
+            self._ready = True
+            self._task = asyncio.create_task(self._loop())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._ready:
+            await self.flush() #не теряем незаписанные шаги при остановке
+        self._ready = False
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval if self.write_back else self.purge_interval)
+            try:
+                await self.flush()
+                if time.time() - self._last_purge >= self.purge_interval:
+                    await self.purge()
+            except Exception as e:
+                logger.error("Ошибка записи состояний FSM в БД: %s", e)
+
+    async def flush(self):
+        #Все накопленные изменения - одной транзакцией
+        if not self._dirty:
+            return
+        batch, self._dirty = self._dirty, {}
+        self._flushing = batch
+        try:
+            await self._store(batch)
+            self.flushes += 1
+        except BaseException:
+            #Более новые изменения, пришедшие во время записи, важнее возвращаемых
+            for key, record in batch.items():
+                self._dirty.setdefault(key, record)
+            raise
+        finally:
+            self._flushing = {}
+
+    async def purge(self):
+        self._last_purge = time.time()
+        await self.db.purge_fsm_states(self._last_purge - self.ttl)
+
+    async def _store(self, records: Dict[str, tuple]):
+        now = time.time()
+        upserts = []
+        deletes = []
+        for key, (state, data) in records.items():
+            if state is None and not data:
+                deletes.append(key)
+            else:
+                upserts.append((key, state, json.dumps(data, ensure_ascii=False), now))
+        await self.db.save_fsm_states(upserts, deletes)
+
+    async def _load(self, key: str):
+        record = self._dirty.get(key) or self._flushing.get(key)
+        if record is not None:
+            return record
+        if self.write_back:
+            record = self._cache.get(key)
+            if record is not MISS:
+                return record
+        if not self._ready:
+            await self.connect()
+        row = await self.db.get_fsm_state(key, time.time() - self.ttl)
+        if row is None:
+            record, ttl = EMPTY, self.ttl
+        else:
+            record, ttl = (row[0], json.loads(row[1])), row[2] + self.ttl - time.time()
+        if self.write_back:
+            self._cache.set(key, record, ttl=ttl)
+        return record
+
+    async def _save(self, key: str, record: tuple):
+        if not self._ready:
+            await self.connect()
+        if self.write_back:
+            self._cache.set(key, record)
+            self._dirty[key] = record
+        else:
+            await self._store({key: record})
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = _storage_key(key)
+        _, data = await self._load(storage_key)
+        await self._save(storage_key, (_state_name(state), data))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(_storage_key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        storage_key = _storage_key(key)
+        state, _ = await self._load(storage_key)
+        await self._save(storage_key, (state, dict(data)))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(_storage_key(key))
+        return data.copy()
+
+    def stats(self):
+        return {'dirty': len(self._dirty), 'flushes': self.flushes, **self._cache.stats()}
+
+def create_storage(kind: str, db: Database, ttl: float, write_back: bool = True, flush_interval_ms: int = 500):
+    #memory - состояния в памяти процесса (по умолчанию в aiogram), sqlite - таблица в основной БД
+    if kind == 'memory':
+        return MemoryStorage()
+    if kind == 'sqlite':
+        return SQLiteStorage(db, ttl=ttl, write_back=write_back, flush_interval_ms=flush_interval_ms)
+    raise ValueError(f"Неизвестный тип хранилища FSM: {kind}")
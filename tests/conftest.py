@@ -0,0 +1,32 @@
+import os
+
+#config.py требует токены при импорте; внешние API в тестах не вызываются (см. upstream)
+os.environ.setdefault('BOT_TOKEN', '123456:test')
+os.environ.setdefault('WEATHER_API_KEY', 'test')
+
+import contextlib
+
+import pytest
+from aiohttp import web
+
+import http_client
+
+@pytest.fixture
+def upstream():
+    #Локальный HTTP-сервер вместо внешнего API: async with upstream(handler) as url
+    @contextlib.asynccontextmanager
+    async def serve(handler):
+        app = web.Application()
+        app.router.add_get('/{tail:.*}', handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        try:
+            yield f"http://127.0.0.1:{port}/"
+        finally:
+            await http_client.close_session()
+            await runner.cleanup()
+
+    return serve
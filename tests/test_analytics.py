@@ -0,0 +1,48 @@
+import asyncio
+import datetime
+
+import pytest
+
+from analytics import progress_report
+from database import Database
+
+HISTORY = 400
+WATER_GOAL = 2500
+CALORIE_GOAL = 2100
+
+async def _reports(path: str, days: int, every: int, water: int, calories: float, burned: float):
+    #Отчет за days дней до и после сжатия логов старше 90 дней; записи - каждый every-й день истории
+    db = Database(path, readers=1)
+    await db.create_tables()
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    try:
+        for offset in range(0, HISTORY, every):
+            date = (today - datetime.timedelta(days=offset)).isoformat()
+            await db.increment_water(1, water, date)
+            await db.increment_calories(1, calories, date)
+            await db.increment_burned(1, burned, date)
+        before = await progress_report(db, 1, days, WATER_GOAL, CALORIE_GOAL, today=today)
+        assert await db.compact_logs(90) > 0
+        after = await progress_report(db, 1, days, WATER_GOAL, CALORIE_GOAL, today=today)
+    finally:
+        await db.close()
+    return before, after
+
+@pytest.mark.parametrize('days', [366, 200, 120])
+def test_report_totals_survive_compaction(tmp_path, days):
+    before, after = asyncio.run(_reports(str(tmp_path / 'users.db'), days, 1, 1000, 2000, 300))
+    assert before['days_logged'] == after['days_logged'] == days
+    assert before['water_mean'] == after['water_mean'] == 1000
+    assert before['balance_mean'] == after['balance_mean'] == 1700
+    assert after['balance_total'] == pytest.approx(before['balance_total']) == (1700 - CALORIE_GOAL) * days
+
+@pytest.mark.parametrize('days', [366, 200, 120])
+def test_sparse_report_survives_compaction(tmp_path, days):
+    #Записи раз в 5 дней: дни без записей в сжатых месяцах не должны считаться днями с записями
+    before, after = asyncio.run(_reports(str(tmp_path / 'users.db'), days, 5, 3000, 2300, 300))
+    assert before['days_logged'] == len(range(0, days, 5))
+    #Граничный месяц периода попадает в него частично - число дней с записями в нем оценивается пропорционально
+    assert after['days_logged'] == pytest.approx(before['days_logged'], abs=1)
+    assert after['water_mean'] == pytest.approx(before['water_mean']) == 3000
+    assert after['balance_mean'] == pytest.approx(before['balance_mean']) == 2000
+    assert after['balance_total'] == pytest.approx(before['balance_total'], abs=abs(2000 - CALORIE_GOAL))
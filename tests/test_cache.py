@@ -0,0 +1,32 @@
+import time
+
+from cache import TTLCache, MISS
+
+def test_entry_expires_after_ttl():
+    cache = TTLCache(ttl=0.05)
+    cache.set('Москва', 21.5)
+    cache.set('Казань', 18.0, ttl=10) #свой срок жизни у записи
+    assert cache.get('Москва') == 21.5
+    time.sleep(0.1)
+    assert cache.get('Москва') is MISS
+    assert cache.get('Казань') == 18.0
+    stats = cache.stats()
+    assert (stats['size'], stats['hits'], stats['misses'], stats['expirations']) == (1, 2, 1, 1)
+
+def test_cached_none_is_a_hit():
+    cache = TTLCache()
+    cache.set('неизвестный продукт', None)
+    assert cache.get('неизвестный продукт') is None
+    assert cache.get('другой продукт') is MISS
+    assert cache.get('другой продукт', default=0) == 0
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2)
+    cache.set(1, 'a')
+    cache.set(2, 'b')
+    cache.get(1) #1 используется недавно - вытесняется 2
+    cache.set(3, 'c')
+    assert (cache.get(1), cache.get(2), cache.get(3)) == ('a', MISS, 'c')
+    assert cache.stats()['evictions'] == 1
+    assert cache.pop(3) == 'c' and cache.pop(3) is MISS
+    assert len(cache) == 1
@@ -0,0 +1,40 @@
+import asyncio
+import datetime
+
+import challenges
+from challenges import ChallengeService, KEEP_FINISHED_DAYS
+from database import Database
+
+def _day(offset: int):
+    return (datetime.date(2026, 1, 1) + datetime.timedelta(days=offset)).isoformat()
+
+async def _finish(path: str, monkeypatch):
+    #Однодневное соревнование и недельное: через KEEP_FINISHED_DAYS дней после конца первого в памяти остается только второе
+    db = Database(path, readers=1)
+    await db.create_tables()
+    monkeypatch.setattr(challenges, '_today', lambda: _day(0))
+    service = ChallengeService(db)
+    try:
+        short = await service.create(1, 'Аня', 'water', 1, 'Один день')
+        await service.join(short['id'], 2, 'Борис')
+        week = await service.create(2, 'Борис', 'water', 7, 'Неделя')
+        service.record(1, 'logged_water', 500)
+        service.record(2, 'logged_water', 300)
+
+        monkeypatch.setattr(challenges, '_today', lambda: _day(KEEP_FINISHED_DAYS))
+        kept = service.evict_finished()
+        monkeypatch.setattr(challenges, '_today', lambda: _day(KEEP_FINISHED_DAYS + 1))
+        #Проверка по таймеру - при обычных вызовах сервиса
+        monkeypatch.setattr(challenges, 'EVICT_INTERVAL', 0)
+        service.record(1, 'logged_water', 500)
+        return kept, service, short, week, await service.get(short['id'])
+    finally:
+        await db.close()
+
+def test_finished_challenge_is_evicted(tmp_path, monkeypatch):
+    kept, service, short, week, evicted = asyncio.run(_finish(str(tmp_path / 'users.db'), monkeypatch))
+    assert kept == 0
+    assert evicted is None
+    assert service.user_challenges(1) == []
+    assert [challenge['id'] for challenge in service.user_challenges(2)] == [week['id']]
+    assert service.stats() == {'challenges': 1, 'members': 1, 'updates': 3, 'rebuilds': 0, 'evicted': 1}
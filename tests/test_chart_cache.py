@@ -0,0 +1,41 @@
+import asyncio
+import os
+
+from chart_cache import ChartCache
+
+PNG = b'\x89PNG' + bytes(1000)
+
+async def _spill_and_read(spill_dir: str):
+    #Память на 2 графика: остальные вытесняются на диск и читаются оттуда
+    cache = ChartCache(max_bytes=2 * (len(PNG) + 1), spill_dir=spill_dir, spill_max_files=10000)
+    for user_id in range(5):
+        cache.put(user_id, f"key-{user_id}", PNG + bytes([user_id]))
+    await cache.close()
+    on_disk = sorted(os.listdir(spill_dir))
+
+    cache = ChartCache(max_bytes=2 * len(PNG), spill_dir=spill_dir)
+    try:
+        return on_disk, await cache.get_png('key-0'), await cache.get_png('key-missing'), cache.stats()
+    finally:
+        await cache.close()
+
+def test_evicted_charts_spill_to_disk_and_read_back(tmp_path):
+    on_disk, png, missing, stats = asyncio.run(_spill_and_read(str(tmp_path)))
+    assert on_disk == [f"key-{user_id}.png" for user_id in range(3)]
+    assert png == PNG + bytes([0])
+    assert missing is None
+    assert (stats['disk_hits'], stats['misses']) == (1, 1)
+
+async def _invalidate(spill_dir: str):
+    cache = ChartCache(max_bytes=len(PNG) + 1, spill_dir=spill_dir)
+    cache.put(1, 'key-1', PNG)
+    cache.put(2, 'key-2', PNG) #key-1 уходит на диск
+    cache.invalidate(1)
+    try:
+        return await cache.get_png('key-1')
+    finally:
+        await cache.close()
+
+def test_invalidated_chart_is_removed_from_disk(tmp_path):
+    assert asyncio.run(_invalidate(str(tmp_path))) is None
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from database import Database
+
+async def _undo_meal(path: str, write_behind: bool):
+    db = Database(path, readers=1, write_behind=write_behind)
+    await db.create_tables()
+    try:
+        await db.log_water(1, 300)
+        await db.log_foods(1, [('гречка', 150, 165.0), ('курица', 200, 330.0), ('огурец', 80, 12.0)])
+        first = await db.undo_last_entry(1)
+        second = await db.undo_last_entry(1)
+        return first, second, await db.get_today_logs(1)
+    finally:
+        await db.close()
+
+@pytest.mark.parametrize('write_behind', [False, True])
+def test_undo_removes_last_item_of_meal(tmp_path, write_behind):
+    first, second, logs = asyncio.run(_undo_meal(str(tmp_path / 'users.db'), write_behind))
+    assert (first[0], first[1]['name']) == ('food', 'огурец')
+    assert first[2]['logged_calories'] == pytest.approx(495.0)
+    assert (second[0], second[1]['name']) == ('food', 'курица')
+    assert second[2]['logged_calories'] == pytest.approx(165.0)
+    assert logs['logged_calories'] == pytest.approx(165.0)
+    assert logs['logged_water'] == 300
+
+async def _undo_during_log(path: str):
+    #Вода записывается, пока /undo отменяет предыдущую запись: итоги в ответе на /undo ее учитывают
+    db = Database(path, readers=1, write_behind=True)
+    await db.create_tables()
+    try:
+        await db.log_water(1, 300)
+        await db.log_water(1, 500)
+        undone, _ = await asyncio.gather(db.undo_last_entry(1), db.log_water(1, 200))
+        return undone, await db.get_today_logs(1)
+    finally:
+        await db.close()
+
+def test_undo_totals_include_concurrent_write_behind_log(tmp_path):
+    (kind, entry, totals), logs = asyncio.run(_undo_during_log(str(tmp_path / 'users.db')))
+    assert (kind, entry['amount']) == ('water', 500)
+    assert totals['logged_water'] == 300 + 200
+    assert logs['logged_water'] == 300 + 200
+
+async def _undo_from_two_workers(path: str, entries: int):
+    #Два процесса (два экземпляра Database на одном файле) отменяют записи одновременно
+    workers = [Database(path, readers=1), Database(path, readers=1)]
+    await workers[0].create_tables()
+    try:
+        for amount in range(1, entries + 1):
+            await workers[0].log_water(1, amount)
+        results = await asyncio.gather(*(workers[i % 2].undo_last_entry(1) for i in range(entries + 2)))
+        return results, await workers[1].get_today_logs(1)
+    finally:
+        for db in workers:
+            await db.close()
+
+def test_concurrent_undo_cancels_each_entry_once(tmp_path):
+    results, logs = asyncio.run(_undo_from_two_workers(str(tmp_path / 'users.db'), 10))
+    undone = [result[1]['amount'] for result in results if result is not None]
+    assert sorted(undone) == list(range(1, 11))
+    assert results.count(None) == 2
+    assert logs['logged_water'] == 0
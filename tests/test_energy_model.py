@@ -0,0 +1,59 @@
+import asyncio
+
+from database import Database
+from energy_model import EnergyModel, recompute_all
+
+PROFILE = {'weight': 70, 'height': 175, 'age': 30, 'gender': 'М', 'activity': 30, 'city': 'Москва',
+           'water_goal': 2600, 'calorie_goal': 2000}
+SAVED = {**PROFILE, 'weight': 90, 'water_goal': 3200, 'calorie_goal': 2500, 'calorie_goal_custom': True}
+
+async def _save_during_recompute(path: str, calories: bool):
+    #Шаги recompute_all по отдельности: снимок профилей, расчет, сохранение профиля пользователем, запись целей.
+    #Новые цели пользователя не должны затираться рассчитанными по старому снимку
+    db = Database(path, readers=1)
+    await db.create_tables()
+    try:
+        await db.save_user(1, PROFILE)
+        await db.save_user(2, PROFILE)
+        model = EnergyModel()
+        goals = []
+        async for users in db.iter_users():
+            goals.extend(model.recompute_goals(users, {'Москва': 30.0}, calories))
+        await db.save_user(1, SAVED)
+        changed = await db.update_user_goals(goals, calories)
+        return len(goals), changed, await db.get_user(1), await db.get_user(2)
+    finally:
+        await db.close()
+
+def test_water_only_recompute_keeps_concurrent_save(tmp_path):
+    computed, changed, saved, other = asyncio.run(_save_during_recompute(str(tmp_path / 'users.db'), calories=False))
+    assert computed == 2 and changed == 1
+    assert (saved['water_goal'], saved['calorie_goal']) == (3200, 2500)
+    assert other['water_goal'] == 70 * 30 + 500 + 500
+    assert other['calorie_goal'] == 2000
+
+def test_full_recompute_keeps_concurrent_save(tmp_path):
+    computed, changed, saved, other = asyncio.run(_save_during_recompute(str(tmp_path / 'users.db'), calories=True))
+    assert computed == 2 and changed == 1
+    assert (saved['water_goal'], saved['calorie_goal']) == (3200, 2500)
+    assert other['calorie_goal'] != 2000
+
+async def _recompute_all(path: str):
+    db = Database(path, readers=1)
+    await db.create_tables()
+    try:
+        for user_id in range(1, 4):
+            await db.save_user(user_id, PROFILE)
+        await db.save_user(4, SAVED)
+        first = await recompute_all(db, EnergyModel(), {'Москва': 30.0})
+        second = await recompute_all(db, EnergyModel(), {'Москва': 30.0})
+        return first, second, await db.get_user(1), await db.get_user(4)
+    finally:
+        await db.close()
+
+def test_recompute_all_updates_only_changed_goals(tmp_path):
+    first, second, user, custom = asyncio.run(_recompute_all(str(tmp_path / 'users.db')))
+    assert first == (4, 4) and second == (4, 0)
+    assert user['water_goal'] == 70 * 30 + 500 + 500 and user['calorie_goal'] != 2000
+    #Цель по калориям, введенная вручную, не пересчитывается
+    assert (custom['water_goal'], custom['calorie_goal']) == (90 * 30 + 500 + 500, 2500)
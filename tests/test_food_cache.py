@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+import food_cache
+from database import Database
+from food_cache import FoodCache
+from utils import ExternalApiError
+
+def _api(results):
+    #Заглушка Open Food Facts: ответы по названию продукта, ExternalApiError - ошибка сети
+    calls = []
+
+    async def get_food_info(product_name, raise_errors=False):
+        calls.append(product_name)
+        result = results.get(product_name)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return get_food_info, calls
+
+async def _run(path: str, scenario):
+    db = Database(path, readers=1)
+    await db.create_tables()
+    try:
+        return await scenario(FoodCache(db))
+    finally:
+        await db.close()
+
+@pytest.mark.parametrize('calories', [0, -5, 901, 99999])
+def test_implausible_manual_calories_are_not_shared(tmp_path, monkeypatch, calories):
+    fake, _ = _api({})
+    monkeypatch.setattr(food_cache, 'get_food_info', fake)
+
+    async def scenario(cache):
+        assert await cache.remember_manual('пирог бабушкин', calories) is False
+        return await cache.get('пирог бабушкин')
+
+    assert asyncio.run(_run(str(tmp_path / 'users.db'), scenario)) is None
+
+def test_manual_calories_are_a_fallback_for_api_misses(tmp_path, monkeypatch):
+    fake, calls = _api({'пирог бабушкин': None})
+    monkeypatch.setattr(food_cache, 'get_food_info', fake)
+
+    async def scenario(cache):
+        assert await cache.get('пирог бабушкин') is None
+        assert await cache.remember_manual('Пирог бабушкин', 250) is True
+        first = await cache.get('пирог бабушкин')
+        second = await cache.get('пирог бабушкин')
+        return first, second
+
+    first, second = asyncio.run(_run(str(tmp_path / 'users.db'), scenario))
+    assert first == second == {'name': 'Пирог бабушкин', 'calories': 250}
+    assert len(calls) == 2 #второй раз - после ручного ввода, дальше из памяти
+
+def test_api_answer_wins_over_manual_calories(tmp_path, monkeypatch):
+    fake, _ = _api({'гречка': {'name': 'Гречка', 'calories': 313}})
+    monkeypatch.setattr(food_cache, 'get_food_info', fake)
+
+    async def scenario(cache):
+        await cache.remember_manual('гречка', 5)
+        return await cache.get('гречка'), await cache.get('гречка')
+
+    assert asyncio.run(_run(str(tmp_path / 'users.db'), scenario)) == ({'name': 'Гречка', 'calories': 313},) * 2
+
+def test_manual_calories_used_when_api_fails(tmp_path, monkeypatch):
+    fake, _ = _api({'пирог бабушкин': ExternalApiError("timeout")})
+    monkeypatch.setattr(food_cache, 'get_food_info', fake)
+
+    async def scenario(cache):
+        await cache.remember_manual('пирог бабушкин', 250)
+        return await cache.get('пирог бабушкин')
+
+    assert asyncio.run(_run(str(tmp_path / 'users.db'), scenario)) == {'name': 'пирог бабушкин', 'calories': 250}
@@ -0,0 +1,52 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.filters import CommandObject
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+import food_cache
+from chart_cache import ChartCache
+from database import Database
+from food_cache import FoodCache
+from handlers import cmd_log_food, log_food
+
+PROFILE = {'weight': 70, 'height': 175, 'age': 30, 'gender': 'М', 'activity': 30, 'city': 'Москва',
+           'water_goal': 2600, 'calorie_goal': 2000}
+
+async def _not_found(product_name, raise_errors=False):
+    return None
+
+async def _two_meals(path: str):
+    #Второй /log_food, пока бот еще спрашивает о продуктах первого: ни один продукт не теряется
+    db = Database(path, readers=1)
+    await db.create_tables()
+    await db.save_user(1, PROFILE)
+    state = FSMContext(storage=MemoryStorage(), key=StorageKey(bot_id=1, chat_id=1, user_id=1))
+    services = {'db': db, 'food_cache': FoodCache(db), 'chart_cache': ChartCache()}
+    answers = []
+
+    async def answer(text, **kwargs):
+        answers.append(text)
+
+    def message(text=None):
+        return SimpleNamespace(from_user=SimpleNamespace(id=1), text=text, answer=answer)
+
+    try:
+        await cmd_log_food(message(), CommandObject(command='log_food', args='пирог 100, блин'), state, **services)
+        await cmd_log_food(message(), CommandObject(command='log_food', args='торт 50'), state, **services)
+        for text in ['250', '200', '100', '300']: #пирог, блин (калорийность и вес), торт
+            await log_food(message(text), state, **services)
+        return answers, await state.get_state(), await db.get_today_logs(1)
+    finally:
+        await db.close()
+
+def test_second_meal_is_queued_after_pending_one(tmp_path, monkeypatch):
+    monkeypatch.setattr(food_cache, 'get_food_info', _not_found)
+    answers, state, logs = asyncio.run(_two_meals(str(tmp_path / 'users.db')))
+    assert any('Добавлено в очередь: «торт»' in text for text in answers)
+    assert [text.split('\n')[0] for text in answers if text.startswith('Записано')] == \
+        ['Записано: 250.0 ккал', 'Записано: 200.0 ккал', 'Записано: 150.0 ккал']
+    assert logs['logged_calories'] == 600
+    assert state is None
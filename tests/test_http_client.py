@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+import http_client
+import utils
+from utils import ExternalApiError
+
+async def _timeout(upstream, monkeypatch):
+    #API зависает: запросы укладываются в таймаут и возвращают "нет данных", сессия остается рабочей
+    async def handler(request):
+        if request.path == '/slow':
+            await asyncio.sleep(1)
+        return web.json_response({'main': {'temp': 5.0}, 'products': [{'product_name': 'Овсянка', 'nutriments': {'energy-kcal_100g': 352}}]})
+
+    async with upstream(handler) as url:
+        monkeypatch.setattr(utils, 'weather_timeout', aiohttp.ClientTimeout(total=0.1))
+        monkeypatch.setattr(utils, 'food_timeout', aiohttp.ClientTimeout(total=0.1))
+        monkeypatch.setattr(utils, 'WEATHER_API_URL', url + 'slow')
+        monkeypatch.setattr(utils, 'FOOD_API_URL', url + 'slow')
+        session = await http_client.start_session()
+        start = time.perf_counter()
+        temperature = await utils.get_temperature('Москва')
+        food = await utils.get_food_info('овсянка')
+        with pytest.raises(ExternalApiError):
+            await utils.get_food_info('овсянка', raise_errors=True)
+        elapsed = time.perf_counter() - start
+
+        monkeypatch.setattr(utils, 'WEATHER_API_URL', url + 'fast')
+        monkeypatch.setattr(utils, 'FOOD_API_URL', url + 'fast')
+        recovered = await utils.get_temperature('Москва'), await utils.get_food_info('овсянка')
+        same_session = http_client.get_session() is session
+    return temperature, food, elapsed, recovered, same_session
+
+def test_timeout_falls_back_cleanly(upstream, monkeypatch):
+    temperature, food, elapsed, recovered, same_session = asyncio.run(_timeout(upstream, monkeypatch))
+    assert temperature is None and food is None
+    assert elapsed < 0.9
+    assert recovered == (5.0, {'name': 'Овсянка', 'calories': 352})
+    assert same_session
+
+def test_session_is_recreated_after_close():
+    async def scenario():
+        session = await http_client.start_session()
+        await http_client.close_session()
+        recreated = http_client.get_session()
+        try:
+            return session.closed, recreated is not session and not recreated.closed
+        finally:
+            await http_client.close_session()
+
+    assert asyncio.run(scenario()) == (True, True)
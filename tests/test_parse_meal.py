@@ -0,0 +1,14 @@
+import pytest
+
+from handlers import parse_meal
+
+@pytest.mark.parametrize('text, expected', [
+    ('гречка 150, курица 200, огурец 80', [('гречка', 150), ('курица', 200), ('огурец', 80)]),
+    ('гречка 150,курица 200; огурец\nбанан 120 г', [('гречка', 150), ('курица', 200), ('огурец', None), ('банан', 120)]),
+    ('молоко 3,2% 200', [('молоко 3,2%', 200)]),
+    ('молоко 3,2%', [('молоко 3,2%', None)]),
+    ('молоко 2,5% 250 мл, творог 5% 100', [('молоко 2,5%', 250), ('творог 5%', 100)]),
+    ('кефир 1,5 %, хлеб 40', [('кефир 1,5 %', None), ('хлеб', 40)]),
+])
+def test_parse_meal(text, expected):
+    assert parse_meal(text) == expected
@@ -0,0 +1,42 @@
+import asyncio
+
+from scheduler import Scheduler
+
+async def _slow_and_fast(seconds: float):
+    #Долгая задача (как пересчет норм воды) и частая (как тик напоминаний) в одном планировщике
+    scheduler = Scheduler()
+    fast_runs = []
+    slow = {'active': 0, 'max_active': 0, 'runs': 0}
+
+    async def slow_job():
+        slow['active'] += 1
+        slow['max_active'] = max(slow['max_active'], slow['active'])
+        try:
+            await asyncio.sleep(0.3)
+            slow['runs'] += 1
+        finally:
+            slow['active'] -= 1
+
+    async def fast_job():
+        fast_runs.append(asyncio.get_running_loop().time())
+
+    async def failing_job():
+        raise RuntimeError("ошибка задачи")
+
+    scheduler.every('slow', 0.05, slow_job)
+    scheduler.every('fast', 0.02, fast_job)
+    scheduler.every('failing', 0.1, failing_job)
+    scheduler.start()
+    await asyncio.sleep(seconds)
+    await scheduler.close()
+    return scheduler.stats(), fast_runs, slow
+
+def test_slow_job_does_not_delay_others():
+    stats, fast_runs, slow = asyncio.run(_slow_and_fast(1.0))
+    #Без параллельного запуска частая задача ждала бы каждый раз по 0.3 с
+    assert len(fast_runs) >= 20
+    assert max(b - a for a, b in zip(fast_runs, fast_runs[1:])) < 0.2
+    assert slow['max_active'] == 1 and slow['runs'] >= 2
+    assert stats['skipped'] > 0
+    assert stats['failures'] >= 5
+    assert stats['running'] == 0
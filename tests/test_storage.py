@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+from database import Database
+from storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+OTHER = StorageKey(bot_id=1, chat_id=20, user_id=20)
+
+async def _restart(path: str, write_back: bool, ttl: float = 3600, pause: float = 0):
+    #Анкета на середине, перезапуск бота (новые Database и SQLiteStorage на том же файле) - диалог продолжается
+    db = Database(path, readers=1)
+    await db.create_tables()
+    storage = SQLiteStorage(db, ttl=ttl, write_back=write_back, flush_interval_ms=60000)
+    await storage.set_state(KEY, 'Form:weight')
+    await storage.update_data(KEY, {'weight': 70})
+    await storage.update_data(KEY, {'height': 180})
+    await storage.set_state(OTHER, 'Form:city')
+    await storage.set_state(OTHER, None) #диалог завершен - после перезапуска его нет
+    await storage.close()
+    await db.close()
+
+    await asyncio.sleep(pause)
+    db = Database(path, readers=1)
+    storage = SQLiteStorage(db, ttl=ttl, write_back=write_back)
+    try:
+        return (await storage.get_state(KEY), await storage.get_data(KEY),
+                await storage.get_state(OTHER), await storage.get_data(OTHER))
+    finally:
+        await storage.close()
+        await db.close()
+
+@pytest.mark.parametrize('write_back', [True, False])
+def test_state_and_data_survive_restart(tmp_path, write_back):
+    state, data, other_state, other_data = asyncio.run(_restart(str(tmp_path / 'users.db'), write_back))
+    assert state == 'Form:weight'
+    assert data == {'weight': 70, 'height': 180}
+    assert (other_state, other_data) == (None, {})
+
+@pytest.mark.parametrize('write_back', [True, False])
+def test_abandoned_dialog_expires(tmp_path, write_back):
+    state, data, _, _ = asyncio.run(_restart(str(tmp_path / 'users.db'), write_back, ttl=0.2, pause=0.3))
+    assert (state, data) == (None, {})
@@ -0,0 +1,45 @@
+import asyncio
+
+from aiohttp import web
+
+import utils
+from weather import WeatherService
+
+async def _concurrent(upstream, monkeypatch):
+    #Много пользователей одного города одновременно запрашивают погоду при пустом кэше
+    requests = []
+
+    async def handler(request):
+        requests.append(request.query['q'])
+        await asyncio.sleep(0.1)
+        return web.json_response({'main': {'temp': 21.5}})
+
+    async with upstream(handler) as url:
+        monkeypatch.setattr(utils, 'WEATHER_API_URL', url)
+        weather = WeatherService()
+        first = await asyncio.gather(*(weather.get_temperature(city) for city in ['Москва', 'москва', ' МОСКВА '] * 10))
+        cached = await weather.get_temperature('Москва')
+    return first, cached, requests, weather.stats()
+
+def test_concurrent_requests_make_one_upstream_call(upstream, monkeypatch):
+    first, cached, requests, stats = asyncio.run(_concurrent(upstream, monkeypatch))
+    assert first == [21.5] * 30 and cached == 21.5
+    assert requests == ['Москва']
+    assert (stats['api_calls'], stats['coalesced']) == (1, 29)
+
+async def _errors(upstream, monkeypatch):
+    #Ошибка API не кэшируется: следующий запрос снова идет в API
+    statuses = [500, 200]
+
+    async def handler(request):
+        if statuses.pop(0) == 500:
+            return web.Response(status=500, text='error')
+        return web.json_response({'main': {'temp': -3.0}})
+
+    async with upstream(handler) as url:
+        monkeypatch.setattr(utils, 'WEATHER_API_URL', url)
+        weather = WeatherService()
+        return await weather.get_temperature('Мурманск'), await weather.get_temperature('Мурманск')
+
+def test_upstream_error_is_not_cached(upstream, monkeypatch):
+    assert asyncio.run(_errors(upstream, monkeypatch)) == (None, -3.0)
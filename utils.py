@@ -1,44 +1,80 @@
 import asyncio
+import logging
 import aiohttp
-from config import WEATHER_API_KEY
+from config import WEATHER_API_KEY, WEATHER_API_URL, WEATHER_FORECAST_URL, FOOD_API_URL, WEATHER_TIMEOUT, FOOD_TIMEOUT
+from http_client import get_session
+from metrics import track
+
+logger = logging.getLogger(__name__)
+
+weather_timeout = aiohttp.ClientTimeout(total=WEATHER_TIMEOUT)
+food_timeout = aiohttp.ClientTimeout(total=FOOD_TIMEOUT)
+
+class ExternalApiError(Exception):
+    #Внешний сервис не ответил или ответил ошибкой (в отличие от "ничего не найдено")
+    pass
 
 async def get_temperature(city: str):
-    url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={WEATHER_API_KEY}&units=metric"
-
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data['main']['temp']
-                else:
-                    print(f"Ошибка API: {response.status}, {await response.text()}")
-        except aiohttp.ClientError as e:
-            print(f"Ошибка клиента API: {e}")
-        except asyncio.TimeoutError:
-            print("Ошибка: Таймаут при запросе к API")
+    params = {'q': city, 'appid': WEATHER_API_KEY, 'units': 'metric'}
+
+    session = get_session()
+    try:
+        async with track('http', api='weather'), \
+                session.get(WEATHER_API_URL, params=params, timeout=weather_timeout) as response:
+            if response.status == 200:
+                data = await response.json()
+                return data['main']['temp']
+            else:
+                logger.warning("Ошибка API погоды: %s, %s", response.status, await response.text())
+    except aiohttp.ClientError as e:
+        logger.warning("Ошибка клиента API погоды: %s", e)
+    except asyncio.TimeoutError:
+        logger.warning("Таймаут при запросе к API погоды")
     return None
 
-async def get_food_info(product_name: str):
-    url = f"https://world.openfoodfacts.org/cgi/search.pl?action=process&search_terms={product_name}&json=true"
-
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    products = data.get('products', [])
-                    if products:
-                        first_product = products[0]
-                        return {
-                            'name': first_product.get('product_name', 'Неизвестно'),
-                            'calories': first_product.get('nutriments', {}).get('energy-kcal_100g', 0)
-                        }
-                    return None
-                else:
-                    print(f"Ошибка API: {response.status}, {await response.text()}")
-        except aiohttp.ClientError as e:
-            print(f"Ошибка клиента API: {e}")
-        except asyncio.TimeoutError:
-            print("Ошибка: Таймаут при запросе к API")
+async def get_forecast_max(city: str, hours: int = 24):
+    #Максимальная температура по прогнозу (шаг 3 часа) на ближайшие hours часов
+    params = {'q': city, 'appid': WEATHER_API_KEY, 'units': 'metric', 'cnt': max(1, hours // 3)}
+
+    session = get_session()
+    try:
+        async with track('http', api='forecast'), \
+                session.get(WEATHER_FORECAST_URL, params=params, timeout=weather_timeout) as response:
+            if response.status == 200:
+                data = await response.json()
+                temperatures = [item['main']['temp_max'] for item in data.get('list', [])]
+                return max(temperatures) if temperatures else None
+            else:
+                logger.warning("Ошибка API прогноза погоды: %s, %s", response.status, await response.text())
+    except aiohttp.ClientError as e:
+        logger.warning("Ошибка клиента API прогноза погоды: %s", e)
+    except asyncio.TimeoutError:
+        logger.warning("Таймаут при запросе к API прогноза погоды")
+    return None
+
+async def get_food_info(product_name: str, raise_errors: bool = False):
+    params = {'action': 'process', 'search_terms': product_name, 'json': 'true'}
+
+    session = get_session()
+    try:
+        async with track('http', api='food'), \
+                session.get(FOOD_API_URL, params=params, timeout=food_timeout) as response:
+            if response.status == 200:
+                data = await response.json()
+                products = data.get('products', [])
+                if products:
+                    first_product = products[0]
+                    return {
+                        'name': first_product.get('product_name', 'Неизвестно'),
+                        'calories': first_product.get('nutriments', {}).get('energy-kcal_100g', 0)
+                    }
+                return None
+            else:
+                logger.warning("Ошибка API продуктов: %s, %s", response.status, await response.text())
+    except aiohttp.ClientError as e:
+        logger.warning("Ошибка клиента API продуктов: %s", e)
+    except asyncio.TimeoutError:
+        logger.warning("Таймаут при запросе к API продуктов")
+    if raise_errors:
+        raise ExternalApiError(f"Не удалось получить данные о продукте {product_name!r}")
     return None
\ No newline at end of file
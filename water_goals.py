@@ -0,0 +1,63 @@
+import asyncio
+import logging
+import time
+from energy_model import EnergyModel, recompute_all
+from weather import normalize_city
+
+logger = logging.getLogger(__name__)
+
+#Ночной пересчет норм воды: при сохранении профиля норма считается по погоде в момент регистрации,
+#а здесь раз в сутки обновляется по прогнозу на ближайшие сутки.
+#Пользователи группируются по городу, прогноз запрашивается один раз на город (названия, различающиеся
+#регистром и пробелами, - один запрос) не более чем concurrency запросами одновременно.
+#Изменившиеся нормы пишутся одной транзакцией. Для городов без прогноза норма не меняется
+
+FORECAST_HOURS = 24
+
+class WaterGoalsJob:
+    def __init__(self, db, weather, energy: EnergyModel, concurrency: int = 10):
+        self.db = db
+        self.weather = weather
+        self.energy = energy
+        self.concurrency = concurrency
+        self.last_run = {}
+
+    async def fetch_temperatures(self, cities):
+        #{город как в профиле: максимальная температура по прогнозу}, число запросов к API
+        groups = {}
+        for city in cities:
+            groups.setdefault(normalize_city(city), []).append(city)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(city):
+            async with semaphore:
+                return await self.weather.get_forecast_max(city, FORECAST_HOURS)
+
+        spellings = list(groups.values())
+        results = await asyncio.gather(*(fetch(names[0]) for names in spellings))
+        temperatures = {}
+        for names, temperature in zip(spellings, results):
+            if temperature is not None:
+                temperatures.update(dict.fromkeys(names, temperature))
+        return temperatures, len(groups)
+
+    async def run(self):
+        start = time.perf_counter()
+        cities = await self.db.get_user_cities()
+        temperatures, requests = await self.fetch_temperatures(cities)
+        fetched = time.perf_counter()
+        users, changed = await recompute_all(self.db, self.energy, temperatures, calories=False)
+        self.last_run = {
+            'users': users,
+            'cities': requests, #по запросу прогноза на город
+            'failed_cities': requests - len({normalize_city(city) for city in temperatures}),
+            'changed': changed,
+            'fetch_seconds': round(fetched - start, 3),
+            'seconds': round(time.perf_counter() - start, 3),
+        }
+        logger.info("Пересчет норм воды: %d пользователей, %d городов (без прогноза: %d), изменено %d, %.1f с",
+                    users, requests, self.last_run['failed_cities'], changed, self.last_run['seconds'])
+        return self.last_run
+
+    def stats(self):
+        return self.last_run
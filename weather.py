@@ -0,0 +1,63 @@
+import asyncio
+import time
+from cache import TTLCache, MISS
+from utils import get_temperature, get_forecast_max
+
+def normalize_city(city: str):
+    return ' '.join(city.lower().replace('ё', 'е').split())
+
+class WeatherService:
+    #Температура по городам: кэш на ttl секунд и объединение одновременных запросов к одному городу.
+    #Устаревшая (но не старше stale_ttl) запись отдается сразу, а обновление идет в фоне
+    def __init__(self, ttl: float = 1800, stale_ttl: float = 6 * 3600, stale_while_revalidate: bool = True,
+                 maxsize: int = 10000):
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.cache = TTLCache(maxsize=maxsize, ttl=stale_ttl) #city -> (время получения, температура)
+        self._inflight = {} #city -> задача, которая сейчас запрашивает API
+        self.api_calls = 0
+        self.coalesced = 0
+        self.stale_served = 0
+
+    async def get_temperature(self, city: str):
+        key = normalize_city(city)
+        entry = self.cache.get(key)
+        if entry is not MISS:
+            fetched_at, temperature = entry
+            if time.monotonic() - fetched_at < self.ttl:
+                return temperature
+            if self.stale_while_revalidate:
+                self.stale_served += 1
+                self._fetch(key, city) #обновляем в фоне, не дожидаясь ответа
+                return temperature
+        return await asyncio.shield(self._fetch(key, city))
+
+    def _fetch(self, key: str, city: str):
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return task
+        task = asyncio.create_task(self._load(key, city))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    async def _load(self, key: str, city: str):
+        self.api_calls += 1
+        temperature = await get_temperature(city)
+        if temperature is not None: #ошибки не кэшируем, чтобы следующий запрос попробовал снова
+            self.cache.set(key, (time.monotonic(), temperature))
+        return temperature
+
+    async def get_forecast_max(self, city: str, hours: int = 24):
+        #Прогноз нужен раз в сутки на город (пересчет норм воды), поэтому не кэшируется
+        self.api_calls += 1
+        return await get_forecast_max(city, hours)
+
+    def stats(self):
+        return {
+            'cache': self.cache.stats(),
+            'api_calls': self.api_calls,
+            'coalesced': self.coalesced,
+            'stale_served': self.stale_served,
+        }
@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from bot import create_bot
+from metrics import setup_logging, stop_logging, dump_on_signal, start_metrics_server
+from config import (
+    WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_URL, WEBHOOK_WORKERS, FSM_STORAGE,
+    LOG_LEVEL, LOG_FILE, METRICS_HOST, METRICS_PORT, METRICS_DUMP_PATH
+)
+
+logger = logging.getLogger(__name__)
+
+#Режим вебхука: aiohttp-приложение вместо dp.start_polling.
+#Несколько процессов слушают один порт (SO_REUSEPORT), ядро распределяет соединения между ними.
+#Запуск: python webhook.py [--workers 4] [--host 0.0.0.0] [--port 8080]
+
+async def serve(index: int, workers: int, host: str, port: int, ready=None):
+    bot, dp = await create_bot(workers=workers, jobs=index == 0)
+
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    async def close_bot_session(app):
+        await bot.session.close()
+    app.on_cleanup.append(close_bot_session)
+
+    runner = web.AppRunner(app, access_log=None) #каждый запрос и так отражен в журнале обработчиков
+    await runner.setup()
+    site = web.TCPSite(runner, host, port, reuse_port=workers > 1)
+    await site.start()
+
+    if index == 0 and WEBHOOK_URL:
+        #Регистрируем вебхук один раз, из первого воркера
+        await bot.set_webhook(f"{WEBHOOK_URL}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET, drop_pending_updates=False)
+    logger.info("Воркер %s принимает обновления на %s:%s%s", index, host, port, WEBHOOK_PATH)
+    #Метрики не отдаются на публичном порту вебхука: у каждого воркера свой сервер на METRICS_HOST,
+    #порт METRICS_PORT + номер воркера (метрики у каждого процесса свои)
+    metrics_runner = None
+    if METRICS_PORT:
+        metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT + index)
+    if ready is not None:
+        ready.put(index)
+
+    root, ext = os.path.splitext(METRICS_DUMP_PATH)
+    dump_on_signal(f"{root}.{index}{ext}" if workers > 1 else METRICS_DUMP_PATH)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    await runner.cleanup()
+
+def run_worker(index: int, workers: int, host: str, port: int, ready=None):
+    setup_logging(LOG_LEVEL, LOG_FILE)
+    try:
+        asyncio.run(serve(index, workers, host, port, ready))
+    finally:
+        stop_logging()
+
+def supervise(workers: int, host: str, port: int):
+    #Простой pre-fork супервизор: запускает воркеры, перезапускает упавшие и останавливает всех по сигналу
+    ctx = multiprocessing.get_context('spawn')
+    ready = ctx.Queue()
+    stopping = False
+
+    def start(index: int):
+        process = ctx.Process(target=run_worker, args=(index, workers, host, port, ready), name=f"webhook-{index}")
+        process.start()
+        return process
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    processes = [start(index) for index in range(workers)]
+    started = 0
+    while not stopping:
+        while not ready.empty():
+            ready.get()
+            started += 1
+            if started == workers:
+                logger.info("Все воркеры запущены: %s", workers)
+        for index, process in enumerate(processes):
+            if not process.is_alive() and not stopping:
+                logger.warning("Воркер %s завершился с кодом %s, перезапускаем", index, process.exitcode)
+                processes[index] = start(index)
+        time.sleep(0.2)
+
+    for process in processes:
+        if process.is_alive():
+            process.terminate() #SIGTERM: воркер корректно завершает приложение
+    for process in processes:
+        process.join(timeout=30)
+
+def main():
+    parser = argparse.ArgumentParser(description="Бот в режиме вебхука")
+    parser.add_argument('--workers', type=int, default=WEBHOOK_WORKERS)
+    parser.add_argument('--host', default=WEBHOOK_HOST)
+    parser.add_argument('--port', type=int, default=WEBHOOK_PORT)
+    args = parser.parse_args()
+    setup_logging(LOG_LEVEL, LOG_FILE)
+
+    if args.workers > 1 and FSM_STORAGE == 'memory':
+        raise ValueError("Для нескольких воркеров нужно общее хранилище состояний: FSM_STORAGE=sqlite")
+
+    try:
+        if args.workers == 1:
+            run_worker(0, 1, args.host, args.port)
+        else:
+            supervise(args.workers, args.host, args.port)
+    finally:
+        stop_logging()
+
+if __name__ == "__main__":
+    main()